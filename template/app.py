@@ -5,15 +5,21 @@ import os
 from flask import Flask
 from flask_cors import CORS
 from .config import Config
+from .assets import StaticAssets
+from .compression import Compress
+from .json_codec import init_json
 from .blueprints.errors import errors_bp
 
 def create_app(config_class: type = Config) -> Flask:
     """Create and configure the Flask application"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    init_json(app)
 
     # Initialize extensions
     CORS(app)
+    StaticAssets(app)
+    Compress(app)
 
     # Register blueprints
     app.register_blueprint(errors_bp)
@@ -0,0 +1,39 @@
+"""Storage backend interface and the factory that picks one from config
+
+STORAGE_BACKEND selects where records live: `redis` (the default, RedisDB
+in database.py) or `sqlite` (SQLiteDB in sqlite_db.py, an embedded database
+for installs without Redis and for fast local testing). Views get the
+configured backend from get_db() and only use the methods declared here.
+"""
+
+from typing import Any, Dict, List, Optional
+from flask import current_app
+
+class StorageBackend:
+    """Record storage used by the views"""
+    name = 'storage'
+
+    def get_all_records(self) -> List[str]:
+        """Keys (table:id) of all records"""
+        raise NotImplementedError
+
+    def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_record(self, record_id: str, data: Dict[str, Any]) -> bool:
+        """Create or replace a record"""
+        raise NotImplementedError
+
+    def delete_record(self, record_id: str) -> bool:
+        raise NotImplementedError
+
+def get_db() -> StorageBackend:
+    """The storage backend selected by STORAGE_BACKEND"""
+    backend = current_app.config.get('STORAGE_BACKEND', 'redis')
+    if backend == 'sqlite':
+        from .sqlite_db import SQLiteDB
+        return SQLiteDB()
+    if backend != 'redis':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    from .database import RedisDB
+    return RedisDB()
@@ -7,8 +7,19 @@ load_dotenv()
 class Config:
     """Application configuration class"""
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key-please-change')
+    # Where records live: redis, or sqlite for installs without Redis
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'redis').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'template.sqlite3')
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
     JSON_SORT_KEYS = False
     JSON_AS_ASCII = False
+
+    # Fingerprint and precompress static/ into static/dist/ at startup
+    STATIC_ASSETS_BUILD = os.getenv('STATIC_ASSETS_BUILD', 'True').lower() == 'true'
+
+    # Response compression: skip small bodies, fall back to the fastest
+    # level when the average cost per response exceeds the budget
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_CPU_BUDGET_MS = float(os.getenv('COMPRESS_CPU_BUDGET_MS', 20))
@@ -1,11 +1,13 @@
 from typing import Optional, Dict, List, Any
-import json
 import redis
 from flask import current_app
+from .json_codec import dumps, loads
+from .backends import StorageBackend
 
 table='default'
 
-class RedisDB:
+class RedisDB(StorageBackend):
+    name = 'redis'
     _instance = None
 
     def __new__(cls):
@@ -29,13 +31,13 @@ class RedisDB:
     def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
         """Get a single record by ID"""
         data = self.client.get(f'{table}:{record_id}')
-        return json.loads(data) if data else None
+        return loads(data) if data else None
 
     def save_record(self, record_id: str, data: Dict[str, Any]) -> bool:
         """Save or update a record"""
         key = f'{table}:{record_id}'
         try:
-            return bool(self.client.set(key, json.dumps(data)))
+            return bool(self.client.set(key, dumps(data)))
         except Exception:
             return False
 
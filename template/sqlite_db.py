@@ -0,0 +1,80 @@
+"""Embedded SQLite storage backend (STORAGE_BACKEND=sqlite)
+
+Records are JSON documents keyed by ID in a database running in WAL mode,
+so readers never wait for the writer. Each thread keeps its own connection.
+"""
+
+from typing import Optional, Dict, List, Any
+import os
+import sqlite3
+import threading
+from flask import current_app
+from .backends import StorageBackend
+from .database import table
+from .json_codec import dumps, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+"""
+
+class SQLiteDB(StorageBackend):
+    name = 'sqlite'
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, path: Optional[str] = None):
+        if not hasattr(self, 'path'):
+            if path is None:
+                path = current_app.config['SQLITE_PATH']
+            self._local = threading.local()
+            if path == ':memory:':
+                # One in-memory database shared by all threads of this process
+                self.path, self.uri = f'file:records-{id(self)}?mode=memory&cache=shared', True
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self.path, self.uri = path, False
+            # Also keeps a shared in-memory database alive
+            self._schema_conn = self._conn()
+            self._schema_conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection, in autocommit mode with WAL enabled"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, uri=self.uri, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_all_records(self) -> List[str]:
+        """Get all record keys, in the same table:id form as RedisDB"""
+        rows = self._conn().execute('SELECT id FROM records ORDER BY id').fetchall()
+        return [f'{table}:{id}' for id, in rows]
+
+    def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single record by ID"""
+        row = self._conn().execute('SELECT doc FROM records WHERE id = ?', (record_id,)).fetchone()
+        return loads(row[0]) if row else None
+
+    def save_record(self, record_id: str, data: Dict[str, Any]) -> bool:
+        """Save or update a record"""
+        try:
+            self._conn().execute(
+                'INSERT INTO records (id, doc) VALUES (?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET doc = excluded.doc', (record_id, dumps(data)))
+            return True
+        except sqlite3.Error:
+            return False
+
+    def delete_record(self, record_id: str) -> bool:
+        """Delete a record"""
+        return self._conn().execute('DELETE FROM records WHERE id = ?', (record_id,)).rowcount > 0
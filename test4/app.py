@@ -3,38 +3,73 @@
 from typing import Optional, Tuple
 import os
 import sys
-from flask import Flask, render_template, jsonify
+import threading
+import time
+from flask import Flask, render_template, jsonify, request
 from flask_cors import CORS
-from redis.exceptions import ConnectionError
+from redis.exceptions import RedisError
 from .config import Config
+from .assets import StaticAssets
+from .compression import Compress
+from .json_codec import init_json
 from .database import RedisDB
+from .replicas import init_read_routing
 from .blueprints.errors import errors_bp
+from .blueprints.health import health_bp
+from .commands import register_commands
+from .ratelimit import limiter
+from .singleflight import singleflight
+from .breaker import breaker
+
+# Endpoints that must answer even while Redis is unreachable
+REDIS_OPTIONAL_ENDPOINTS = {'health.healthz', 'health.readyz', 'static'}
 
 def create_app(config_class: type = Config) -> Flask:
     """Create and configure the Flask application"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    init_json(app)
 
     # Initialize extensions
     CORS(app)
+    StaticAssets(app)
+    Compress(app)
     
-    # Check Redis connectivity
-    with app.app_context():
-        try:
-            redis_db = RedisDB()
-            redis_db.client.ping()
-        except ConnectionError as e:
-            app.logger.error(f"Failed to connect to Redis: {e}")
-            @app.route('/')
-            def maintenance():
-                return render_template('errors/maintenance.html'), 503
-            return app
-
     # Register blueprints
     app.register_blueprint(errors_bp)
+    app.register_blueprint(health_bp)
     from .blueprints.work_id import work_id_bp
     app.register_blueprint(work_id_bp)
 
+    # Don't block startup on Redis: serve the maintenance page until the
+    # background watcher has seen Redis answer once, then activate the
+    # blueprints. redis_ready follows every later outage, but those are left
+    # to the circuit breaker, which serves last good responses where it has them
+    app.extensions['redis_ready'] = threading.Event()
+    app.extensions['redis_started'] = threading.Event()
+
+    @app.before_request
+    def require_redis():
+        if app.extensions['redis_started'].is_set() or request.endpoint in REDIS_OPTIONAL_ENDPOINTS:
+            return None
+        retry_after = {'Retry-After': str(int(app.config['REDIS_RETRY_MAX']))}
+        if request.path.startswith('/api/'):
+            return jsonify({'error': 'Service unavailable, database not reachable'}), 503, retry_after
+        return render_template('errors/maintenance.html'), 503, retry_after
+
+    breaker.init_app(app)
+    if app.config['STORAGE_BACKEND'] == 'redis':
+        limiter.init_app(app, redis_client)
+        singleflight.init_app(app, redis_client)
+        start_redis_watcher(app)
+    else:
+        # An embedded database is always there, and rate limits need Redis
+        singleflight.init_app(app)
+        app.extensions['redis_ready'].set()
+        app.extensions['redis_started'].set()
+    init_read_routing(app)
+    register_commands(app)
+
     @app.errorhandler(Exception)
     def handle_error(error):
         app.logger.error(f"Unhandled error: {error}", exc_info=True)
@@ -44,6 +79,50 @@ def create_app(config_class: type = Config) -> Flask:
 
     return app
 
+def redis_client():
+    """The Redis client for rate limits and coalescing; raises
+    CircuitOpenError instead of waiting on a Redis the breaker gave up on"""
+    breaker.check()
+    return RedisDB().client
+
+def start_redis_watcher(app: Flask) -> threading.Thread:
+    """Track Redis reachability in a daemon thread and flip the ready flags"""
+    ready = app.extensions['redis_ready']
+    started = app.extensions['redis_started']
+
+    def watch():
+        delay = app.config['REDIS_RETRY_MIN']
+        with app.app_context():
+            db = RedisDB()
+            while True:
+                try:
+                    db.ping()
+                except RedisError as e:
+                    if ready.is_set():
+                        app.logger.error(f"Lost connection to Redis: {e}")
+                    else:
+                        app.logger.warning(f"Redis not reachable yet, retrying in {delay:.1f}s: {e}")
+                    ready.clear()
+                    time.sleep(delay)
+                    delay = min(delay * 2, app.config['REDIS_RETRY_MAX'])
+                    continue
+                if not ready.is_set():
+                    app.logger.info("Connected to Redis, enabling application routes")
+                    ready.set()
+                    started.set()
+                    try:
+                        count = db.ensure_id_index()
+                        if count is not None:
+                            app.logger.info(f"Built the ID completion indexes for {count} records")
+                    except RedisError as e:
+                        app.logger.error(f"Error building the ID completion indexes: {e}")
+                delay = app.config['REDIS_RETRY_MIN']
+                time.sleep(app.config['REDIS_CHECK_INTERVAL'])
+
+    thread = threading.Thread(target=watch, name='redis-watcher', daemon=True)
+    thread.start()
+    return thread
+
 def get_ssl_context() -> Optional[Tuple[str, str]]:
     """Get SSL context if certificates are configured"""
     ssl_cert = os.getenv('SSL_CERT')
@@ -0,0 +1,120 @@
+"""Storage backend interface and the factory that picks one from config
+
+STORAGE_BACKEND selects where records and identities live: `redis` (the
+default, RedisDB in database.py) or `sqlite` (SQLiteDB in sqlite_db.py, an
+embedded database for installs without Redis and for fast local testing).
+Views and commands get the configured backend from get_db() and only use the
+methods declared here; Redis-only features (rate limits, the change feed,
+replicas, storage reports and migrations) keep using RedisDB directly.
+tests/test_backends.py runs the same calls against both backends.
+"""
+
+from typing import Any, Dict, List, Optional
+import sqlite3
+from flask import current_app
+from redis.exceptions import RedisError
+from .json_codec import dumps
+
+# What a backend may raise when its store is unreachable or broken
+STORAGE_ERRORS = (RedisError, sqlite3.Error)
+
+class StorageBackend:
+    """Record and identity storage used by the views"""
+    name = 'storage'
+
+    def ping(self) -> float:
+        """Check the store answers and return the round-trip latency in milliseconds"""
+        raise NotImplementedError
+
+    def generate_work_id(self) -> str:
+        """A random WORK_ID_PATTERN ID that is not taken yet"""
+        raise NotImplementedError
+
+    def get_all_records(self, creator_id: Optional[str] = None, page: int = 1, per_page: int = 7,
+                        show_all: bool = False, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """{'records', 'total', 'pages'}: one page of visible records, newest change first"""
+        raise NotImplementedError
+
+    def search_records(self, query: str, creator_id: Optional[str] = None, show_all: bool = False,
+                       fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Newest visible records containing every term of the query"""
+        raise NotImplementedError
+
+    def list_record_fragments(self, creator_id: Optional[str] = None, page: int = 1, per_page: int = 7,
+                              show_all: bool = False) -> Dict[str, Any]:
+        """get_all_records with each record already rendered as JSON text"""
+        result = self.get_all_records(creator_id, page, per_page, show_all)
+        return {**result, 'records': [dumps(record) for record in result['records']]}
+
+    def search_record_fragments(self, query: str, creator_id: Optional[str] = None,
+                                show_all: bool = False) -> List[str]:
+        """search_records with each record already rendered as JSON text"""
+        return [dumps(record) for record in self.search_records(query, creator_id, show_all)]
+
+    def get_record(self, record_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_record(self, record_id: str, data: Dict[str, Any]) -> bool:
+        """Create a record, or update it if it already exists"""
+        raise NotImplementedError
+
+    def update_record(self, record_id: str, data: Dict[str, Any], owner: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Optional[int]:
+        """Update if owned by owner and still at expected_version; returns the
+        new version, None if there is no record. Raises PermissionError or
+        VersionConflict"""
+        raise NotImplementedError
+
+    def delete_record(self, record_id: str) -> bool:
+        raise NotImplementedError
+
+    def complete_ids(self, prefix: str, creator_id: Optional[str] = None, limit: int = 10) -> List[str]:
+        """IDs starting with prefix that are public or owned by creator_id"""
+        raise NotImplementedError
+
+    def rebuild_id_index(self) -> int:
+        """Rebuild the ID lookup indexes from the stored records"""
+        raise NotImplementedError
+
+    def get_public_record_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    def get_public_record(self, partial_id: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def lookup_public_records(self, ids: List[str],
+                              fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Resolve many full or partial IDs at once, in request order"""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Record counts in total and per creator, month and meta value"""
+        raise NotImplementedError
+
+    def rebuild_stats(self) -> int:
+        """Recompute the stats counters from the stored records"""
+        raise NotImplementedError
+
+    def get_identity(self, email: str) -> Optional[Dict[str, Any]]:
+        """{'email', 'verified'} for a verified address or a pending signup"""
+        raise NotImplementedError
+
+    def set_identity(self, email: str, verified: bool, ttl: Optional[int] = None) -> bool:
+        """Record a verified address, or a pending signup that expires after ttl seconds"""
+        raise NotImplementedError
+
+    def compact_identities(self, ttl: int, batch: int = 500) -> Dict[str, Any]:
+        """Bring identities stored by older versions into the current layout"""
+        raise NotImplementedError
+
+def get_db() -> StorageBackend:
+    """The storage backend selected by STORAGE_BACKEND"""
+    backend = current_app.config.get('STORAGE_BACKEND', 'redis')
+    if backend == 'sqlite':
+        from .sqlite_db import SQLiteDB
+        return SQLiteDB()
+    if backend != 'redis':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    from .database import RedisDB
+    return RedisDB()
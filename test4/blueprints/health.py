@@ -0,0 +1,25 @@
+from flask import Blueprint, jsonify
+from test4.backends import STORAGE_ERRORS, get_db
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/healthz')
+def healthz():
+    """Liveness probe: the worker is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@health_bp.route('/readyz')
+def readyz():
+    """Readiness probe: the storage backend answers, including its round-trip latency"""
+    db = get_db()
+    try:
+        latency_ms = db.ping()
+    except STORAGE_ERRORS as e:
+        return jsonify({
+            'status': 'unavailable',
+            db.name: {'connected': False, 'error': str(e)}
+        }), 503
+    return jsonify({
+        'status': 'ready',
+        db.name: {'connected': True, 'latency_ms': round(latency_ms, 2)}
+    })
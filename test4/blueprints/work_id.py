@@ -1,6 +1,12 @@
-from flask import Blueprint, render_template, jsonify, request, current_app, redirect, url_for
-from test4.database import RedisDB
-from test4.utils import local_only
+from flask import Blueprint, render_template, jsonify, request, current_app, redirect, url_for, Response, stream_with_context
+from redis.exceptions import RedisError
+from test4.backends import get_db
+from test4.database import RedisDB, RECORD_FIELDS, VersionConflict
+from test4.utils import local_only, parse_fields, if_match_version
+from test4.breaker import breaker
+from test4.compression import streamed_json_array, streamed_json_fragments
+from test4.changes import sse_events
+from test4.ratelimit import limiter, by_creator, by_ip
 from test4.email_verification import (
     validate_email_address, generate_token, verify_token,
     send_verification_email, store_identity, get_identity,
@@ -9,27 +15,51 @@ from test4.email_verification import (
 
 work_id_bp = Blueprint('work_id', __name__)
 
+def requested_fields():
+    """The fields= projection of the current request, e.g. fields=title,created_at"""
+    return parse_fields(request.args.get('fields'), RECORD_FIELDS)
+
 @work_id_bp.route('/api/records', methods=['GET'])
 def get_records():
-    db = RedisDB()
+    db = get_db()
     page = request.args.get('page', 1, type=int)
     show_all = request.args.get('show_all', 'false').lower() == 'true'
     user_id = request.args.get('user_id')
-    records = db.get_all_records(creator_id=user_id, page=page, show_all=show_all)
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if fields is None:
+        # Whole records are sent as stored renderings, without re-encoding
+        result = breaker.serve(lambda: db.list_record_fragments(creator_id=user_id, page=page,
+                                                                show_all=show_all))
+        return streamed_json_fragments(
+            result['records'], head='{"records":[',
+            tail=f'],"total":{result["total"]},"pages":{result["pages"]}}}')
+    records = breaker.serve(lambda: db.get_all_records(creator_id=user_id, page=page,
+                                                       show_all=show_all, fields=fields))
     
     return jsonify(records)
 
 @work_id_bp.route('/api/records/<record_id>', methods=['GET'])
 def get_record(record_id):
-    db = RedisDB()
-    record = db.get_record(record_id)
+    db = get_db()
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    record = breaker.serve(lambda: db.get_record(record_id, fields=fields))
     if record:
-        return jsonify(record)
+        response = jsonify(record)
+        if fields is None:
+            # Send back as If-Match to update only the version you have seen
+            response.set_etag(str(record.get('version', 0)))
+        return response
     return jsonify({'error': 'Record not found'}), 404
 
 @work_id_bp.route('/api/records', methods=['POST'])
 def create_record():
-    db = RedisDB()
+    db = get_db()
     data = request.get_json()
     record_id = data.get('id')
     if not record_id:
@@ -42,37 +72,70 @@ def create_record():
 
 @work_id_bp.route('/api/records/<record_id>', methods=['PUT'])
 def update_record(record_id):
-    db = RedisDB()
+    db = get_db()
     data = request.get_json()
+    try:
+        expected_version = if_match_version()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Get existing record
-    existing_record = db.get_record(record_id)
-    if not existing_record:
-        return jsonify({'error': 'Record not found'}), 404
-        
-    # Check if user owns the record
-    if existing_record.get('creator_id') != data.get('creator_id'):
+    # Ownership and version are checked by the database in the same atomic write
+    if not data.get('creator_id'):
         return jsonify({'error': 'You can only modify your own records'}), 403
-    
     try:
-        db.save_record(record_id, data)
-        return jsonify({'message': 'Record updated successfully'})
+        version = db.update_record(record_id, data, owner=data['creator_id'],
+                                   expected_version=expected_version)
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    except VersionConflict as e:
+        response = jsonify({'error': 'Record was changed by someone else, reload it and try again'})
+        response.set_etag(str(e.version))
+        return response, 412
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    if version is None:
+        return jsonify({'error': 'Record not found'}), 404
+    
+    response = jsonify({'message': 'Record updated successfully', 'version': version})
+    response.set_etag(str(version))
+    return response
 
 @work_id_bp.route('/api/search')
+@limiter.limit('search', '30/10', key=by_creator)
 def search_records():
-    db = RedisDB()
+    db = get_db()
     # Decode the query parameter since it may be URL encoded
     query = request.args.get('q', '', type=str)
     query = query.strip()
     show_all = request.args.get('show_all', 'false').lower() == 'true'
     user_id = request.args.get('user_id')
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    records = db.search_records(query, creator_id=user_id, show_all=show_all)
+    if fields is None:
+        return streamed_json_fragments(breaker.serve(
+            lambda: db.search_record_fragments(query, creator_id=user_id, show_all=show_all)))
+    records = breaker.serve(lambda: db.search_records(query, creator_id=user_id, show_all=show_all,
+                                                      fields=fields))
     
     return jsonify(records)
 
+@work_id_bp.route('/api/changes')
+def stream_changes():
+    """Server-Sent Events feed of record changes, resumable via Last-Event-ID"""
+    if current_app.config['STORAGE_BACKEND'] != 'redis':
+        # No feed without Redis streams; 204 tells EventSource not to reconnect
+        return '', 204
+    db = RedisDB()
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    user_id = request.args.get('user_id')
+    events = sse_events(db.client, last_id, user_id,
+                        max_duration=current_app.config['CHANGES_MAX_DURATION'])
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @work_id_bp.route('/')
 def index():
     creator_token = request.cookies.get('creatorToken')
@@ -92,6 +155,7 @@ def verify_email():
     return render_template('verify_email.html', app_name=current_app.config['APP_NAME'])
 
 @work_id_bp.route('/api/verify-email', methods=['POST'])
+@limiter.limit('verify_email', '5/300', key=by_ip)
 def initiate_verification():
     data = request.get_json()
     email = data.get('email')
@@ -144,9 +208,10 @@ def get_meta_fields():
     return jsonify(current_app.config.get('META_FIELDS', {}))
 
 @work_id_bp.route('/api/new-id')
+@limiter.limit('new_id', '60/60', key=by_creator)
 def get_new_id():
     try:
-        db = RedisDB()
+        db = get_db()
         new_id = db.generate_work_id()
         if not new_id:
             raise ValueError("Failed to generate a valid ID")
@@ -160,9 +225,9 @@ def get_new_id():
 def get_public_ids():
     """Get list of all public record IDs"""
     try:
-        db = RedisDB()
+        db = get_db()
         public_ids = db.get_public_record_ids()
-        return jsonify(public_ids)
+        return streamed_json_array(public_ids)
     except Exception as e:
         current_app.logger.error(f"Error getting public IDs: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
@@ -171,11 +236,66 @@ def get_public_ids():
 def get_public_record(record_id):
     """Get a public record by ID or partial ID"""
     try:
-        db = RedisDB()
-        record = db.get_public_record(record_id)
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        db = get_db()
+        record = breaker.serve(lambda: db.get_public_record(record_id, fields=fields))
         if record:
             return jsonify(record)
         return jsonify({'error': 'Record not found or not public'}), 404
+    except RedisError:
+        raise
     except Exception as e:
         current_app.logger.error(f"Error getting public record: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+
+@work_id_bp.route('/api/ids/complete')
+def complete_ids():
+    """IDs starting with ?prefix= (with or without separators) that are public
+    or belong to ?user_id="""
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit must be between 1 and 100'}), 400
+    db = get_db()
+    return jsonify(db.complete_ids(prefix, creator_id=request.args.get('user_id'), limit=limit))
+
+@work_id_bp.route('/api/public/lookup', methods=['POST'])
+@limiter.limit('lookup', '30/10', key=by_ip)
+def lookup_public_records():
+    """Resolve many full or partial IDs in one request: {"ids": [...]}"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(id, str) for id in ids):
+        return jsonify({'error': 'Expected a JSON body with a list of ID strings in "ids"'}), 400
+    max_ids = current_app.config['PUBLIC_LOOKUP_MAX']
+    if len(ids) > max_ids:
+        return jsonify({'error': f'At most {max_ids} IDs per lookup'}), 413
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        db = get_db()
+        return jsonify({'results': db.lookup_public_records(ids, fields=fields)})
+    except Exception as e:
+        current_app.logger.error(f"Error looking up public records: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@work_id_bp.route('/api/stats')
+def get_stats():
+    """Record counts in total, active, public and per creator, month and
+    meta value, read from counters kept up to date by every write"""
+    try:
+        return jsonify(get_db().get_stats())
+    except Exception as e:
+        current_app.logger.error(f"Error getting stats: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@work_id_bp.route('/api/rate-limits')
+@local_only
+def get_rate_limit_rejections():
+    """Per-route counts of requests rejected by the rate limiter"""
+    return jsonify(limiter.rejections())
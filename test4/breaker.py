@@ -0,0 +1,139 @@
+"""Circuit breaker around Redis, with last-known-good responses
+
+While Redis stalls (an AOF rewrite, a failover) every command waits out the
+socket timeout. After BREAKER_FAILURES consecutive errors or calls slower
+than BREAKER_SLOW_MS the breaker opens and Redis calls fail at once with
+CircuitOpenError. Full scans of all records are slow on a healthy Redis
+too, so only their timeouts and connection errors count. After
+BREAKER_OPEN_SECONDS it lets a single probe through (half-open): if the
+probe succeeds normal traffic resumes, if it fails the breaker opens
+again. Each worker keeps its own breaker.
+
+Read views run through serve(), which remembers their last good result per
+request URL. When Redis fails or the breaker is open that result is served
+instead, marked with a Warning: 110 header and its Age, rather than an
+empty list that looks like lost data.
+"""
+
+from typing import Any, Callable, Optional
+import threading
+import time
+from collections import OrderedDict
+from flask import Flask, Response, current_app, g, jsonify, request
+from redis.exceptions import ConnectionError, RedisError, TimeoutError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+class CircuitOpenError(RedisError):
+    """Raised instead of calling Redis while the breaker is open"""
+
+class CircuitBreaker:
+    """Fail fast on a degraded Redis and remember responses to fall back on"""
+
+    def __init__(self):
+        self.failures = 5
+        self.slow_seconds = 1.0
+        self.open_seconds = 10.0
+        self.stale_entries = 1000
+        self.state = CLOSED
+        self._errors = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stale: OrderedDict = OrderedDict()
+
+    def init_app(self, app: Flask) -> None:
+        self.failures = int(app.config.get('BREAKER_FAILURES', self.failures))
+        self.slow_seconds = app.config.get('BREAKER_SLOW_MS', self.slow_seconds * 1000) / 1000
+        self.open_seconds = float(app.config.get('BREAKER_OPEN_SECONDS', self.open_seconds))
+        self.stale_entries = int(app.config.get('BREAKER_STALE_ENTRIES', self.stale_entries))
+        app.extensions['breaker'] = self
+
+        @app.errorhandler(RedisError)
+        def redis_unavailable(error):
+            current_app.logger.error(f"Redis error: {error}")
+            retry_after = {'Retry-After': str(int(self.open_seconds))}
+            return jsonify({'error': 'Service unavailable, database not reachable'}), 503, retry_after
+
+        @app.after_request
+        def mark_stale(response: Response) -> Response:
+            stored_at = g.get('stale_since')
+            if stored_at is not None:
+                response.headers['Warning'] = '110 - "Response is Stale"'
+                response.headers['Age'] = str(int(time.time() - stored_at))
+            return response
+
+    def check(self) -> None:
+        """Raise CircuitOpenError while the breaker is open and not due for a probe"""
+        if self.state == OPEN and time.monotonic() < self._opened_at + self.open_seconds:
+            raise CircuitOpenError("Redis circuit breaker is open")
+
+    def call(self, fn: Callable[[], Any], full_scan: bool = False) -> Any:
+        """fn() if the breaker allows it, counting its errors and latency;
+        for a full_scan only timeouts and connection errors"""
+        with self._lock:
+            if self.state != CLOSED:
+                if self._probing or time.monotonic() < self._opened_at + self.open_seconds:
+                    raise CircuitOpenError("Redis circuit breaker is open")
+                # This call is the probe, everyone else keeps failing fast
+                self.state = HALF_OPEN
+                self._probing = True
+        start = time.monotonic()
+        try:
+            result = fn()
+        except (ConnectionError, TimeoutError):
+            self._record(False)
+            raise
+        except RedisError:
+            # Redis answered, so a scan's error is not a sign of a degraded Redis
+            self._record(full_scan)
+            raise
+        except BaseException:
+            # Not a Redis problem, but a probe must not stay in flight
+            self._record(True)
+            raise
+        self._record(full_scan or time.monotonic() - start <= self.slow_seconds)
+        return result
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                if self.state != CLOSED:
+                    current_app.logger.info("Redis circuit breaker closed")
+                self.state = CLOSED
+                self._errors = 0
+                return
+            self._errors += 1
+            if self.state == HALF_OPEN or self._errors >= self.failures:
+                if self.state != OPEN:
+                    current_app.logger.warning(
+                        f"Redis circuit breaker open for {self.open_seconds:.0f}s "
+                        f"after {self._errors} failed or slow calls")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def serve(self, fn: Callable[[], Any], key: Optional[str] = None) -> Any:
+        """fn() remembered as the last good result for key (the request URL
+        by default), or that result if Redis fails; re-raises without one"""
+        key = key or request.full_path
+        try:
+            result = fn()
+        except RedisError as e:
+            with self._lock:
+                entry = self._stale.get(key)
+            if entry is None:
+                raise
+            current_app.logger.warning(f"Serving stale response for {key}: {e}")
+            g.stale_since = entry[1]
+            return entry[0]
+        with self._lock:
+            self._stale[key] = (result, time.time())
+            self._stale.move_to_end(key)
+            while len(self._stale) > self.stale_entries:
+                self._stale.popitem(last=False)
+        return result
+
+breaker = CircuitBreaker()
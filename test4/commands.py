@@ -0,0 +1,162 @@
+import click
+import redis
+from flask import Flask, current_app
+from .backends import get_db
+from .database import RedisDB, normalize_id
+from .migrate import CHECKPOINT_KEY, Migrator
+from .publisher import CatalogPublisher
+from .sqlite_db import SQLiteDB
+from .storage import memory_report
+
+def register_commands(app: Flask) -> None:
+    """Attach the maintenance CLI commands (flask --app test4.app <command>)"""
+
+    @app.cli.command('storage-report')
+    @click.option('--samples', default=200, help='Number of existing records to measure')
+    def storage_report(samples):
+        """Compare MEMORY USAGE per record across compression settings"""
+        db = RedisDB()
+        records = []
+        keys = db.scan_keys()[:samples]
+        records = [data for data in db._load_many(keys) if data]
+        if not records:
+            print("No records found to sample")
+            return
+        print(f"{'compression':<12} {'bytes/record':>13}")
+        for row in memory_report(db, records, current_app.config['STORAGE_COMPRESS_MIN']):
+            print(f"{row['compression']:<12} {row['bytes_per_record']:>13.1f}")
+
+    @app.cli.command('rebuild-id-index')
+    def rebuild_id_index():
+        """Rebuild the ID completion indexes from the stored records"""
+        count = get_db().rebuild_id_index()
+        print(f"Indexed {count} records")
+
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats():
+        """Recompute the /api/stats counters from all stored records"""
+        count = get_db().rebuild_stats()
+        print(f"Counted {count} records")
+
+    @app.cli.command('compact-identities')
+    @click.option('--batch', default=500, help='Keys per SCAN step and pipeline')
+    def compact_identities(batch):
+        """Move verified identities into the shared hash and expire stale signups"""
+        result = get_db().compact_identities(current_app.config['VERIFY_TOKEN_MAX_AGE'], batch=batch)
+        before, after = result.pop('before'), result.pop('after')
+        print(', '.join(f"{count} {name}" for name, count in result.items()))
+        print(f"{'metric':<16} {'before':>14} {'after':>14}")
+        for name in before:
+            print(f"{name:<16} {before[name]:>14} {after[name]:>14}")
+
+    @app.cli.command('publish-catalog')
+    @click.option('--folder', default=None, help='Output folder (default: PUBLISH_DIR)')
+    @click.option('--full', is_flag=True, help='Rebuild every file instead of resuming from the last run')
+    @click.option('--follow', is_flag=True, help='Keep applying record changes as they happen')
+    def publish_catalog(folder, full, follow):
+        """Write the public catalog as static, precompressed JSON files"""
+        publisher = CatalogPublisher(get_db(), folder or current_app.config['PUBLISH_DIR'],
+                                     current_app.config['PUBLISH_SHARD_CHARS'],
+                                     current_app.config['WORK_ID_PATTERN'])
+        if follow and not publisher.follows_changes:
+            raise click.UsageError("--follow needs STORAGE_BACKEND=redis and its change stream")
+        # Without a change stream there is no position, every run is a full build
+        if full or publisher.position is None:
+            result = publisher.build()
+            print(f"Published {result['records']} records in {result['shards']} shards, "
+                  f"removed {result['removed']} files")
+        if not publisher.follows_changes:
+            return
+        # Catch up on changes since the last run, then wait for new ones
+        while publisher.sync():
+            pass
+        print(f"Catalog in {publisher.folder} is current as of {publisher.position}")
+        while follow:
+            if publisher.sync(block_ms=1000):
+                print(f"Applied changes up to {publisher.position}")
+
+    @app.cli.command('migrate-workid')
+    @click.option('--source-host', default=None, help='work-id Redis host (default: REDIS_HOST)')
+    @click.option('--source-port', default=None, type=int, help='work-id Redis port (default: REDIS_PORT)')
+    @click.option('--source-db', default=None, type=int, help='work-id Redis database (default: REDIS_DB)')
+    @click.option('--batch', default=500, help='Keys per SCAN step and write pipeline')
+    @click.option('--pause-ms', default=0, help='Sleep between batches to limit load on live traffic')
+    @click.option('--limit', default=0, help='Stop after about this many keys (0: all)')
+    @click.option('--dry-run', is_flag=True, help='Read and transform only, write nothing')
+    @click.option('--verify', is_flag=True, help='Compare source and target instead of copying')
+    @click.option('--overwrite', is_flag=True, help='Replace records that already exist in test4')
+    @click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start over')
+    def migrate_workid(source_host, source_port, source_db, batch, pause_ms, limit,
+                       dry_run, verify, overwrite, restart):
+        """Copy work-id records (work:<id>) into test4 records, resumably"""
+        config = current_app.config
+        source = redis.Redis(
+            host=source_host or config['REDIS_HOST'],
+            port=source_port or config['REDIS_PORT'],
+            db=config.get('REDIS_DB', 0) if source_db is None else source_db,
+            socket_timeout=config['REDIS_CONNECT_TIMEOUT'] * 5
+        )
+        migrator = Migrator(source, RedisDB(), batch=batch, pause_ms=pause_ms,
+                            compression=config['STORAGE_COMPRESSION'],
+                            compress_min=config['STORAGE_COMPRESS_MIN'])
+        if verify:
+            stats = migrator.verify(limit=limit)
+            print(f"Verified {stats['checked']} records: {stats['missing']} missing, "
+                  f"{stats['different']} different")
+            return
+        stats = migrator.run(dry_run=dry_run, overwrite=overwrite, restart=restart, limit=limit)
+        mode = 'Dry run' if dry_run else 'Migration'
+        print(f"{mode}: {stats['written']} written, {stats['skipped']} already present, "
+              f"{stats['failed']} failed of {stats['scanned']} scanned"
+              + ('' if dry_run else f" (checkpoint in {CHECKPOINT_KEY})"))
+
+    @app.cli.command('storage-parity')
+    @click.option('--sqlite-path', default=':memory:', help='SQLite database to copy the records into')
+    @click.option('--query', 'queries', multiple=True, help='Search query to compare (repeatable)')
+    @click.option('--show', default=10, help='Differences to print per check')
+    def storage_parity(sqlite_path, queries, show):
+        """Copy the Redis records into SQLite and compare both backends' answers"""
+        redis_db = RedisDB()
+        sqlite_db = SQLiteDB(sqlite_path)
+        keys = redis_db.scan_keys()
+        records = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            for key, data in zip(batch, redis_db._load_many(batch)):
+                if data:
+                    records[redis_db.id_from_key(key)] = data
+        for record_id, data in records.items():
+            sqlite_db.put_record(record_id, data)
+        print(f"Copied {len(records)} records into {sqlite_path}")
+
+        def ordered(results):
+            # Ties in the sort keys may come back in any order, compare them as sets
+            return sorted((r.get('changed_at', r.get('created_at', 0)), r.get('created_at', 0), r['id'])
+                          for r in results)
+
+        creators = sorted({data['creator_id'] for data in records.values() if data.get('creator_id')})
+        if not queries:
+            words = sorted({word for data in records.values()
+                            for word in str(data.get('title', '')).lower().split()})
+            queries = [''] + words[:: max(len(words) // 20, 1)]
+        checks = {
+            'records': lambda db: [db.get_record(id) for id in sorted(records)],
+            'public ids': lambda db: db.get_public_record_ids(),
+            'public lookup': lambda db: db.lookup_public_records(sorted(records)),
+            'completion': lambda db: [db.complete_ids(normalize_id(id)[:2]) for id in sorted(records)[:50]],
+        }
+        for creator in [None] + creators[:20]:
+            for show_all in (False, True):
+                checks[f'listing creator={creator} show_all={show_all}'] = (
+                    lambda db, c=creator, a=show_all: ordered(
+                        db.get_all_records(creator_id=c, show_all=a, per_page=len(records) + 1)['records']))
+        for query in queries:
+            checks[f'search {query!r}'] = lambda db, q=query: ordered(db.search_records(q, show_all=True))
+
+        failed = 0
+        for name, check in checks.items():
+            if check(redis_db) != check(sqlite_db):
+                failed += 1
+                if failed <= show:
+                    print(f"Different: {name}")
+        print(f"{len(checks) - failed} of {len(checks)} checks match")
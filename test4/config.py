@@ -26,12 +26,72 @@ class Config:
     """Application configuration class"""
     APP_NAME = os.getenv('APP_NAME', 'Work-ID')
     FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'dev-key-please-change')
+    # Where records and identities live: redis, or sqlite for installs without Redis
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'redis').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'test4.sqlite3')
+    SQLITE_TIMEOUT = float(os.getenv('SQLITE_TIMEOUT', 5.0))
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
+    REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 2.0))
+    # Connect to a Redis Cluster via REDIS_HOST/REDIS_PORT as seed node
+    REDIS_CLUSTER = os.getenv('REDIS_CLUSTER', 'false').lower() == 'true'
+    # Read replicas as 'host:port,host:port'; writers stay on the primary
+    # for REDIS_STICKY_SECONDS so they read their own writes
+    REDIS_REPLICAS = os.getenv('REDIS_REPLICAS', '')
+    REDIS_STICKY_SECONDS = float(os.getenv('REDIS_STICKY_SECONDS', 5))
+    # Optionally WAIT for this many replicas to acknowledge each write
+    REDIS_WAIT_REPLICAS = int(os.getenv('REDIS_WAIT_REPLICAS', 0))
+    REDIS_WAIT_TIMEOUT_MS = int(os.getenv('REDIS_WAIT_TIMEOUT_MS', 100))
+    # Background readiness check: retry backoff while Redis is down,
+    # then a slower heartbeat once it is reachable
+    REDIS_RETRY_MIN = float(os.getenv('REDIS_RETRY_MIN', 0.5))
+    REDIS_RETRY_MAX = float(os.getenv('REDIS_RETRY_MAX', 15))
+    REDIS_CHECK_INTERVAL = float(os.getenv('REDIS_CHECK_INTERVAL', 5))
+    # Compress text fields of at least STORAGE_COMPRESS_MIN bytes in stored
+    # records: none, zlib or zstd. work-id uses the same 1024 byte default
+    STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'none')
+    STORAGE_COMPRESS_MIN = int(os.getenv('STORAGE_COMPRESS_MIN', 1024))
+    # Change feed: approximate stream length and SSE connection lifetime.
+    # Each open feed holds a worker thread; clients reconnect and resume
+    CHANGES_STREAM_MAXLEN = int(os.getenv('CHANGES_STREAM_MAXLEN', 10000))
+    CHANGES_MAX_DURATION = float(os.getenv('CHANGES_MAX_DURATION', 30))
+
+    # Static copy of the public catalog written by the publish-catalog command
+    PUBLISH_DIR = os.getenv('PUBLISH_DIR', 'public-catalog')
+    PUBLISH_SHARD_CHARS = int(os.getenv('PUBLISH_SHARD_CHARS', 1))
+
+    # Let concurrent identical reads share one query, also across workers
+    SINGLEFLIGHT = os.getenv('SINGLEFLIGHT', 'True').lower() == 'true'
+    SINGLEFLIGHT_WAIT_MS = int(os.getenv('SINGLEFLIGHT_WAIT_MS', 2000))
+    SINGLEFLIGHT_LOCK_MS = int(os.getenv('SINGLEFLIGHT_LOCK_MS', 5000))
+
+    # Circuit breaker: open after this many consecutive failed or slow Redis
+    # calls, probe again after BREAKER_OPEN_SECONDS; meanwhile reads serve
+    # the last good response (up to BREAKER_STALE_ENTRIES URLs per worker)
+    BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+    BREAKER_SLOW_MS = int(os.getenv('BREAKER_SLOW_MS', 1000))
+    BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 10))
+    BREAKER_STALE_ENTRIES = int(os.getenv('BREAKER_STALE_ENTRIES', 1000))
+
+    # Rate limits for expensive endpoints as 'requests/seconds', empty disables
+    RATE_LIMIT_NEW_ID = os.getenv('RATE_LIMIT_NEW_ID', '60/60')
+    RATE_LIMIT_VERIFY_EMAIL = os.getenv('RATE_LIMIT_VERIFY_EMAIL', '5/300')
+    RATE_LIMIT_SEARCH = os.getenv('RATE_LIMIT_SEARCH', '30/10')
+    RATE_LIMIT_LOOKUP = os.getenv('RATE_LIMIT_LOOKUP', '30/10')
+    # Most IDs a single POST /api/public/lookup may resolve
+    PUBLIC_LOOKUP_MAX = int(os.getenv('PUBLIC_LOOKUP_MAX', 500))
     AWS_PROFILE = os.getenv('AWS_PROFILE', '')
     JSON_SORT_KEYS = False
     JSON_AS_ASCII = False
+
+    # Fingerprint and precompress static/ into static/dist/ at startup
+    STATIC_ASSETS_BUILD = os.getenv('STATIC_ASSETS_BUILD', 'True').lower() == 'true'
+
+    # Response compression: skip small bodies, fall back to the fastest
+    # level when the average cost per response exceeds the budget
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_CPU_BUDGET_MS = float(os.getenv('COMPRESS_CPU_BUDGET_MS', 20))
         
     # Work ID Pattern
     WORK_ID_PATTERN = os.getenv('WORK_ID_PATTERN', 'XXXX-XXXX')
@@ -47,5 +107,8 @@ class Config:
     # Meta fields
     META_FIELDS = parse_meta_fields()
     
+    # Lifetime of verification links, and of the pending signups waiting for them
+    VERIFY_TOKEN_MAX_AGE = int(os.getenv('VERIFY_TOKEN_MAX_AGE', 3600))
+
     # Allowed email domains (comma-separated list)
     EMAIL_DOMAINS_ALLOWED = [d.strip() for d in os.getenv('EMAIL_DOMAINS_ALLOWED', '').split(',') if d.strip()]
@@ -2,36 +2,412 @@ from typing import Optional, Dict, List, Any, Union
 import random
 import string
 import time
-import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timezone
 import redis
+from redis.cluster import RedisCluster
 from redis.commands.json.path import Path
 from flask import current_app
+from .json_codec import codec, dumps
+from .storage import pack_fields, unpack_fields
+from .changes import publish_change
+from .replicas import ReadRouter, parse_replicas
+from .backends import StorageBackend
+from .singleflight import singleflight
+from .breaker import breaker
 
 records_per_page = 7
 
-class RedisDB:
+# Sorted sets of 'NORMALIZED:ID' members (all scores 0) for prefix
+# completion with ZRANGEBYLEX: public records, and every record per owner
+ID_INDEX_PUBLIC = 'ids:public'
+ID_INDEX_OWNER = 'ids:owner:{}'
+# Set once the indexes cover records written before they existed
+ID_INDEX_BUILT = 'ids:built'
+
+# Top-level record fields a fields= projection may select
+RECORD_FIELDS = ('title', 'description', 'access_control_by', 'creator_id', 'active', 'public',
+                 'created_at', 'changed_at', 'time_start', 'time_end', 'meta', 'version')
+# What listings need to filter and sort, and search needs to match
+LIST_FIELDS = ('creator_id', 'public', 'created_at', 'changed_at')
+SEARCH_FIELDS = LIST_FIELDS + ('title', 'description', 'access_control_by', 'meta')
+
+# Each record's API representation, rendered once per version as
+# '<version>|<json>' so listings can send it without decoding the document
+FRAGMENT_KEY = 'fragment:{}'
+
+# Unverified signups are JSON documents that expire with their verification
+# token; verified addresses are fields of one hash, mapped to when they verified
+IDENTITY_KEY = 'identity:{}'
+VERIFIED_KEY = 'identities:verified'
+
+# Hash of counters behind /api/stats, see stat_fields()
+STATS_KEY = 'stats:records'
+# Record fields the counters are derived from
+STATS_FIELDS = ('creator_id', 'active', 'public', 'created_at', 'meta')
+
+# stat_fields() and the HINCRBYs of stats_delta() in Lua, so the write
+# scripts below count a record in the same atomic step as they write it.
+# count_stats() is a no-op without a stats key: in cluster mode the hash
+# lives in another slot and the caller counts after the write instead
+STATS_LUA = """
+local function truthy(v)
+    if v == nil or v == cjson.null or v == false or v == 0 or v == '' then
+        return false
+    end
+    return type(v) ~= 'table' or next(v) ~= nil
+end
+local function text(v)
+    -- As Python's str() for the values JSON can hold
+    if v == true then return 'True' elseif v == false then return 'False' end
+    if type(v) == 'number' and v == math.floor(v) and math.abs(v) < 2^53 then
+        return string.format('%d', v)
+    end
+    return tostring(v)
+end
+local function month(ts)
+    -- YYYY-MM in UTC of epoch seconds (days to civil date, proleptic Gregorian)
+    local z = math.floor(ts / 86400) + 719468
+    local era = math.floor(z / 146097)
+    local doe = z - era * 146097
+    local yoe = math.floor((doe - math.floor(doe / 1460) + math.floor(doe / 36524)
+                            - math.floor(doe / 146096)) / 365)
+    local doy = doe - (365 * yoe + math.floor(yoe / 4) - math.floor(yoe / 100))
+    local mp = math.floor((5 * doy + 2) / 153)
+    local m = mp < 10 and mp + 3 or mp - 9
+    return string.format('%04d-%02d', yoe + era * 400 + (m <= 2 and 1 or 0), m)
+end
+local function stat_names(doc)
+    if not doc then
+        return {}
+    end
+    local names = {'total'}
+    if truthy(doc.active) then table.insert(names, 'active') end
+    if doc.public ~= false then table.insert(names, 'public') end
+    if truthy(doc.creator_id) then table.insert(names, 'creator:' .. text(doc.creator_id)) end
+    if truthy(doc.created_at) then table.insert(names, 'month:' .. month(tonumber(doc.created_at))) end
+    if type(doc.meta) == 'table' then
+        for field, value in pairs(doc.meta) do
+            local seen = {}
+            for _, v in ipairs(type(value) == 'table' and value or {value}) do
+                local name = 'meta:' .. field .. ':' .. text(v)
+                if v ~= cjson.null and v ~= '' and not seen[name] then
+                    seen[name] = true
+                    table.insert(names, name)
+                end
+            end
+        end
+    end
+    return names
+end
+local function stats_doc(raw)
+    -- The counted fields of a multi-path JSON.GET reply
+    if not raw then
+        return nil
+    end
+    local matches = cjson.decode(raw)
+    local doc = {}
+    for _, field in ipairs({'creator_id', 'active', 'public', 'created_at', 'meta'}) do
+        local match = matches['$.' .. field]
+        if match then doc[field] = match[1] end
+    end
+    return doc
+end
+local function count_stats(stats_key, before, after)
+    if not stats_key then
+        return
+    end
+    local delta = {}
+    for _, name in ipairs(stat_names(before)) do delta[name] = (delta[name] or 0) - 1 end
+    for _, name in ipairs(stat_names(after)) do delta[name] = (delta[name] or 0) + 1 end
+    for name, value in pairs(delta) do
+        if value ~= 0 then redis.call('HINCRBY', stats_key, name, value) end
+    end
+end
+"""
+
+# Create a record unless it exists; KEYS[1] record key, KEYS[2] stats hash
+# (not in cluster mode); ARGV[1] the document. Returns 1 if it was created
+CREATE_LUA = STATS_LUA + """
+if not redis.call('JSON.SET', KEYS[1], '$', ARGV[1], 'NX') then
+    return 0
+end
+count_stats(KEYS[2], nil, cjson.decode(ARGV[1]))
+return 1
+"""
+
+# Compare-and-set update: check owner and version, then apply the field
+# writes and bump the version, all in one atomic round trip.
+# KEYS[1] record key, KEYS[2] stats hash (not in cluster mode);
+# ARGV[1] expected version or ''; ARGV[2] owner or '';
+# then (command, path, json value) triples. Returns {status, version}:
+# 1 updated, 0 missing, -1 not the owner, -2 version mismatch. Updates also
+# return the STATS_FIELDS before and after, for the counters in cluster mode
+UPDATE_LUA = STATS_LUA + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, 0}
+end
+local current = cjson.decode(redis.call('JSON.GET', KEYS[1], '$.version', '$.creator_id'))
+local version = tonumber(current['$.version'][1]) or 0
+if ARGV[2] ~= '' and current['$.creator_id'][1] ~= ARGV[2] then
+    return {-1, version}
+end
+if ARGV[1] ~= '' and tonumber(ARGV[1]) ~= version then
+    return {-2, version}
+end
+local stats = {'$.creator_id', '$.active', '$.public', '$.created_at', '$.meta'}
+local before = redis.call('JSON.GET', KEYS[1], unpack(stats))
+for i = 3, #ARGV, 3 do
+    redis.call(ARGV[i], KEYS[1], ARGV[i + 1], ARGV[i + 2])
+end
+redis.call('JSON.SET', KEYS[1], '$.version', version + 1)
+local after = redis.call('JSON.GET', KEYS[1], unpack(stats))
+count_stats(KEYS[2], stats_doc(before), stats_doc(after))
+return {1, version + 1, before, after}
+"""
+
+# Read the counted fields and delete the record and its rendered JSON in
+# one step; KEYS[1] record key, KEYS[2] fragment key, KEYS[3] stats hash
+# (not in cluster mode)
+DELETE_LUA = STATS_LUA + """
+local before = redis.call('JSON.GET', KEYS[1], '$.creator_id', '$.active', '$.public',
+                          '$.created_at', '$.meta')
+if before then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    count_stats(KEYS[3], stats_doc(before), nil)
+end
+return before
+"""
+
+class VersionConflict(Exception):
+    """The record changed since the version the client last read"""
+    def __init__(self, version: int):
+        super().__init__(f"Record is at version {version}")
+        self.version = version
+
+@lru_cache(maxsize=None)
+def id_pattern_positions(pattern: str) -> tuple:
+    """Positions of the X placeholders in WORK_ID_PATTERN, computed once per pattern"""
+    return tuple(i for i, char in enumerate(pattern) if char == 'X')
+
+def expand_id(partial_id: str, pattern: str) -> Optional[str]:
+    """Full work ID from a full ID or just its X characters, e.g. AB12 -> (AB-12)"""
+    # Convert partial_id to uppercase for consistency
+    partial_id = partial_id.strip().upper()
+    if '-' in partial_id:
+        return partial_id
+    positions = id_pattern_positions(pattern)
+    if len(partial_id) != len(positions):
+        return None
+    # Reconstruct full ID using pattern
+    id_chars = list(pattern)
+    for pos, char in zip(positions, partial_id):
+        id_chars[pos] = char
+    return ''.join(id_chars)
+
+def normalize_id(value: str) -> str:
+    """Uppercase letters and digits of an ID, so (AB-CD), ab-cd and ABCD compare equal"""
+    return ''.join(char for char in value.upper() if char.isalnum())
+
+def project(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Keep only the requested fields (and the ID) of a record"""
+    if fields is None:
+        return record
+    return {k: v for k, v in record.items() if k == 'id' or k in fields}
+
+def random_work_id(pattern: str) -> str:
+    """Fill the X placeholders of pattern with random characters, avoiding O and 0"""
+    valid_chars = string.ascii_uppercase.replace('O', '') + string.digits.replace('0', '')
+    return ''.join(random.choice(valid_chars) if c == 'X' else c for c in pattern)
+
+def parse_search_terms(query: str) -> List[str]:
+    """Lowercase search terms; quoted strings stay one term"""
+    terms = []
+    current_term = []
+    in_quotes = False
+    quote_char = None
+
+    # Split query into terms, preserving quoted strings
+    for char in query:
+        if char in ['"', "'"]:
+            if not in_quotes:
+                in_quotes = True
+                quote_char = char
+            elif quote_char == char:
+                in_quotes = False
+                if current_term:
+                    terms.append(''.join(current_term).lower())
+                    current_term = []
+            else:
+                current_term.append(char)
+        elif char.isspace() and not in_quotes:
+            if current_term:
+                terms.append(''.join(current_term).lower())
+                current_term = []
+        else:
+            current_term.append(char)
+
+    if current_term:
+        terms.append(''.join(current_term).lower())
+
+    # Remove empty terms
+    return [term for term in terms if term]
+
+def searchable_text(record_id: str, data: Dict[str, Any]) -> str:
+    """The lowercase text a search term has to occur in"""
+    searchable_parts = [
+        str(data.get('title', '')),
+        str(data.get('description', '')),
+        str(data.get('access_control_by', '')),
+        record_id,
+        str(data.get('creator_id', ''))
+    ]
+
+    # Add all meta field values to searchable text
+    if data.get('meta'):
+        for meta_value in data['meta'].values():
+            if isinstance(meta_value, list):
+                searchable_parts.extend(str(v) for v in meta_value)
+            else:
+                searchable_parts.append(str(meta_value))
+
+    return ' '.join(searchable_parts).lower()
+
+def normalize_times(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Store time_start and time_end as integer UTC timestamps"""
+    # They should already be UTC timestamps from frontend
+    for field in ['time_start', 'time_end']:
+        if data.get(field):
+            try:
+                data[field] = int(data[field])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid timestamp for {field}: {data[field]}")
+    return data
+
+def stat_fields(record: Optional[Dict[str, Any]]) -> List[str]:
+    """The counters a record adds 1 to: total, active, public,
+    creator:<id>, month:<YYYY-MM> of creation and meta:<field>:<value>"""
+    if not record:
+        return []
+    names = ['total']
+    if record.get('active'):
+        names.append('active')
+    if record.get('public') is not False:
+        names.append('public')
+    if record.get('creator_id'):
+        names.append(f"creator:{record['creator_id']}")
+    if record.get('created_at'):
+        created = datetime.fromtimestamp(int(record['created_at']), timezone.utc)
+        names.append(f"month:{created:%Y-%m}")
+    for field, value in (record.get('meta') or {}).items():
+        values = value if isinstance(value, list) else [value]
+        names.extend(dict.fromkeys(f'meta:{field}:{v}' for v in values if v not in (None, '')))
+    return names
+
+def stats_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Counter increments for a record going from before to after (None: absent)"""
+    delta = {}
+    for name in stat_fields(before):
+        delta[name] = delta.get(name, 0) - 1
+    for name in stat_fields(after):
+        delta[name] = delta.get(name, 0) + 1
+    return {name: value for name, value in delta.items() if value}
+
+def format_stats(counts: Dict[str, int]) -> Dict[str, Any]:
+    """The /api/stats document from flat counters"""
+    stats = {'total': 0, 'active': 0, 'public': 0, 'by_creator': {}, 'by_month': {}, 'by_meta': {}}
+    for name, count in sorted(counts.items()):
+        count = int(count)
+        if count <= 0:
+            continue
+        kind, _, rest = name.partition(':')
+        if kind == 'creator':
+            stats['by_creator'][rest] = count
+        elif kind == 'month':
+            stats['by_month'][rest] = count
+        elif kind == 'meta':
+            field, _, value = rest.partition(':')
+            stats['by_meta'].setdefault(field, {})[value] = count
+        elif kind in ('total', 'active', 'public'):
+            stats[kind] = count
+    return stats
+
+def lookup_results(ids: List[str], full_ids: List[Optional[str]],
+                   found: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-query lookup results: found, not_found (also for private records) or invalid"""
+    results = []
+    for query, id in zip(ids, full_ids):
+        if id is None:
+            results.append({'query': query, 'id': None, 'status': 'invalid'})
+        elif id in found:
+            results.append({'query': query, 'id': id, 'status': 'found', 'record': found[id]})
+        else:
+            results.append({'query': query, 'id': id, 'status': 'not_found'})
+    return results
+
+class RedisDB(StorageBackend):
+    name = 'redis'
     _instance = None
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, host=None, port=None, db=None):
+    def __init__(self, host=None, port=None, db=None, cluster=None):
         if not hasattr(self, 'client'):
             # Use parameters if provided, otherwise get from Flask config
+            timeout = 2.0
+            routing = {}
             if host is None or port is None:
                 from flask import current_app
                 host = current_app.config['REDIS_HOST']
                 port = current_app.config['REDIS_PORT']
                 db = current_app.config.get('REDIS_DB', 0)
+                timeout = current_app.config.get('REDIS_CONNECT_TIMEOUT', timeout)
+                cluster = current_app.config.get('REDIS_CLUSTER', False)
+                routing = {
+                    'replicas': parse_replicas(current_app.config.get('REDIS_REPLICAS')),
+                    'sticky_seconds': current_app.config.get('REDIS_STICKY_SECONDS', 5),
+                    'wait_replicas': current_app.config.get('REDIS_WAIT_REPLICAS', 0),
+                    'wait_timeout_ms': current_app.config.get('REDIS_WAIT_TIMEOUT_MS', 100),
+                }
+            self.cluster = bool(cluster)
             
-            self.client = redis.Redis(
-                host=host,
-                port=port,
-                db=db,
-                decode_responses=True
-            )
+            # Short timeouts so an unreachable Redis fails fast instead of
+            # blocking workers; reconnects happen lazily on the next command
+            if self.cluster:
+                # Cluster mode has a single database; host/port is any seed node
+                self.client = RedisCluster(
+                    host=host,
+                    port=port,
+                    decode_responses=True,
+                    socket_connect_timeout=timeout,
+                    socket_timeout=timeout
+                )
+            else:
+                self.client = redis.Redis(
+                    host=host,
+                    port=port,
+                    db=db,
+                    decode_responses=True,
+                    socket_connect_timeout=timeout,
+                    socket_timeout=timeout,
+                    health_check_interval=30
+                )
+
+            # Replicas serve reads; a cluster already spreads reads over its shards
+            replicas = [] if self.cluster else [
+                redis.Redis(host=r_host, port=r_port, db=db, decode_responses=True,
+                            socket_connect_timeout=timeout, socket_timeout=timeout,
+                            health_check_interval=30)
+                for r_host, r_port in routing.pop('replicas', [])
+            ]
+            self.router = ReadRouter(self.client, replicas, **routing)
+            self._create = self.client.register_script(CREATE_LUA)
+            self._update = self.client.register_script(UPDATE_LUA)
+            self._delete = self.client.register_script(DELETE_LUA)
             
             # Only log if we have an application context
             try:
@@ -40,284 +416,663 @@ class RedisDB:
             except RuntimeError:
                 print("Redis client initialized")
 
+    def json(self, client=None):
+        """RedisJSON commands using the fast codec"""
+        return (client or self.client).json(encoder=codec, decoder=codec)
+
+    def key(self, record_id: str) -> str:
+        """Redis key for a record; in cluster mode the ID is a hash tag so
+        anything else keyed on the same ID lands in the same slot"""
+        if self.cluster:
+            return f'record:{{{record_id}}}'
+        return f'record:{record_id}'
+
+    def fragment_key(self, record_id: str) -> str:
+        """Redis key of a record's rendered JSON, in the record's slot in cluster mode"""
+        return FRAGMENT_KEY.format(f'{{{record_id}}}' if self.cluster else record_id)
+
+    @staticmethod
+    def id_from_key(key: str) -> str:
+        """Record ID from either key layout"""
+        return key.split(':', 1)[1].strip('{}')
+
+    def scan_keys(self, pattern: str = 'record:*', count: int = 500, client=None) -> List[str]:
+        """Incrementally SCAN for keys; in cluster mode every primary is
+        scanned in parallel, since each node only knows its own slots"""
+        if not self.cluster:
+            return list((client or self.client).scan_iter(match=pattern, count=count))
+
+        def scan_node(node):
+            conn = self.client.get_redis_connection(node)
+            return list(conn.scan_iter(match=pattern, count=count))
+
+        nodes = self.client.get_primaries()
+        with ThreadPoolExecutor(max_workers=max(len(nodes), 1)) as pool:
+            return [key for keys in pool.map(scan_node, nodes) for key in keys]
+
+    def _load(self, key: str, client=None, fields=None) -> Optional[Dict[str, Any]]:
+        """Read a record document, or only some of its fields, and expand
+        compressed fields"""
+        return self._load_many([key], client, fields)[0]
+
+    def _load_many(self, keys: List[str], client=None, fields=None) -> List[Optional[Dict[str, Any]]]:
+        """Read many record documents in one non-transactional pipeline,
+        which redis-py splits per node in cluster mode. With fields, a
+        multi-path JSON.GET transfers only those fields"""
+        paths = [f'$.{field}' for field in fields] if fields else [Path.root_path()]
+        pipe = self.json(client).pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key, *paths)
+        results = []
+        for data in pipe.execute():
+            if fields and data is not None:
+                # One path returns its match list directly, several a dict of them
+                matches = data if len(paths) > 1 else {paths[0]: data}
+                data = {field: matches[path][0] for field, path in zip(fields, paths)
+                        if matches.get(path)}
+            elif isinstance(data, list):
+                data = data[0] if data else None  # Handle case where root path returns list
+            results.append(unpack_fields(data))
+        return results
+
+    def _read_all(self, fields=None) -> List[tuple]:
+        """(key, record) for every record, read from a replica when routed there
+
+        Concurrent listings and searches share one scan through singleflight,
+        so callers must not modify the returned records. Only reads routed
+        the same way share a scan, and a user pinned to the primary after a
+        write never joins one, which may have started before that write."""
+        def read(client):
+            keys = self.scan_keys(client=client)
+            return [(key, data) for key, data in zip(keys, self._load_many(keys, client, fields))]
+        if self.router.replicas and self.router.pinned():
+            return self._read(read, full_scan=True)
+        key = f"read_all:{self.router.route()}:{','.join(fields or ['*'])}"
+        return singleflight.do(key, lambda: self._read(read, full_scan=True))
+
+    def _read(self, fn, full_scan: bool = False) -> Any:
+        """Run fn(client) on a reader, unless the circuit breaker is open"""
+        return breaker.call(lambda: self.router.read(fn), full_scan)
+
+    @staticmethod
+    def _with(fields: Optional[List[str]], needed) -> Optional[List[str]]:
+        """Fields to fetch: the requested ones plus those the query itself needs"""
+        if fields is None:
+            return None
+        return list(dict.fromkeys([*fields, *needed]))
+
+    def ping(self) -> float:
+        """Ping Redis and return the round-trip latency in milliseconds"""
+        start = time.perf_counter()
+        self.client.ping()
+        return (time.perf_counter() - start) * 1000
 
     def generate_work_id(self) -> str:
         """Generate a unique work ID based on pattern"""
         pattern = current_app.config['WORK_ID_PATTERN']
-        valid_chars = string.ascii_uppercase.replace('O', '') + string.digits.replace('0', '')
-        
         while True:
-            work_id = ''.join(random.choice(valid_chars) if c == 'X' else c 
-                            for c in pattern)
-            if not self.get_record(work_id):
+            work_id = random_work_id(pattern)
+            # Check the primary, a replica may not have seen a fresh ID yet
+            if not self.client.exists(self.key(work_id)):
                 return work_id
 
     def get_all_records(self, creator_id: Optional[str] = None, 
                        page: int = 1, per_page: int = records_per_page,
-                       show_all: bool = False) -> Dict[str, Any]:
-        """Get paginated records, optionally filtered by creator"""
+                       show_all: bool = False, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get paginated records, optionally filtered by creator and
+        projected to the given fields"""
         try:
-            # Get all records
-            keys = self.client.keys('record:*')
-            records = []
-            
-            for key in keys:
-                data = self.client.json().get(key, Path.root_path())
-                if isinstance(data, list):
-                    data = data[0]
-                
-                # Filter by creator_id and public flag
-                if not show_all and creator_id:
-                    # Show only user's records when not showing all
-                    if data.get('creator_id') != creator_id:
-                        continue
-                else:
-                    # When showing all records, show all public ones and user's private ones
-                    if data.get('public') is False and data.get('creator_id') != creator_id:
-                        continue
-                    
-                data['id'] = key.split(':')[1]
-                records.append(data)
-            
-            # Sort by changed_at, falling back to created_at
-            records.sort(key=lambda x: x.get('changed_at', x.get('created_at', 0)), reverse=True)
+            records = self._listing(creator_id, show_all, self._with(fields, LIST_FIELDS))
             total = len(records)
             
-            # Debug logging
+            # Debug logging, only serialize when it will actually be emitted
+            debug = current_app.logger.isEnabledFor(logging.DEBUG)
             current_app.logger.debug(f"Found {len(records)} total records")
-            current_app.logger.debug("Records before pagination: %s", json.dumps(records, indent=2))
+            if debug:
+                current_app.logger.debug("Records before pagination: %s", dumps(records, indent=True))
             
             # Apply pagination
             start = (page - 1) * per_page
             end = start + per_page
-            paginated_records = records[start:end]
+            paginated_records = [project(record, fields) for record in records[start:end]]
             
-            current_app.logger.debug("Records after pagination: %s", json.dumps(paginated_records, indent=2))
+            if debug:
+                current_app.logger.debug("Records after pagination: %s", dumps(paginated_records, indent=True))
             
             result = {
                 'records': paginated_records,
                 'total': total,
                 'pages': (total + per_page - 1) // per_page
             }
-            current_app.logger.debug("Returning result: %s", json.dumps(result, indent=2))
+            if debug:
+                current_app.logger.debug("Returning result: %s", dumps(result, indent=True))
             return result
+        except redis.RedisError:
+            # Unavailable is not the same as empty: let callers fall back or fail
+            raise
         except Exception as e:
             current_app.logger.error(f"Error getting records: {e}")
             return {'records': [], 'total': 0, 'pages': 0}
 
+    def list_record_fragments(self, creator_id: Optional[str] = None, page: int = 1,
+                              per_page: int = records_per_page, show_all: bool = False) -> Dict[str, Any]:
+        """get_all_records with each record as its rendered JSON text; only
+        the fields needed to filter and sort are decoded"""
+        try:
+            records = self._listing(creator_id, show_all, ['version', *LIST_FIELDS])
+            total = len(records)
+            start = (page - 1) * per_page
+            return {
+                'records': self._fragments(records[start:start + per_page]),
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
+        except redis.RedisError:
+            raise
+        except Exception as e:
+            current_app.logger.error(f"Error getting records: {e}")
+            return {'records': [], 'total': 0, 'pages': 0}
+
+    def _listing(self, creator_id: Optional[str], show_all: bool,
+                 fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Visible records with the given fields, newest change first"""
+        records = []
+        
+        for key, data in self._read_all(fields):
+            if not data:
+                continue
+            
+            # Filter by creator_id and public flag
+            if not show_all and creator_id:
+                # Show only user's records when not showing all
+                if data.get('creator_id') != creator_id:
+                    continue
+            else:
+                # When showing all records, show all public ones and user's private ones
+                if data.get('public') is False and data.get('creator_id') != creator_id:
+                    continue
+                
+            records.append({**data, 'id': self.id_from_key(key)})
+        
+        # Sort by changed_at, falling back to created_at
+        records.sort(key=lambda x: x.get('changed_at', x.get('created_at', 0)), reverse=True)
+        return records
+
     def search_records(self, query: str, creator_id: Optional[str] = None, 
-                      show_all: bool = False) -> List[Dict[str, Any]]:
+                      show_all: bool = False, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Search records with Boolean AND and quoted string support"""
         try:
-            # Get all records
-            keys = self.client.keys('record:*')
-            records = []
-            
-            # Parse search terms, respecting quotes
-            terms = []
-            current_term = []
-            in_quotes = False
-            quote_char = None
-            
-            # Split query into terms, preserving quoted strings
-            for char in query:
-                if char in ['"', "'"]:
-                    if not in_quotes:
-                        in_quotes = True
-                        quote_char = char
-                    elif quote_char == char:
-                        in_quotes = False
-                        if current_term:
-                            terms.append(''.join(current_term).lower())
-                            current_term = []
-                    else:
-                        current_term.append(char)
-                elif char.isspace() and not in_quotes:
-                    if current_term:
-                        terms.append(''.join(current_term).lower())
-                        current_term = []
-                else:
-                    current_term.append(char)
-            
-            if current_term:
-                terms.append(''.join(current_term).lower())
+            terms = parse_search_terms(query)
             
-            # Remove empty terms
-            terms = [term for term in terms if term]
-            
-            for key in keys:
-                try:
-                    data = self.client.json().get(key, Path.root_path())
-                    if isinstance(data, list):
-                        data = data[0]
-                    
-                    # Filter by creator_id and public flag
-                    if not show_all and creator_id:
-                        # Show only user's records when not showing all
-                        if data.get('creator_id') != creator_id:
-                            continue
-                    else:
-                        # When showing all records, show all public ones and user's private ones
-                        if data.get('public') is False and data.get('creator_id') != creator_id:
-                            continue
-                    
-                    # Boolean AND search in title and description
-                    if terms:
-                        # Include all fields in search
-                        searchable_parts = [
-                            str(data.get('title', '')),
-                            str(data.get('description', '')),
-                            str(data.get('access_control_by', '')),
-                            str(data.get('id', '')),
-                            str(data.get('creator_id', ''))
-                        ]
-                        
-                        # Add all meta field values to searchable text
-                        if data.get('meta'):
-                            for meta_value in data['meta'].values():
-                                if isinstance(meta_value, list):
-                                    searchable_parts.extend(str(v) for v in meta_value)
-                                else:
-                                    searchable_parts.append(str(meta_value))
-                        
-                        searchable_text = ' '.join(searchable_parts).lower()
-                        
-                        # All terms must match for the record to be included
-                        if not all(term in searchable_text for term in terms):
-                            continue
-                    
-                    data['id'] = key.split(':')[1]
-                    records.append(data)
-                except Exception as e:
-                    current_app.logger.error(f"Error processing record {key}: {e}")
-                    continue
-                    
-            # Sort by created_at
-            records.sort(key=lambda x: x.get('created_at', 0), reverse=True)
+            # Matching needs the searchable text even when it is not returned
+            needed = SEARCH_FIELDS if terms else LIST_FIELDS
+            records = self._matches(terms, creator_id, show_all, self._with(fields, needed))
             
             # Return only the first N records
-            return records[:records_per_page]
+            return [project(record, fields) for record in records[:records_per_page]]
+        except redis.RedisError:
+            raise
         except Exception as e:
             current_app.logger.error(f"Error searching records: {e}")
             return []
 
-    def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+    def search_record_fragments(self, query: str, creator_id: Optional[str] = None,
+                                show_all: bool = False) -> List[str]:
+        """search_records with each record as its rendered JSON text"""
+        try:
+            terms = parse_search_terms(query)
+            needed = SEARCH_FIELDS if terms else LIST_FIELDS
+            records = self._matches(terms, creator_id, show_all, ['version', *needed])
+            return self._fragments(records[:records_per_page])
+        except redis.RedisError:
+            raise
+        except Exception as e:
+            current_app.logger.error(f"Error searching records: {e}")
+            return []
+
+    def _matches(self, terms: List[str], creator_id: Optional[str], show_all: bool,
+                 fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Visible records containing every term, newest first"""
+        records = []
+        for key, data in self._read_all(fields):
+            try:
+                if not data:
+                    continue
+                
+                # Filter by creator_id and public flag
+                if not show_all and creator_id:
+                    # Show only user's records when not showing all
+                    if data.get('creator_id') != creator_id:
+                        continue
+                else:
+                    # When showing all records, show all public ones and user's private ones
+                    if data.get('public') is False and data.get('creator_id') != creator_id:
+                        continue
+                
+                # Boolean AND search in the text fields, ID and meta values
+                if terms:
+                    text = searchable_text(self.id_from_key(key), data)
+                    # All terms must match for the record to be included
+                    if not all(term in text for term in terms):
+                        continue
+                
+                records.append({**data, 'id': self.id_from_key(key)})
+            except Exception as e:
+                current_app.logger.error(f"Error processing record {key}: {e}")
+                continue
+                
+        # Sort by created_at
+        records.sort(key=lambda x: x.get('created_at', 0), reverse=True)
+        return records
+
+    def _fragments(self, records: List[Dict[str, Any]]) -> List[str]:
+        """Rendered JSON of the records, in order. Fragments that are missing
+        or were rendered from another version than the listed one are
+        rendered from the full document and stored again"""
+        def read(client):
+            pipe = client.pipeline(transaction=False)
+            for record in records:
+                pipe.get(self.fragment_key(record['id']))
+            return pipe.execute()
+
+        fragments, stale = [], []
+        for record, value in zip(records, self._read(read) if records else []):
+            version, _, fragment = (value or '').partition('|')
+            if value is None or version != str(record.get('version')):
+                stale.append(len(fragments))
+                fragment = None
+            fragments.append(fragment)
+        if stale:
+            keys = [self.key(records[i]['id']) for i in stale]
+            for i, data in zip(stale, self._read(lambda client: self._load_many(keys, client))):
+                if data is not None:
+                    fragments[i] = self._store_fragment(records[i]['id'], data)
+        # Records deleted since the listing was read are left out
+        return [fragment for fragment in fragments if fragment is not None]
+
+    def _store_fragment(self, record_id: str, record: Dict[str, Any]) -> str:
+        """Render a record as the API returns it and keep the result for listings"""
+        fragment = dumps({**record, 'id': record_id})
+        try:
+            self.client.set(self.fragment_key(record_id), f"{record.get('version')}|{fragment}")
+        except Exception as e:
+            current_app.logger.error(f"Error storing rendered record {record_id}: {e}")
+        return fragment
+
+    def get_record(self, record_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """Get a single record by ID using RedisJSON path"""
         try:
-            key = f'record:{record_id}'
+            key = self.key(record_id)
             # Use RedisJSON path to get specific fields
-            data = self.client.json().get(key, Path.root_path())
-            if data:
-                if isinstance(data, list):
-                    data = data[0]  # Handle case where root path returns list
+            data = self._read(lambda client: self._load(key, client, fields))
+            if data is not None:
                 data['id'] = record_id
-                return data
+                return project(data, fields)
             return None
+        except redis.RedisError:
+            raise
         except Exception as e:
             current_app.logger.error(f"Error getting record: {e}")
             return None
 
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize and compress record fields before a write"""
+        normalize_times(data)
+        
+        # Compress large text fields if configured
+        return pack_fields(data, current_app.config['STORAGE_COMPRESSION'],
+                           current_app.config['STORAGE_COMPRESS_MIN'])
+
+    @staticmethod
+    def _field_ops(data: Dict[str, Any]) -> List[tuple]:
+        """(command, path, value) JSON writes for the fields of a record"""
+        ops = []
+        for field, value in data.items():
+            if value not in (None, "", [], {}):
+                # Merge nested dictionaries, set everything else
+                ops.append(('JSON.MERGE' if isinstance(value, dict) else 'JSON.SET', f"$.{field}", value))
+            elif field in ['meta']:
+                # Preserve empty meta field as dictionary
+                ops.append(('JSON.SET', f"$.{field}", {}))
+        return ops
+
     def save_record(self, record_id: str, data: Dict[str, Any]) -> bool:
         """Save or update a record using RedisJSON paths"""
-        key = f'record:{record_id}'
+        key = self.key(record_id)
         try:
-            # Only set created_at for new records
-            if not self.client.exists(key):
+            if not breaker.call(lambda: self.client.exists(key)):
                 # Store UTC timestamp without timezone offset for new records
-                now = datetime.now(timezone.utc)
-                data['created_at'] = int(now.timestamp())
-                data['changed_at'] = int(now.timestamp())
-            else:
-                # Remove created_at if it was sent in update
-                data.pop('created_at', None)
-                # Always update changed_at on modifications
-                data['changed_at'] = int(datetime.now(timezone.utc).timestamp())
-            
-            # Handle time fields - they should already be UTC timestamps from frontend
-            for field in ['time_start', 'time_end']:
-                if data.get(field):
-                    # Ensure the value is an integer
-                    try:
-                        data[field] = int(data[field])
-                    except (TypeError, ValueError) as e:
-                        raise ValueError(f"Invalid timestamp for {field}: {data[field]}")
-            
-            # Initialize record if it doesn't exist
-            if not self.client.exists(key):
-                self.client.json().set(key, Path.root_path(), {})
-            
-            # Update fields using JSON path operations
-            for field, value in data.items():
-                if value not in (None, "", [], {}):
-                    if isinstance(value, dict):
-                        # Merge nested dictionaries
-                        self.client.json().merge(key, f"$.{field}", value)
-                    else:
-                        # Set non-dictionary values
-                        self.client.json().set(key, f"$.{field}", value)
-                elif field in ['meta']:
-                    # Preserve empty meta field as dictionary
-                    self.client.json().set(key, f"$.{field}", {})
-            
+                now = int(datetime.now(timezone.utc).timestamp())
+                new_data = self._prepare({**data, 'created_at': now, 'changed_at': now, 'version': 1})
+                document = {path[2:]: value for _, path, value in self._field_ops(new_data)}
+                # NX: if someone created the record meanwhile, update it instead
+                if breaker.call(lambda: self._create(keys=[key, *self._stats_keys()], args=[dumps(document)])):
+                    self.router.wrote()
+                    if self.cluster:
+                        self._count(stats_delta(None, document))
+                    self._after_write('upsert', record_id)
+                    return True
+            self.update_record(record_id, data)
             return True
         except Exception as e:
             current_app.logger.error(f"Error saving record {record_id}: {e}")
             raise RuntimeError(f"Failed to save record: {str(e)}")
 
+    def update_record(self, record_id: str, data: Dict[str, Any], owner: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Optional[int]:
+        """Atomically update a record if owned by owner and still at
+        expected_version; returns the new version, None if there is no record
+
+        Raises PermissionError for someone else's record and VersionConflict
+        when the record changed since expected_version was read.
+        """
+        data = dict(data)
+        # Remove created_at if it was sent in update
+        data.pop('created_at', None)
+        data.pop('version', None)
+        # Always update changed_at on modifications
+        data['changed_at'] = int(datetime.now(timezone.utc).timestamp())
+        args = ['' if expected_version is None else expected_version, owner or '']
+        for command, path, value in self._field_ops(self._prepare(data)):
+            args += [command, path, dumps(value)]
+
+        status, version, *stats = breaker.call(
+            lambda: self._update(keys=[self.key(record_id), *self._stats_keys()], args=args))
+        if status == 0:
+            return None
+        if status == -1:
+            raise PermissionError("You can only modify your own records")
+        if status == -2:
+            raise VersionConflict(version)
+        self.router.wrote()
+        if self.cluster:
+            self._count(stats_delta(*(self._stats_doc(doc) for doc in stats)))
+        self._after_write('upsert', record_id)
+        return version
+
     def delete_record(self, record_id: str) -> bool:
         """Delete a record"""
-        return bool(self.client.delete(f'record:{record_id}'))
+        # The owner is needed to drop the ID from the owner's index, and
+        # all counted fields to decrement the stats
+        before = self._stats_doc(breaker.call(
+            lambda: self._delete(keys=[self.key(record_id), self.fragment_key(record_id),
+                                       *self._stats_keys()])))
+        if before is None:
+            return False
+        self.router.wrote()
+        if self.cluster:
+            self._count(stats_delta(before, None))
+        self._after_write('delete', record_id, before)
+        return True
+
+    @staticmethod
+    def _stats_doc(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+        """STATS_FIELDS of a multi-path JSON.GET reply"""
+        if raw is None:
+            return None
+        matches = codec.decode(raw)
+        return {field: matches[f'$.{field}'][0] for field in STATS_FIELDS if matches.get(f'$.{field}')}
+
+    def _stats_keys(self) -> List[str]:
+        """The stats hash as an extra script key, so the write scripts count
+        atomically; none in cluster mode, where it is in another slot"""
+        return [] if self.cluster else [STATS_KEY]
+
+    def _count(self, delta: Dict[str, int]) -> None:
+        """Apply counter increments after a write in cluster mode; failures
+        are logged, the counters are reconciled by the rebuild-stats command"""
+        if not delta:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=not self.cluster)
+            for name, value in delta.items():
+                pipe.hincrby(STATS_KEY, name, value)
+            pipe.execute()
+        except Exception as e:
+            current_app.logger.error(f"Error updating stats: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Record counts in total and per creator, month and meta value"""
+        return format_stats(self._read(lambda client: client.hgetall(STATS_KEY)))
+
+    def rebuild_stats(self) -> int:
+        """Recompute the counters from a SCAN of all records"""
+        counts = {}
+        keys = self.scan_keys()
+        for start in range(0, len(keys), 500):
+            for data in self._load_many(keys[start:start + 500], fields=list(STATS_FIELDS)):
+                for name in stat_fields(data):
+                    counts[name] = counts.get(name, 0) + 1
+        pipe = self.client.pipeline(transaction=not self.cluster)
+        pipe.delete(STATS_KEY)
+        if counts:
+            pipe.hset(STATS_KEY, mapping=counts)
+        pipe.execute()
+        return counts.get('total', 0)
+
+    def _after_write(self, op: str, record_id: str, record: Optional[Dict[str, Any]] = None) -> None:
+        """Update the rendered JSON, the ID index and the change feed;
+        failures are logged and never fail the write itself"""
+        if op == 'upsert':
+            try:
+                record = self.get_record(record_id)
+            except Exception as e:
+                current_app.logger.error(f"Error reading back {record_id}: {e}")
+                record = None
+            if record is not None:
+                self._store_fragment(record_id, record)
+        try:
+            self._index_id(op, record_id, record or {})
+        except Exception as e:
+            current_app.logger.error(f"Error indexing ID {record_id}: {e}")
+        try:
+            publish_change(self.client, op, record_id, record if op == 'upsert' else None,
+                           maxlen=current_app.config['CHANGES_STREAM_MAXLEN'])
+        except Exception as e:
+            current_app.logger.error(f"Error publishing change for {record_id}: {e}")
+
+    def _index_id(self, op: str, record_id: str, record: Dict[str, Any], pipe=None) -> None:
+        """Add or remove a record in the completion indexes"""
+        member = f'{normalize_id(record_id)}:{record_id}'
+        execute = pipe is None
+        pipe = pipe or self.client.pipeline(transaction=False)
+        if op == 'upsert' and record.get('public', False):
+            pipe.zadd(ID_INDEX_PUBLIC, {member: 0})
+        else:
+            pipe.zrem(ID_INDEX_PUBLIC, member)
+        if record.get('creator_id'):
+            if op == 'upsert':
+                pipe.zadd(ID_INDEX_OWNER.format(record['creator_id']), {member: 0})
+            else:
+                pipe.zrem(ID_INDEX_OWNER.format(record['creator_id']), member)
+        if execute:
+            pipe.execute()
+
+    def complete_ids(self, prefix: str, creator_id: Optional[str] = None, limit: int = 10) -> List[str]:
+        """IDs starting with prefix (separators optional) that are public or
+        owned by creator_id, in lexicographic order"""
+        prefix = normalize_id(prefix)
+        if not prefix:
+            return []
+        indexes = [ID_INDEX_PUBLIC] + ([ID_INDEX_OWNER.format(creator_id)] if creator_id else [])
+
+        def read(client):
+            pipe = client.pipeline(transaction=False)
+            for index in indexes:
+                pipe.zrangebylex(index, f'[{prefix}', f'[{prefix}\xff', start=0, num=limit)
+            return pipe.execute()
+
+        members = sorted({member for result in self._read(read) for member in result})
+        return [member.split(':', 1)[1] for member in members[:limit]]
+
+    def ensure_id_index(self) -> Optional[int]:
+        """Build the completion indexes once, on the first start after an
+        upgrade; only the worker that claims ID_INDEX_BUILT does it. Returns
+        the records indexed, None if they were already built"""
+        if not self.client.set(ID_INDEX_BUILT, int(time.time()), nx=True):
+            return None
+        try:
+            return self.rebuild_id_index()
+        except Exception:
+            # Let the next worker to start try again
+            self.client.delete(ID_INDEX_BUILT)
+            raise
+
+    def rebuild_id_index(self) -> int:
+        """Rebuild the completion indexes from the stored records"""
+        for key in self.scan_keys(ID_INDEX_OWNER.format('*')) + [ID_INDEX_PUBLIC]:
+            self.client.delete(key)
+        count = 0
+        keys = self.scan_keys()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            pipe = self.client.pipeline(transaction=False)
+            for key, data in zip(batch, self._load_many(batch, fields=['creator_id', 'public'])):
+                if data is not None:
+                    self._index_id('upsert', self.id_from_key(key), data, pipe)
+                    count += 1
+            pipe.execute()
+        self.client.set(ID_INDEX_BUILT, int(time.time()))
+        return count
 
     def get_public_record_ids(self) -> List[str]:
         """Get IDs of all public records"""
-        keys = self.client.keys('record:*')
         public_ids = []
-        for key in keys:
+        for key, data in self._read_all(['public']):
             try:
-                data = self.client.json().get(key, Path.root_path())
-                if isinstance(data, list):
-                    data = data[0]
-                if data.get('public', False):
-                    record_id = key.split(':')[1]
-                    public_ids.append(record_id)
+                if data and data.get('public', False):
+                    public_ids.append(self.id_from_key(key))
             except Exception as e:
                 current_app.logger.error(f"Error processing record {key}: {e}")
                 continue
         return sorted(public_ids)
 
-    def get_public_record(self, partial_id: str) -> Optional[Dict[str, Any]]:
+    def get_public_record(self, partial_id: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """Get a public record by ID or partial ID"""
         try:
-            # Convert partial_id to uppercase for consistency
-            partial_id = partial_id.upper()
-            
-            # If partial ID provided, try to match against pattern
-            if '-' not in partial_id:
-                pattern = current_app.config['WORK_ID_PATTERN']
-                x_positions = [i for i, char in enumerate(pattern) if char == 'X']
-                if len(partial_id) == len(x_positions):
-                    # Reconstruct full ID using pattern
-                    id_chars = list(pattern)
-                    for pos, char in zip(x_positions, partial_id):
-                        id_chars[pos] = char
-                    full_id = ''.join(id_chars)
-                else:
-                    return None
-            else:
-                full_id = partial_id
+            full_id = expand_id(partial_id, current_app.config['WORK_ID_PATTERN'])
+            if full_id is None:
+                return None
 
             # Get record data
-            key = f'record:{full_id}'
-            data = self.client.json().get(key, Path.root_path())
+            key = self.key(full_id)
+            load_fields = self._with(fields, ['public'])
+            data = self._read(lambda client: self._load(key, client, load_fields))
             if data:
-                if isinstance(data, list):
-                    data = data[0]
                 # Only return if record is public
                 if data.get('public', False):
                     data['id'] = full_id
-                    return data
+                    return project(data, fields)
             return None
+        except redis.RedisError:
+            raise
         except Exception as e:
             current_app.logger.error(f"Error getting public record: {e}")
             return None
 
+    def lookup_public_records(self, ids: List[str],
+                              fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Resolve many full or partial IDs at once, in request order
+
+        Each result has the query, the expanded id and a status: found,
+        not_found (also for private records) or invalid.
+        """
+        pattern = current_app.config['WORK_ID_PATTERN']
+        full_ids = [expand_id(str(partial_id), pattern) for partial_id in ids]
+        unique_ids = list(dict.fromkeys(id for id in full_ids if id))
+        keys = [self.key(id) for id in unique_ids]
+        load_fields = self._with(fields, ['public'])
+
+        def read(client):
+            if self.cluster or load_fields is not None:
+                # JSON.MGET neither spans cluster slots nor takes several paths
+                return self._load_many(keys, client, load_fields)
+            if not keys:
+                return []
+            docs = self.json(client).mget(keys, Path.root_path())
+            return [unpack_fields((doc[0] if doc else None) if isinstance(doc, list) else doc)
+                    for doc in docs]
+
+        found = {}
+        for id, data in zip(unique_ids, self._read(read)):
+            if data and data.get('public', False):
+                data['id'] = id
+                found[id] = project(data, fields)
+
+        return lookup_results(ids, full_ids, found)
+
+    def get_identity(self, email: str) -> Optional[Dict[str, Any]]:
+        """The identity of an address: verified, or a pending signup"""
+        pipe = self.json().pipeline(transaction=False)
+        pipe.hexists(VERIFIED_KEY, email)
+        pipe.get(IDENTITY_KEY.format(email))
+        verified, data = pipe.execute()
+        if verified:
+            return {'email': email, 'verified': True}
+        return data[0] if isinstance(data, list) else data
+
+    def set_identity(self, email: str, verified: bool, ttl: Optional[int] = None) -> bool:
+        """Record a verified address, or a pending signup that expires after ttl seconds"""
+        pipe = self.client.pipeline(transaction=not self.cluster)
+        if verified:
+            pipe.hset(VERIFIED_KEY, email, int(time.time()))
+            pipe.delete(IDENTITY_KEY.format(email))
+            pipe.execute()
+            return True
+        key = IDENTITY_KEY.format(email)
+        check = self.json().pipeline(transaction=False)
+        check.hexists(VERIFIED_KEY, email)
+        # Addresses verified before compact-identities may still be documents
+        check.get(key, '$.verified')
+        in_hash, legacy = check.execute()
+        if in_hash:
+            # Signing up again never downgrades a verified address
+            return True
+        if legacy and legacy[0] is True:
+            return self.set_identity(email, True)
+        pipe.execute_command('JSON.SET', key, '$', dumps({'email': email, 'verified': False}))
+        if ttl:
+            pipe.expire(key, ttl)
+        return bool(pipe.execute()[0])
+
+    def _keyspace_metrics(self) -> Dict[str, int]:
+        """Total keys and used memory over all primaries"""
+        if self.cluster:
+            info = self.client.info('memory', target_nodes=RedisCluster.PRIMARIES)
+            memory = sum(node['used_memory'] for node in info.values())
+            keys = self.client.dbsize(target_nodes=RedisCluster.PRIMARIES)
+        else:
+            memory = self.client.info('memory')['used_memory']
+            keys = self.client.dbsize()
+        return {'keys': keys, 'identity_keys': len(self.scan_keys(IDENTITY_KEY.format('*'))),
+                'used_memory': memory}
+
+    def compact_identities(self, ttl: int, batch: int = 500) -> Dict[str, Any]:
+        """Move verified identity:* documents into the verified hash and give
+        pending ones without an expiry the token's max age; returns counts
+        and keyspace metrics before and after"""
+        before = self._keyspace_metrics()
+        stats = {'verified': 0, 'expiring': 0}
+        keys = self.scan_keys(IDENTITY_KEY.format('*'))
+        for start in range(0, len(keys), batch):
+            chunk = keys[start:start + batch]
+            pipe = self.json().pipeline(transaction=False)
+            for key in chunk:
+                pipe.get(key, '$.verified')
+                pipe.ttl(key)
+            results = pipe.execute()
+            pipe = self.client.pipeline(transaction=False)
+            for key, verified, key_ttl in zip(chunk, results[::2], results[1::2]):
+                if verified is None:
+                    continue  # Expired since the SCAN
+                email = key.split(':', 1)[1]
+                if verified == [True]:
+                    pipe.hsetnx(VERIFIED_KEY, email, int(time.time()))
+                    pipe.delete(key)
+                    stats['verified'] += 1
+                elif key_ttl == -1:
+                    pipe.expire(key, ttl)
+                    stats['expiring'] += 1
+            pipe.execute()
+        return {**stats, 'before': before, 'after': self._keyspace_metrics()}
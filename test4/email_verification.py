@@ -1,14 +1,14 @@
-import boto3
-from botocore.exceptions import ClientError
-from email_validator import validate_email, EmailNotValidError
+# boto3 and email_validator are imported where used: they are slow to load
+# and take memory in every worker, but only the verification routes need them
 from itsdangerous import URLSafeTimedSerializer
 from flask import current_app, url_for
 import json
 from typing import Optional, Tuple
-from .database import RedisDB
+from .backends import get_db
 
 def validate_email_address(email: str) -> Tuple[bool, Optional[str]]:
     """Validate email format and domain"""
+    from email_validator import validate_email, EmailNotValidError
     try:
         validation = validate_email(email, check_deliverability=True)
         normalized_email = validation.normalized
@@ -29,17 +29,20 @@ def generate_token(email: str) -> str:
     serializer = URLSafeTimedSerializer(current_app.config['FLASK_SECRET_KEY'])
     return serializer.dumps(email, salt='email-verification')
 
-def verify_token(token: str, expiration=3600) -> Optional[str]:
+def verify_token(token: str, expiration: Optional[int] = None) -> Optional[str]:
     """Verify the email verification token"""
     serializer = URLSafeTimedSerializer(current_app.config['FLASK_SECRET_KEY'])
     try:
-        email = serializer.loads(token, salt='email-verification', max_age=expiration)
+        email = serializer.loads(token, salt='email-verification',
+                                 max_age=expiration or current_app.config['VERIFY_TOKEN_MAX_AGE'])
         return email
     except:
         return None
 
 def send_verification_email(email: str, token: str) -> bool:
     """Send verification email using AWS SES"""
+    import boto3
+    from botocore.exceptions import ClientError
     verify_url = url_for('work_id.verify_email_token', 
                         token=token, 
                         _external=True)
@@ -73,7 +76,7 @@ def send_verification_email(email: str, token: str) -> bool:
                             <h2>Email Verification</h2>
                             <p>Please click the link below to verify your email for {current_app.config["APP_NAME"]}:</p>
                             <p><a href="{verify_url}">{verify_url}</a></p>
-                            <p>This link will expire in 1 hour.</p>
+                            <p>This link will expire in {current_app.config["VERIFY_TOKEN_MAX_AGE"] // 60} minutes.</p>
                         '''
                     }
                 }
@@ -85,24 +88,18 @@ def send_verification_email(email: str, token: str) -> bool:
         return False
 
 def store_identity(email: str, verified: bool = False) -> bool:
-    """Store identity information in Redis"""
+    """Store identity information in the configured storage backend; an
+    unverified identity expires together with its verification token"""
     try:
-        db = RedisDB()
-        identity_data = {
-            'email': email,
-            'verified': verified
-        }
-        return db.client.json().set(f'identity:{email}', '$', identity_data)
+        return get_db().set_identity(email, verified, ttl=current_app.config['VERIFY_TOKEN_MAX_AGE'])
     except Exception as e:
         current_app.logger.error(f"Failed to store identity: {e}")
         return False
 
 def get_identity(email: str) -> Optional[dict]:
-    """Retrieve identity information from Redis"""
+    """Retrieve identity information from the configured storage backend"""
     try:
-        db = RedisDB()
-        data = db.client.json().get(f'identity:{email}')
-        return data[0] if isinstance(data, list) else data
+        return get_db().get_identity(email)
     except Exception as e:
         current_app.logger.error(f"Failed to get identity: {e}")
         return None
@@ -0,0 +1,73 @@
+from typing import Any
+import datetime
+import json
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib json module is the fallback
+    orjson = None
+
+def _default(obj: Any) -> Any:
+    """Serialize types the stdlib encoder does not know about"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj: Any, sort_keys: bool = False, indent: bool = False) -> str:
+    """Encode to compact JSON, non-ASCII characters kept as-is"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option).decode()
+    return json.dumps(obj, default=_default, ensure_ascii=False, sort_keys=sort_keys,
+                      indent=2 if indent else None,
+                      separators=None if indent else (',', ':'))
+
+def loads(data: Any) -> Any:
+    """Decode JSON from str or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class JSONCodec:
+    """Encoder/decoder pair for redis-py's JSON commands (client.json(encoder=, decoder=))"""
+
+    def encode(self, obj: Any) -> str:
+        return dumps(obj)
+
+    def decode(self, data: Any) -> Any:
+        return loads(data)
+
+codec = JSONCodec()
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when installed
+
+    Honors the JSON_SORT_KEYS/JSON_AS_ASCII config keys, which Flask 3 no
+    longer reads by itself. ASCII-escaped output falls back to the stdlib.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if self.ensure_ascii or kwargs.get('cls') or kwargs.get('default'):
+            kwargs.setdefault('default', _default)
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                     indent=bool(kwargs.get('indent')))
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+def init_json(app: Flask) -> None:
+    """Install the fast JSON provider on an app"""
+    app.json = FastJSONProvider(app)
+    app.json.sort_keys = app.config.get('JSON_SORT_KEYS', False)
+    app.json.ensure_ascii = app.config.get('JSON_AS_ASCII', False)
@@ -0,0 +1,195 @@
+"""Static, precompressed copy of the public catalog
+
+The publish-catalog command writes what the public read endpoints return as
+files a static file server or CDN can serve without involving the app:
+
+    ids.json          sorted public IDs, as GET /api/public/ids
+    id/<ID>.json      one public record, as GET /api/public/id/<ID>
+    shards/<P>.json   every public record whose normalized ID starts with P
+                      (PUBLISH_SHARD_CHARS characters), sorted by ID
+
+Each file gets a .gz sibling (and .br with brotli installed) for servers
+that send precompressed variants, such as nginx with gzip_static, and every
+file is replaced atomically. A full build reads all records; afterwards the
+publisher follows the change stream and rewrites only the record files,
+shards and index touched by each batch of changes. Its stream position is
+kept in state.json, so a restarted publisher resumes where it stopped, and
+falls back to a full build when the stream was trimmed past it. Run a single
+publisher per folder. Other storage backends have no change stream: their
+catalog is always built in full.
+
+IDs become file names, so only IDs made of letters, digits, dashes and the
+separators of WORK_ID_PATTERN are published, and no file outside the folder
+is ever written or removed.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+import gzip
+import json
+import os
+from .assets import _write_atomic
+from .changes import STREAM_KEY, _stream_id, _text, _trimmed_up_to
+from .backends import StorageBackend
+from .database import RedisDB, normalize_id
+from .json_codec import dumps
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always written
+    brotli = None
+
+STATE_FILE = 'state.json'
+VARIANTS = ('', '.gz', '.br')
+# Never part of a file name, whatever WORK_ID_PATTERN contains
+PATH_CHARS = set('/\\\0')
+
+class CatalogPublisher:
+    """Write the public catalog of a storage backend into folder"""
+
+    def __init__(self, db: StorageBackend, folder: str, shard_chars: int = 1, id_pattern: str = 'XXXX-XXXX'):
+        self.db = db
+        self.folder = folder
+        self.shard_chars = shard_chars
+        # The characters an ID can have besides letters and digits
+        self.id_chars = set(id_pattern.replace('X', '') + '-') - PATH_CHARS
+        # Only RedisDB publishes the change stream that sync() follows
+        self.follows_changes = isinstance(db, RedisDB)
+        self.position = (self._read(STATE_FILE) or {}).get('stream_id') if self.follows_changes else None
+
+    def publishable(self, record_id: str) -> bool:
+        """Whether record_id is safe to use as a file name"""
+        return bool(normalize_id(record_id)) and all(
+            (char.isascii() and char.isalnum()) or char in self.id_chars for char in record_id)
+
+    def shard(self, record_id: str) -> str:
+        return normalize_id(record_id)[:self.shard_chars] or '_'
+
+    def _path(self, name: str) -> str:
+        """The file of a catalog name, which must resolve to inside the folder"""
+        root = os.path.realpath(self.folder)
+        path = os.path.realpath(os.path.join(root, *name.split('/')))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"Catalog file {name!r} is outside {self.folder}")
+        return path
+
+    def _read(self, name: str) -> Optional[Any]:
+        try:
+            with open(self._path(name), 'rb') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, name: str, text: str) -> None:
+        """Replace a catalog file and its precompressed variants"""
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode()
+        # Always write every variant, an old one must never outlive its source
+        _write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_atomic(path + '.br', brotli.compress(data, quality=11))
+        _write_atomic(path, data)
+
+    def _remove(self, name: str) -> None:
+        for suffix in VARIANTS:
+            try:
+                os.remove(self._path(name) + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _save_position(self, position: str) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        _write_atomic(self._path(STATE_FILE), dumps({'stream_id': position}).encode())
+        self.position = position
+
+    def _load_public(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """The public ones among ids, as /api/public/id/<ID> returns them"""
+        ids = [id for id in ids if self.publishable(id)]
+        found = {}
+        if not self.follows_changes:
+            for record_id in ids:
+                data = self.db.get_record(record_id)
+                if data and data.get('public', False):
+                    found[record_id] = data
+            return found
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            for record_id, data in zip(batch, self.db._load_many([self.db.key(id) for id in batch])):
+                if data and data.get('public', False):
+                    found[record_id] = {**data, 'id': record_id}
+        return found
+
+    def _write_shard(self, shard: str, records: Iterable[Dict[str, Any]]) -> None:
+        records = sorted(records, key=lambda record: record['id'])
+        if records:
+            self._write(f'shards/{shard}.json', dumps(records))
+        else:
+            self._remove(f'shards/{shard}.json')
+
+    def build(self) -> Dict[str, int]:
+        """Write the whole catalog and remove files of records that are no longer public"""
+        # Changes made while building are replayed by the next sync
+        position = None
+        if self.follows_changes:
+            latest = self.db.client.xrevrange(STREAM_KEY, count=1)
+            position = _text(latest[0][0]) if latest else '0-0'
+
+        records = self._load_public(self.db.get_public_record_ids())
+        shards: Dict[str, List[Dict[str, Any]]] = {}
+        for record_id, record in records.items():
+            self._write(f'id/{record_id}.json', dumps(record))
+            shards.setdefault(self.shard(record_id), []).append(record)
+        for shard, shard_records in shards.items():
+            self._write_shard(shard, shard_records)
+        self._write('ids.json', dumps(sorted(records)))
+
+        removed = 0
+        for directory, keep in (('id', records), ('shards', shards)):
+            try:
+                names = os.listdir(self._path(directory))
+            except FileNotFoundError:
+                continue
+            for name in names:
+                if name.endswith('.json') and name[:-len('.json')] not in keep:
+                    self._remove(f'{directory}/{name}')
+                    removed += 1
+        if position is not None:
+            self._save_position(position)
+        return {'records': len(records), 'shards': len(shards), 'removed': removed}
+
+    def apply(self, record_ids: Iterable[str]) -> None:
+        """Rewrite the files affected by changes to record_ids"""
+        record_ids = sorted({id for id in record_ids if self.publishable(id)})
+        records = self._load_public(record_ids)
+        for record_id in record_ids:
+            if record_id in records:
+                self._write(f'id/{record_id}.json', dumps(records[record_id]))
+            else:
+                self._remove(f'id/{record_id}.json')
+
+        changed = set(record_ids)
+        for shard in {self.shard(record_id) for record_id in record_ids}:
+            kept = [record for record in self._read(f'shards/{shard}.json') or []
+                    if record['id'] not in changed]
+            self._write_shard(shard, kept + [record for record_id, record in records.items()
+                                             if self.shard(record_id) == shard])
+
+        ids = set(self._read('ids.json') or [])
+        published = (ids - changed) | set(records)
+        if published != ids:
+            self._write('ids.json', dumps(sorted(published)))
+
+    def sync(self, block_ms: Optional[int] = None, count: int = 500) -> int:
+        """Apply the next batch of changes from the stream; returns how many
+        changes it covered. Builds the whole catalog first if needed"""
+        if not self.follows_changes:
+            raise RuntimeError(f"The {self.db.name} backend has no change stream to follow")
+        if self.position is None or _stream_id(self.position) < _trimmed_up_to(self.db.client):
+            self.build()
+        entries = self.db.client.xread({STREAM_KEY: self.position}, count=count, block=block_ms)
+        if not entries:
+            return 0
+        changes = entries[0][1]
+        self.apply(fields['id'] for _, fields in changes)
+        self._save_position(_text(changes[-1][0]))
+        return len(changes)
@@ -0,0 +1,110 @@
+"""Token-bucket admission control shared by all workers through Redis"""
+
+from typing import Callable, Optional
+from functools import wraps
+import math
+from flask import Flask, current_app, jsonify, request
+from redis.exceptions import RedisError
+from .email_verification import verify_creator_token
+
+# Refill and take tokens atomically; the server clock keeps workers consistent.
+# Returns {allowed, milliseconds until enough tokens are available}
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local allowed = 0
+local retry_ms = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_ms = math.ceil((cost - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {allowed, retry_ms}
+"""
+
+REJECTIONS_KEY = 'ratelimit:rejected'
+
+def by_ip() -> str:
+    return request.remote_addr or 'unknown'
+
+def by_creator() -> str:
+    """The verified creator of a valid creatorToken cookie, otherwise the
+    client address. Unsigned cookies are not used, anyone can rotate them"""
+    token = request.cookies.get('creatorToken')
+    email = verify_creator_token(token) if token else None
+    return f'creator:{email}' if email else by_ip()
+
+def parse_limit(limit: str) -> tuple:
+    """'30/60' means 30 requests per 60 seconds, with bursts of up to 30"""
+    count, _, seconds = limit.partition('/')
+    count, seconds = int(count), float(seconds or 1)
+    return count / seconds, count
+
+class RateLimiter:
+    """Per-route token buckets keyed by IP, creator or route
+
+    Limits come from RATE_LIMIT_<ROUTE> config keys such as '30/60'; an
+    empty value disables the limit. If Redis is unavailable, or not used at
+    all (STORAGE_BACKEND=sqlite), requests are let through rather than rejected.
+    """
+
+    def __init__(self):
+        self.get_client: Optional[Callable] = None
+        self._scripts = {}
+
+    def init_app(self, app: Flask, get_client: Callable) -> None:
+        self.get_client = get_client
+        app.extensions['rate_limiter'] = self
+
+    def _script(self, client):
+        script = self._scripts.get(id(client))
+        if script is None:
+            script = self._scripts[id(client)] = client.register_script(TOKEN_BUCKET_LUA)
+        return script
+
+    def limit(self, route: str, default: str, key: Callable[[], str] = by_ip, cost: int = 1):
+        """Decorate a view so it answers 429 with Retry-After when over its limit"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                limit = current_app.config.get(f'RATE_LIMIT_{route.upper()}', default)
+                if not limit or self.get_client is None:
+                    return f(*args, **kwargs)
+                rate, burst = parse_limit(limit)
+                try:
+                    client = self.get_client()
+                    allowed, retry_ms = self._script(client)(
+                        keys=[f'ratelimit:{route}:{key()}'], args=[rate, burst, cost])
+                    if not allowed:
+                        client.hincrby(REJECTIONS_KEY, route, 1)
+                except RedisError as e:
+                    current_app.logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+                    return f(*args, **kwargs)
+                if not allowed:
+                    retry_after = max(1, math.ceil(int(retry_ms) / 1000))
+                    response = jsonify({'error': 'Too many requests, please retry later'})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+    def rejections(self) -> dict:
+        """Per-route rejection counters"""
+        if self.get_client is None:
+            return {}
+        counts = self.get_client().hgetall(REJECTIONS_KEY)
+        return {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in counts.items()}
+
+limiter = RateLimiter()
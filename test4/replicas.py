@@ -0,0 +1,96 @@
+"""Read-replica routing with read-your-writes consistency
+
+Reads go to a random replica from REDIS_REPLICAS while writes always go to
+the primary. After a write the user is pinned to the primary for a short
+sticky window through a cookie, so their next reads never hit a replica that
+has not caught up yet. Optionally each write also WAITs for a number of
+replica acknowledgements, which narrows the staleness window for everyone else.
+"""
+
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+import math
+import random
+import time
+from flask import Flask, current_app, g, has_request_context, request
+from redis.exceptions import ConnectionError, TimeoutError
+
+STICKY_COOKIE = 'read_primary_until'
+
+def parse_replicas(value: Optional[str]) -> List[Tuple[str, int]]:
+    """'host:port,host:port' -> [(host, port), ...]"""
+    replicas = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':')
+        replicas.append((host or 'localhost', int(port)))
+    return replicas
+
+class ReadRouter:
+    """Pick the client for a read and record writes for stickiness"""
+
+    def __init__(self, primary, replicas: Sequence = (), sticky_seconds: float = 5,
+                 wait_replicas: int = 0, wait_timeout_ms: int = 100):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self.wait_replicas = wait_replicas
+        self.wait_timeout_ms = wait_timeout_ms
+
+    def pinned(self) -> bool:
+        """Whether the current read must go to the primary to see the user's own writes"""
+        # CLI commands and background threads have no user to be stale for,
+        # but they are rare and often follow a write, so keep them on the primary
+        if not has_request_context():
+            return True
+        now = time.time()
+        if g.get('read_primary_until', 0) > now:
+            return True
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > now
+        except ValueError:
+            return False
+
+    def reader(self):
+        """The client the current read should use"""
+        if not self.replicas or self.pinned():
+            return self.primary
+        return random.choice(self.replicas)
+
+    def route(self) -> str:
+        """'primary' or 'replica', where reader() sends the current read"""
+        return 'replica' if self.replicas and not self.pinned() else 'primary'
+
+    def read(self, fn: Callable[[Any], Any]) -> Any:
+        """Run fn(client) on a reader, retrying on the primary if a replica is down"""
+        client = self.reader()
+        if client is self.primary:
+            return fn(client)
+        try:
+            return fn(client)
+        except (ConnectionError, TimeoutError) as e:
+            current_app.logger.warning(f"Replica read failed, using primary: {e}")
+            return fn(self.primary)
+
+    def wrote(self) -> None:
+        """Call after writing to the primary"""
+        if self.wait_replicas:
+            acked = self.primary.wait(self.wait_replicas, self.wait_timeout_ms)
+            if acked < self.wait_replicas:
+                current_app.logger.warning(
+                    f"WAIT: {acked}/{self.wait_replicas} replicas acknowledged the write")
+        if self.replicas and has_request_context():
+            g.read_primary_until = time.time() + self.sticky_seconds
+
+def init_read_routing(app: Flask) -> None:
+    """Hand the sticky window to the browser when a request wrote something"""
+
+    @app.after_request
+    def set_sticky_cookie(response):
+        until = g.get('read_primary_until')
+        if until:
+            response.set_cookie(STICKY_COOKIE, f'{until:.3f}',
+                                max_age=math.ceil(until - time.time()),
+                                httponly=True, samesite='Lax')
+        return response
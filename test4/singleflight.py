@@ -0,0 +1,155 @@
+"""Coalescing of identical concurrent reads, within and across workers
+
+When many clients ask the same question at once (a class opening the page
+together, everyone reloading after a deploy) only one of them, the leader,
+runs the query. Followers with the same normalized key wait for its result:
+threads of the same worker through an in-process call table, other workers
+through a Redis lock that names the leader's flight and a short-lived result
+key the leader fills in. Followers flag that they are waiting, and the leader
+only copies its result to Redis when one has, so an uncontended query never
+ships its rows there. A follower only ever receives the result of a flight
+that was already running when it arrived, so it is at most one query older
+than computing it itself. If Redis is unavailable, or the leader does not
+finish within SINGLEFLIGHT_WAIT_MS, followers simply run the query themselves.
+"""
+
+from typing import Any, Callable, Dict, Optional
+import hashlib
+import secrets
+import threading
+import time
+from flask import Flask, current_app
+from redis.exceptions import RedisError
+from .json_codec import dumps, loads
+
+# Delete the lock only if this leader still holds it
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+POLL_SECONDS = 0.01
+
+class _Call:
+    """One in-flight computation in this worker"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Run fn once per key for all concurrent callers
+
+    SINGLEFLIGHT (true/false) switches coalescing on or off,
+    SINGLEFLIGHT_WAIT_MS bounds how long followers wait for a leader in
+    another worker, and SINGLEFLIGHT_LOCK_MS how long a crashed leader can
+    hold up others.
+    """
+
+    def __init__(self):
+        self.get_client: Optional[Callable] = None
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._scripts = {}
+
+    def init_app(self, app: Flask, get_client: Optional[Callable] = None) -> None:
+        """get_client returns the Redis client for cross-worker coalescing;
+        without it only threads of the same worker share results"""
+        self.get_client = get_client
+        app.extensions['singleflight'] = self
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """fn() for the first caller with this key, its result for everyone
+        who asks while it runs; results must be JSON-serializable"""
+        if not current_app.config.get('SINGLEFLIGHT', True):
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._across_workers(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _release(self, client):
+        script = self._scripts.get(id(client))
+        if script is None:
+            script = self._scripts[id(client)] = client.register_script(RELEASE_LUA)
+        return script
+
+    def _across_workers(self, key: str, fn: Callable[[], Any]) -> Any:
+        if self.get_client is None:
+            return fn()
+        lock_ms = int(current_app.config.get('SINGLEFLIGHT_LOCK_MS', 5000))
+        # The hash tag keeps lock and results in one slot in cluster mode
+        tag = hashlib.sha1(key.encode()).hexdigest()[:16]
+        lock_key = f'singleflight:{{{tag}}}:lock'
+        token = secrets.token_hex(8)
+        try:
+            client = self.get_client()
+            leader = client.set(lock_key, token, nx=True, px=lock_ms)
+        except RedisError as e:
+            current_app.logger.warning(f"Request coalescing unavailable, running query: {e}")
+            return fn()
+        if not leader:
+            return self._follow(client, tag, lock_key, lock_ms, fn)
+        try:
+            result = fn()
+            try:
+                # Followers poll for it; nobody needs it once they are done.
+                # One that registers after this check finds the lock released
+                # without a result and runs the query itself
+                if client.exists(f'singleflight:{{{tag}}}:{token}:waiting'):
+                    client.set(f'singleflight:{{{tag}}}:{token}', dumps(result), px=lock_ms)
+            except RedisError as e:
+                current_app.logger.warning(f"Could not share coalesced result: {e}")
+        finally:
+            try:
+                self._release(client)(keys=[lock_key], args=[token])
+            except RedisError as e:
+                current_app.logger.warning(f"Could not release coalescing lock {lock_key}: {e}")
+        return result
+
+    def _follow(self, client, tag: str, lock_key: str, lock_ms: int,
+                fn: Callable[[], Any]) -> Any:
+        """Wait for the result of the flight holding the lock, or run fn()
+        if it fails or takes too long"""
+        deadline = time.monotonic() + current_app.config.get('SINGLEFLIGHT_WAIT_MS', 2000) / 1000
+        try:
+            leader = client.get(lock_key)
+            if leader is not None:
+                leader = leader.decode() if isinstance(leader, bytes) else leader
+                result_key = f'singleflight:{{{tag}}}:{leader}'
+                client.set(f'{result_key}:waiting', 1, px=lock_ms)
+            while leader is not None and time.monotonic() < deadline:
+                data = client.get(result_key)
+                if data is not None:
+                    return loads(data)
+                time.sleep(POLL_SECONDS)
+                # The result is written before the lock is released, so a
+                # released lock without a result means the leader failed
+                if client.get(lock_key) is None:
+                    data = client.get(result_key)
+                    if data is not None:
+                        return loads(data)
+                    break
+        except RedisError as e:
+            current_app.logger.warning(f"Request coalescing unavailable, running query: {e}")
+        return fn()
+
+singleflight = SingleFlight()
@@ -0,0 +1,459 @@
+"""Embedded SQLite storage backend (STORAGE_BACKEND=sqlite)
+
+Records are JSON documents next to indexed columns for everything listings
+filter and sort on, so a page is an index scan plus LIMIT/OFFSET instead of
+reading every record. Search runs on an FTS5 table with the trigram
+tokenizer, which matches substrings of the same text the Redis backend
+searches. The database runs in WAL mode: readers never wait for the writer,
+each thread keeps its own connection, and writes are short IMMEDIATE
+transactions that also check ownership and version for optimistic locking.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import current_app
+from .backends import StorageBackend
+from .database import (
+    VersionConflict, expand_id, format_stats, lookup_results, normalize_id, normalize_times,
+    parse_search_terms, project, random_work_id, records_per_page, searchable_text,
+    stat_fields, stats_delta
+)
+from .json_codec import dumps, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    norm_id TEXT NOT NULL,
+    creator_id TEXT,
+    public INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    changed_at INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_public ON records (public, changed_at);
+CREATE INDEX IF NOT EXISTS records_creator ON records (creator_id, changed_at);
+CREATE INDEX IF NOT EXISTS records_created ON records (created_at);
+CREATE INDEX IF NOT EXISTS records_norm_id ON records (norm_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5 (text, tokenize='trigram');
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS identities (
+    email TEXT PRIMARY KEY,
+    verified INTEGER NOT NULL,
+    changed_at INTEGER NOT NULL,
+    expires_at INTEGER
+);
+"""
+
+# Trigram FTS5 can only match terms of at least three characters,
+# shorter ones are matched with LIKE on the same text
+MIN_MATCH_LENGTH = 3
+# Stay below SQLite's limit on bound parameters per statement
+IN_BATCH = 500
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """RFC 7396 merge of patch into target, like JSON.MERGE"""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+def apply_fields(doc: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Write the fields of data into doc the way RedisDB._field_ops does:
+    empty values are skipped, objects are merged, meta may be cleared"""
+    for field, value in data.items():
+        if value not in (None, "", [], {}):
+            doc[field] = merge_patch(doc.get(field), value) if isinstance(value, dict) else value
+        elif field in ['meta']:
+            doc[field] = {}
+    return doc
+
+def escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+class SQLiteDB(StorageBackend):
+    name = 'sqlite'
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = None):
+        if not hasattr(self, 'path'):
+            if path is None:
+                path = current_app.config['SQLITE_PATH']
+            if timeout is None:
+                timeout = current_app.config.get('SQLITE_TIMEOUT', 5.0)
+            self.timeout = timeout
+            self._local = threading.local()
+            if path == ':memory:':
+                # One in-memory database shared by all threads of this process
+                self.path, self.uri = f'file:records-{id(self)}?mode=memory&cache=shared', True
+            else:
+                directory = os.path.dirname(os.path.abspath(path))
+                os.makedirs(directory, exist_ok=True)
+                self.path, self.uri = path, False
+            # Also keeps a shared in-memory database alive
+            self._schema_conn = self._conn()
+            self._schema_conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection, in autocommit mode with WAL enabled"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, uri=self.uri,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL makes NORMAL safe against corruption; only the last commits
+            # before a power loss can be lost
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction that takes the write lock up front, so the
+        reads inside it cannot go stale before the write"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _store(self, conn: sqlite3.Connection, record_id: str, doc: Dict[str, Any],
+               seq: Optional[int] = None, before: Optional[Dict[str, Any]] = None) -> None:
+        """Insert or replace a record with its index columns, search text and
+        stats; before is the stored document that doc replaces"""
+        self._count(conn, stats_delta(before, doc))
+        created_at = int(doc.get('created_at') or 0)
+        columns = (normalize_id(record_id), doc.get('creator_id'), int(doc.get('public') is not False),
+                   created_at, int(doc.get('changed_at') or created_at), int(doc.get('version') or 0),
+                   dumps(doc))
+        if seq is None:
+            seq = conn.execute(
+                'INSERT INTO records (id, norm_id, creator_id, public, created_at, changed_at, version, doc) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (record_id, *columns)).lastrowid
+        else:
+            conn.execute(
+                'UPDATE records SET norm_id = ?, creator_id = ?, public = ?, created_at = ?, '
+                'changed_at = ?, version = ?, doc = ? WHERE seq = ?', (*columns, seq))
+            conn.execute('DELETE FROM records_fts WHERE rowid = ?', (seq,))
+        conn.execute('INSERT INTO records_fts (rowid, text) VALUES (?, ?)',
+                     (seq, searchable_text(record_id, doc)))
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, delta: Dict[str, int]) -> None:
+        """Apply counter increments inside the caller's transaction"""
+        conn.executemany(
+            'INSERT INTO stats (name, count) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET count = count + excluded.count', delta.items())
+
+    @staticmethod
+    def _record(record_id: str, doc: str, fields: Optional[List[str]]) -> Dict[str, Any]:
+        data = loads(doc)
+        data['id'] = record_id
+        return project(data, fields)
+
+    @staticmethod
+    def _visible(creator_id: Optional[str], show_all: bool) -> tuple:
+        """WHERE clause and parameters for the records a listing may show"""
+        if not show_all and creator_id:
+            # Show only user's records when not showing all
+            return 'creator_id = ?', [creator_id]
+        # When showing all records, show all public ones and user's private ones
+        return '(public = 1 OR creator_id = ?)', [creator_id]
+
+    def ping(self) -> float:
+        """Run a trivial query and return its latency in milliseconds"""
+        start = time.perf_counter()
+        self._conn().execute('SELECT 1').fetchone()
+        return (time.perf_counter() - start) * 1000
+
+    def generate_work_id(self) -> str:
+        """Generate a unique work ID based on pattern"""
+        pattern = current_app.config['WORK_ID_PATTERN']
+        conn = self._conn()
+        while True:
+            work_id = random_work_id(pattern)
+            if conn.execute('SELECT 1 FROM records WHERE id = ?', (work_id,)).fetchone() is None:
+                return work_id
+
+    # The stored document with its ID, rendered by SQLite's JSON functions
+    RENDERED = "json_set(r.doc, '$.id', r.id)"
+
+    def get_all_records(self, creator_id: Optional[str] = None,
+                        page: int = 1, per_page: int = records_per_page,
+                        show_all: bool = False, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get a page of records, newest change first, using the indexes"""
+        try:
+            rows, total = self._page('r.id, r.doc', creator_id, page, per_page, show_all)
+            return {
+                'records': [self._record(id, doc, fields) for id, doc in rows],
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
+        except sqlite3.Error as e:
+            current_app.logger.error(f"Error getting records: {e}")
+            return {'records': [], 'total': 0, 'pages': 0}
+
+    def list_record_fragments(self, creator_id: Optional[str] = None, page: int = 1,
+                              per_page: int = records_per_page, show_all: bool = False) -> Dict[str, Any]:
+        """get_all_records with the JSON text rendered in SQL"""
+        try:
+            rows, total = self._page(self.RENDERED, creator_id, page, per_page, show_all)
+            return {
+                'records': [row[0] for row in rows],
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
+        except sqlite3.Error as e:
+            current_app.logger.error(f"Error getting records: {e}")
+            return {'records': [], 'total': 0, 'pages': 0}
+
+    def _page(self, columns: str, creator_id: Optional[str], page: int, per_page: int,
+              show_all: bool) -> tuple:
+        """(rows of columns, total) for one page of visible records"""
+        where, params = self._visible(creator_id, show_all)
+        conn = self._conn()
+        total = conn.execute(f'SELECT COUNT(*) FROM records WHERE {where}', params).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT {columns} FROM records r WHERE {where} '
+            'ORDER BY changed_at DESC, id LIMIT ? OFFSET ?',
+            params + [per_page, max(page - 1, 0) * per_page]).fetchall()
+        return rows, total
+
+    def search_records(self, query: str, creator_id: Optional[str] = None,
+                       show_all: bool = False, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Search records with Boolean AND and quoted string support"""
+        try:
+            rows = self._search('r.id, r.doc', query, creator_id, show_all)
+            return [self._record(id, doc, fields) for id, doc in rows]
+        except sqlite3.Error as e:
+            current_app.logger.error(f"Error searching records: {e}")
+            return []
+
+    def search_record_fragments(self, query: str, creator_id: Optional[str] = None,
+                                show_all: bool = False) -> List[str]:
+        """search_records with the JSON text rendered in SQL"""
+        try:
+            return [row[0] for row in self._search(self.RENDERED, query, creator_id, show_all)]
+        except sqlite3.Error as e:
+            current_app.logger.error(f"Error searching records: {e}")
+            return []
+
+    def _search(self, columns: str, query: str, creator_id: Optional[str], show_all: bool) -> List[tuple]:
+        """Rows of columns for the newest visible records matching every term"""
+        where, params = self._visible(creator_id, show_all)
+        terms = parse_search_terms(query)
+        sql = f'SELECT {columns} FROM records r WHERE {where}'
+        if terms:
+            long_terms = [term for term in terms if len(term) >= MIN_MATCH_LENGTH]
+            sql = (f'SELECT {columns} FROM records r JOIN records_fts ON records_fts.rowid = r.seq '
+                   f'WHERE {where}')
+            if long_terms:
+                # Quoted phrases: trigram matching is substring matching
+                sql += ' AND records_fts MATCH ?'
+                params.append(' AND '.join('"{}"'.format(term.replace('"', '""'))
+                                           for term in long_terms))
+            for term in terms:
+                if len(term) < MIN_MATCH_LENGTH:
+                    sql += " AND records_fts.text LIKE ? ESCAPE '\\'"
+                    params.append(f'%{escape_like(term)}%')
+        return self._conn().execute(f'{sql} ORDER BY created_at DESC, id LIMIT ?',
+                                    params + [records_per_page]).fetchall()
+
+    def get_record(self, record_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute('SELECT doc FROM records WHERE id = ?', (record_id,)).fetchone()
+        return self._record(record_id, row[0], fields) if row else None
+
+    def save_record(self, record_id: str, data: Dict[str, Any]) -> bool:
+        """Create a record, or update it if it already exists"""
+        try:
+            with self._write() as conn:
+                if conn.execute('SELECT 1 FROM records WHERE id = ?', (record_id,)).fetchone() is None:
+                    now = int(datetime.now(timezone.utc).timestamp())
+                    doc = apply_fields({}, normalize_times(
+                        {**data, 'created_at': now, 'changed_at': now, 'version': 1}))
+                    self._store(conn, record_id, doc)
+                    return True
+            self.update_record(record_id, data)
+            return True
+        except Exception as e:
+            current_app.logger.error(f"Error saving record {record_id}: {e}")
+            raise RuntimeError(f"Failed to save record: {str(e)}")
+
+    def update_record(self, record_id: str, data: Dict[str, Any], owner: Optional[str] = None,
+                      expected_version: Optional[int] = None) -> Optional[int]:
+        """Update a record if owned by owner and still at expected_version;
+        returns the new version, None if there is no record"""
+        data = dict(data)
+        data.pop('created_at', None)
+        data.pop('version', None)
+        data['changed_at'] = int(datetime.now(timezone.utc).timestamp())
+        normalize_times(data)
+        with self._write() as conn:
+            row = conn.execute('SELECT seq, version, doc FROM records WHERE id = ?',
+                               (record_id,)).fetchone()
+            if row is None:
+                return None
+            seq, version, doc = row[0], row[1], loads(row[2])
+            before = dict(doc)
+            if owner and doc.get('creator_id') != owner:
+                raise PermissionError("You can only modify your own records")
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(version)
+            doc = apply_fields(doc, data)
+            doc['version'] = version + 1
+            self._store(conn, record_id, doc, seq, before)
+        return version + 1
+
+    def delete_record(self, record_id: str) -> bool:
+        """Delete a record"""
+        with self._write() as conn:
+            row = conn.execute('SELECT seq, doc FROM records WHERE id = ?', (record_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM records WHERE seq = ?', (row[0],))
+            conn.execute('DELETE FROM records_fts WHERE rowid = ?', (row[0],))
+            self._count(conn, stats_delta(loads(row[1]), None))
+        return True
+
+    def put_record(self, record_id: str, doc: Dict[str, Any]) -> None:
+        """Store a complete document as is, keeping its timestamps and
+        version; used to copy records from another backend"""
+        with self._write() as conn:
+            row = conn.execute('SELECT seq, doc FROM records WHERE id = ?', (record_id,)).fetchone()
+            self._store(conn, record_id, {k: v for k, v in doc.items() if k != 'id'},
+                        row[0] if row else None, loads(row[1]) if row else None)
+
+    def complete_ids(self, prefix: str, creator_id: Optional[str] = None, limit: int = 10) -> List[str]:
+        """IDs starting with prefix (separators optional) that are public or
+        owned by creator_id, in lexicographic order"""
+        prefix = normalize_id(prefix)
+        if not prefix:
+            return []
+        rows = self._conn().execute(
+            'SELECT id FROM records WHERE norm_id >= ? AND norm_id < ? '
+            'AND (public = 1 OR creator_id = ?) ORDER BY norm_id, id LIMIT ?',
+            (prefix, prefix + '\U0010ffff', creator_id, limit)).fetchall()
+        return [id for id, in rows]
+
+    def rebuild_id_index(self) -> int:
+        """Recompute the index columns and search text of every record"""
+        with self._write() as conn:
+            rows = conn.execute('SELECT seq, id, doc FROM records').fetchall()
+            conn.execute('DELETE FROM records_fts')
+            for seq, record_id, doc in rows:
+                doc = loads(doc)
+                self._store(conn, record_id, doc, seq, doc)
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Record counts in total and per creator, month and meta value"""
+        return format_stats(dict(self._conn().execute('SELECT name, count FROM stats').fetchall()))
+
+    def rebuild_stats(self) -> int:
+        """Recompute the counters from all records"""
+        counts = {}
+        with self._write() as conn:
+            for doc, in conn.execute('SELECT doc FROM records'):
+                for name in stat_fields(loads(doc)):
+                    counts[name] = counts.get(name, 0) + 1
+            conn.execute('DELETE FROM stats')
+            self._count(conn, counts)
+        return counts.get('total', 0)
+
+    def get_public_record_ids(self) -> List[str]:
+        """Get IDs of all public records"""
+        rows = self._conn().execute('SELECT id FROM records WHERE public = 1 ORDER BY id').fetchall()
+        return [id for id, in rows]
+
+    def get_public_record(self, partial_id: str,
+                          fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get a public record by ID or partial ID"""
+        full_id = expand_id(partial_id, current_app.config['WORK_ID_PATTERN'])
+        if full_id is None:
+            return None
+        row = self._conn().execute('SELECT doc FROM records WHERE id = ? AND public = 1',
+                                   (full_id,)).fetchone()
+        return self._record(full_id, row[0], fields) if row else None
+
+    def lookup_public_records(self, ids: List[str],
+                              fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Resolve many full or partial IDs at once, in request order"""
+        pattern = current_app.config['WORK_ID_PATTERN']
+        full_ids = [expand_id(str(partial_id), pattern) for partial_id in ids]
+        unique_ids = list(dict.fromkeys(id for id in full_ids if id))
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(unique_ids), IN_BATCH):
+            batch = unique_ids[start:start + IN_BATCH]
+            rows = conn.execute(
+                f"SELECT id, doc FROM records WHERE public = 1 AND id IN ({','.join('?' * len(batch))})",
+                batch).fetchall()
+            found.update((id, self._record(id, doc, fields)) for id, doc in rows)
+        return lookup_results(ids, full_ids, found)
+
+    def get_identity(self, email: str) -> Optional[Dict[str, Any]]:
+        """The identity of an address: verified, or a pending signup"""
+        row = self._conn().execute(
+            'SELECT verified FROM identities WHERE email = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (email, int(time.time()))).fetchone()
+        return {'email': email, 'verified': bool(row[0])} if row else None
+
+    def set_identity(self, email: str, verified: bool, ttl: Optional[int] = None) -> bool:
+        """Record a verified address, or a pending signup that expires after ttl seconds"""
+        now = int(time.time())
+        if verified:
+            self._conn().execute(
+                'INSERT INTO identities (email, verified, changed_at) VALUES (?, 1, ?) '
+                'ON CONFLICT (email) DO UPDATE SET verified = 1, changed_at = excluded.changed_at, '
+                'expires_at = NULL', (email, now))
+        else:
+            # Signing up again never downgrades a verified address
+            self._conn().execute(
+                'INSERT INTO identities (email, verified, changed_at, expires_at) VALUES (?, 0, ?, ?) '
+                'ON CONFLICT (email) DO UPDATE SET changed_at = excluded.changed_at, '
+                'expires_at = excluded.expires_at WHERE verified = 0',
+                (email, now, now + ttl if ttl else None))
+        return True
+
+    def _identity_metrics(self) -> Dict[str, int]:
+        conn = self._conn()
+        page_size, = conn.execute('PRAGMA page_size').fetchone()
+        pages, = conn.execute('PRAGMA page_count').fetchone()
+        return {'identities': conn.execute('SELECT COUNT(*) FROM identities').fetchone()[0],
+                'used_bytes': page_size * pages}
+
+    def compact_identities(self, ttl: int, batch: int = 500) -> Dict[str, Any]:
+        """Delete expired signups and give pending ones without an expiry the
+        token's max age; returns counts and size metrics before and after"""
+        before = self._identity_metrics()
+        now = int(time.time())
+        with self._write() as conn:
+            expired = conn.execute('DELETE FROM identities WHERE expires_at <= ?', (now,)).rowcount
+            expiring = conn.execute(
+                'UPDATE identities SET expires_at = changed_at + ? '
+                'WHERE verified = 0 AND expires_at IS NULL', (ttl,)).rowcount
+        # Hand the freed pages back to the file system
+        self._conn().execute('VACUUM')
+        return {'expired': expired, 'expiring': expiring, 'before': before,
+                'after': self._identity_metrics()}
@@ -1,6 +1,11 @@
 // Global state
 let currentRecord = null;
 let metaFields = {};
+let currentRecords = [];
+let currentPage = 1;
+let searchActive = false;
+let changesSource = null;
+const RECORDS_PER_PAGE = 7;
 
 // Utility functions
 const formatDateTime = (timestamp, forInput = false) => {
@@ -138,6 +143,8 @@ const loadRecords = async (page = 1) => {
             console.error('No records array in response:', data);
             throw new Error('Invalid response format');
         }
+        currentPage = page;
+        searchActive = false;
         updateRecordsList(data.records);
         updatePagination(data.pages, page);
     } catch (error) {
@@ -148,6 +155,7 @@ const loadRecords = async (page = 1) => {
 
 const updateRecordsList = (records) => {
     const recordsList = document.getElementById('recordsList');
+    if (Array.isArray(records)) currentRecords = records;
     
     // console.log('Updating records list with:', records);
     
@@ -307,6 +315,7 @@ const searchRecords = async () => {
         const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&show_all=${showAll}&user_id=${userId}`);
         if (!response.ok) throw new Error('Search failed');
         const records = await response.json();
+        searchActive = true;
         updateRecordsList(records);
         document.querySelector('.pagination').innerHTML = ''; // Hide pagination during search
     } catch (error) {
@@ -368,11 +377,15 @@ const submitForm = async (event) => {
         const method = isNewRecord ? 'POST' : 'PUT';
         const url = `/api/records${isNewRecord ? '' : '/' + formData.id}`;
 
+        const headers = { 'Content-Type': 'application/json' };
+        // Only overwrite the version this form was loaded from
+        if (!isNewRecord && currentRecord?.version !== undefined) {
+            headers['If-Match'] = `"${currentRecord.version}"`;
+        }
+
         const response = await fetch(url, {
             method: method,
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers: headers,
             body: JSON.stringify(formData),
             signal: controller.signal
         });
@@ -381,10 +394,15 @@ const submitForm = async (event) => {
             const errorData = await response.json().catch(() => ({}));
             throw new Error(errorData.error || `Failed to save record: ${response.status} ${response.statusText}`);
         }
+        if (!isNewRecord && currentRecord) {
+            const result = await response.json().catch(() => ({}));
+            if (result.version !== undefined) currentRecord.version = result.version;
+        }
 
         clearTimeout(timeoutId);
         showToast('Record saved successfully');
-        await loadRecords(); // Refresh the list
+        // The change feed patches the list; only refetch without it
+        if (!changesSource || changesSource.readyState !== EventSource.OPEN) await loadRecords();
         if (isNewRecord) await resetForm();
     } catch (error) {
         clearTimeout(timeoutId);
@@ -396,6 +414,41 @@ const submitForm = async (event) => {
     }
 };
 
+// Live updates from the change feed
+const applyChange = (change) => {
+    const index = currentRecords.findIndex(record => record.id === change.id);
+    if (change.op === 'upsert') {
+        const record = { ...change.record, id: change.id };
+        if (index >= 0) {
+            currentRecords[index] = record;
+        } else {
+            // Only new records on the first, unfiltered page appear in place
+            const userId = document.getElementById('userIdInput').value;
+            const showAll = document.getElementById('showAllRecords').checked;
+            if (searchActive || currentPage !== 1) return;
+            if (!showAll && record.creator_id !== userId) return;
+            currentRecords = [record, ...currentRecords].slice(0, RECORDS_PER_PAGE);
+        }
+    } else if (index >= 0) {
+        currentRecords.splice(index, 1);
+    } else {
+        return;
+    }
+    updateRecordsList(currentRecords);
+};
+
+const subscribeChanges = () => {
+    const userId = document.getElementById('userIdInput').value;
+    if (!userId || !window.EventSource) return;
+    if (changesSource) changesSource.close();
+    changesSource = new EventSource(`/api/changes?user_id=${encodeURIComponent(userId)}`);
+    changesSource.addEventListener('change', (event) => applyChange(JSON.parse(event.data)));
+    // Events were trimmed from the feed before we saw them, reload instead
+    changesSource.addEventListener('reset', () => {
+        if (searchActive) searchRecords(); else loadRecords(currentPage);
+    });
+};
+
 // Date handling functions
 const handleDateTimeChange = (type) => {
     const input = document.getElementById(`time_${type}`);
@@ -449,6 +502,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     if (verifiedEmail) {
         userIdInput.value = verifiedEmail;
         loadRecords(1);
+        subscribeChanges();
     }
 
     userIdInput.addEventListener('change', async () => {
@@ -0,0 +1,65 @@
+from datetime import datetime
+import os
+import sys
+import fakeredis
+import pytest
+
+# test4 is imported as a package from the repository root, wherever pytest runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from test4 import database, sqlite_db
+from test4.app import create_app
+from test4.config import Config
+from test4.database import CREATE_LUA, DELETE_LUA, UPDATE_LUA, RedisDB
+from test4.sqlite_db import SQLiteDB
+
+class TestConfig(Config):
+    TESTING = True
+    # No Redis watcher thread; the backends under test are built by the fixtures
+    STORAGE_BACKEND = 'sqlite'
+    SQLITE_PATH = ':memory:'
+    WORK_ID_PATTERN = 'XXXX-XXXX'
+
+class Clock(datetime):
+    """datetime whose now() advances a minute per call, so every write gets
+    its own changed_at and listings have a single valid order"""
+    ts = 1_700_000_000
+
+    @classmethod
+    def now(cls, tz=None):
+        cls.ts += 60
+        return datetime.fromtimestamp(cls.ts, tz)
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def sqlite_backend(app, monkeypatch):
+    monkeypatch.setattr(sqlite_db, 'datetime', Clock)
+    monkeypatch.setattr(SQLiteDB, '_instance', None)
+    return SQLiteDB(':memory:')
+
+@pytest.fixture
+def redis_server():
+    """The fake Redis server; set connected = False to simulate an outage"""
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def redis_backend(app, redis_server, monkeypatch):
+    # fakeredis runs the RedisJSON commands and Lua scripts (needs lupa and jsonpath-ng)
+    monkeypatch.setattr(database, 'datetime', Clock)
+    monkeypatch.setattr(RedisDB, '_instance', None)
+    db = RedisDB('localhost', 6379)
+    client = fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+    db.client = db.router.primary = client
+    db._create = client.register_script(CREATE_LUA)
+    db._update = client.register_script(UPDATE_LUA)
+    db._delete = client.register_script(DELETE_LUA)
+    return db
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def db(request):
+    return request.getfixturevalue(f'{request.param}_backend')
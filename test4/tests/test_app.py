@@ -0,0 +1,44 @@
+import time
+import pytest
+from test4.app import create_app
+from test4.breaker import CLOSED, breaker
+from .conftest import TestConfig
+
+class RedisTestConfig(TestConfig):
+    STORAGE_BACKEND = 'redis'
+    BREAKER_FAILURES = 1
+    REDIS_CHECK_INTERVAL = 0.05
+    REDIS_RETRY_MIN = REDIS_RETRY_MAX = 0.05
+
+@pytest.fixture
+def redis_app(redis_backend, monkeypatch):
+    # The breaker is shared by every app in the process
+    for name in ('failures', 'slow_seconds', 'open_seconds', 'stale_entries'):
+        monkeypatch.setattr(breaker, name, getattr(breaker, name))
+    app = create_app(RedisTestConfig)
+    assert app.extensions['redis_started'].wait(5)
+    yield app
+    breaker.state = CLOSED
+    breaker._errors = 0
+    breaker._stale.clear()
+
+def test_outage_serves_stale_listing(redis_app, redis_server):
+    client = redis_app.test_client()
+    record_id = client.get('/api/new-id').get_json()['id']
+    response = client.post('/api/records', json={'id': record_id, 'title': 'alpha',
+                                                 'creator_id': 'a@b.edu', 'public': True})
+    assert response.status_code < 300
+    fresh = client.get('/api/records?show_all=true')
+    assert fresh.status_code == 200
+    assert 'Warning' not in fresh.headers
+
+    redis_server.connected = False
+    # Wait for the watcher to see the outage too
+    deadline = time.monotonic() + 5
+    while redis_app.extensions['redis_ready'].is_set() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not redis_app.extensions['redis_ready'].is_set()
+    stale = client.get('/api/records?show_all=true')
+    assert stale.status_code == 200
+    assert stale.headers['Warning'].startswith('110')
+    assert stale.get_json() == fresh.get_json()
@@ -0,0 +1,171 @@
+"""The SQLite and Redis backends must answer every StorageBackend call alike"""
+
+import pytest
+from test4.json_codec import loads
+from test4.database import VersionConflict
+from .conftest import Clock
+
+ALICE = 'alice@example.edu'
+BOB = 'bob@example.edu'
+
+RECORDS = [
+    ('AAAA-1111', {'title': 'Genomics pilot', 'description': 'Sequencing run', 'creator_id': ALICE,
+                   'public': True, 'active': True, 'meta': {'work_type': 'Grant Project'}}),
+    ('AAAA-2222', {'title': 'Imaging archive', 'description': 'AI models for MRI', 'creator_id': BOB,
+                   'public': True, 'active': False, 'meta': {'work_type': 'Pilot'}}),
+    ('BBBB-3333', {'title': 'Private survey', 'description': 'Cohort data', 'creator_id': BOB,
+                   'public': False, 'active': True}),
+    ('BBBB-4444', {'title': 'Climate model', 'description': 'Storage for AI runs', 'creator_id': ALICE,
+                   'public': True, 'active': True, 'time_start': '1700000000'}),
+]
+
+@pytest.fixture
+def records(db):
+    for record_id, data in RECORDS:
+        assert db.save_record(record_id, dict(data))
+    return db
+
+def ids(records):
+    return [record['id'] for record in records]
+
+def test_save_and_get(records):
+    record = records.get_record('BBBB-4444')
+    assert record['title'] == 'Climate model'
+    assert record['time_start'] == 1700000000
+    assert record['version'] == 1
+    assert record['created_at'] == record['changed_at']
+    assert records.get_record('BBBB-4444', ['title']) == {'id': 'BBBB-4444', 'title': 'Climate model'}
+    assert records.get_record('ZZZZ-9999') is None
+
+def test_listing(records):
+    # Newest change first; the private record only for its owner
+    assert ids(records.get_all_records(show_all=True)['records']) == ['BBBB-4444', 'AAAA-2222', 'AAAA-1111']
+    assert ids(records.get_all_records(BOB, show_all=True)['records']) == \
+        ['BBBB-4444', 'BBBB-3333', 'AAAA-2222', 'AAAA-1111']
+    assert ids(records.get_all_records(BOB)['records']) == ['BBBB-3333', 'AAAA-2222']
+    page = records.get_all_records(show_all=True, page=2, per_page=2)
+    assert (ids(page['records']), page['total'], page['pages']) == (['AAAA-1111'], 3, 2)
+    assert records.get_all_records(ALICE, fields=['title'])['records'][0] == \
+        {'id': 'BBBB-4444', 'title': 'Climate model'}
+
+def test_fragments_match_records(records):
+    listing = records.list_record_fragments(BOB, show_all=True)
+    assert [loads(fragment) for fragment in listing['records']] == \
+        records.get_all_records(BOB, show_all=True)['records']
+    assert [loads(fragment) for fragment in records.search_record_fragments('model', show_all=True)] == \
+        records.search_records('model', show_all=True)
+
+@pytest.mark.parametrize('query, expected', [
+    ('model', ['BBBB-4444', 'AAAA-2222']),
+    ('MODEL climate', ['BBBB-4444']),
+    ('"ai runs"', ['BBBB-4444']),
+    # Terms shorter than three characters, which trigram search cannot match
+    ('ai', ['BBBB-4444', 'AAAA-2222']),
+    ('ai mri', ['AAAA-2222']),
+    ('a', ['BBBB-4444', 'AAAA-2222', 'AAAA-1111']),
+    ('pilot', ['AAAA-2222', 'AAAA-1111']),
+    ('bbbb-44', ['BBBB-4444']),
+    ('cohort', []),
+    ('', ['BBBB-4444', 'AAAA-2222', 'AAAA-1111']),
+])
+def test_search(records, query, expected):
+    assert ids(records.search_records(query, show_all=True)) == expected
+
+def test_search_visibility(records):
+    assert ids(records.search_records('cohort', BOB, show_all=True)) == ['BBBB-3333']
+    assert ids(records.search_records('a', BOB)) == ['BBBB-3333', 'AAAA-2222']
+    assert records.search_records('survey', ALICE, show_all=True) == []
+
+def test_public_lookup(records):
+    assert records.get_public_record_ids() == ['AAAA-1111', 'AAAA-2222', 'BBBB-4444']
+    assert records.get_public_record('aaaa1111')['title'] == 'Genomics pilot'
+    assert records.get_public_record('BBBB-3333') is None
+    found = records.lookup_public_records(['AAAA-2222', 'bbbb4444', 'BBBB-3333', 'AAAA'], ['title'])
+    assert found == [
+        {'query': 'AAAA-2222', 'id': 'AAAA-2222', 'status': 'found',
+         'record': {'id': 'AAAA-2222', 'title': 'Imaging archive'}},
+        {'query': 'bbbb4444', 'id': 'BBBB-4444', 'status': 'found',
+         'record': {'id': 'BBBB-4444', 'title': 'Climate model'}},
+        {'query': 'BBBB-3333', 'id': 'BBBB-3333', 'status': 'not_found'},
+        {'query': 'AAAA', 'id': None, 'status': 'invalid'},
+    ]
+
+def test_complete_ids(records):
+    assert records.complete_ids('aaaa') == ['AAAA-1111', 'AAAA-2222']
+    assert records.complete_ids('BBBB-') == ['BBBB-4444']
+    assert records.complete_ids('bbbb', BOB) == ['BBBB-3333', 'BBBB-4444']
+    assert records.complete_ids('AAAA', limit=1) == ['AAAA-1111']
+    assert records.complete_ids('-') == []
+    records.delete_record('AAAA-1111')
+    assert records.complete_ids('AAAA') == ['AAAA-2222']
+
+def test_update(records):
+    version = records.update_record('AAAA-1111', {'title': 'Genomics', 'meta': {'funder': 'NIH'}},
+                                    owner=ALICE, expected_version=1)
+    assert version == 2
+    record = records.get_record('AAAA-1111')
+    assert (record['title'], record['version'], record['meta']) == \
+        ('Genomics', 2, {'work_type': 'Grant Project', 'funder': 'NIH'})
+    assert record['changed_at'] > record['created_at']
+    # The change moves it to the top of the listing
+    assert ids(records.get_all_records(show_all=True)['records'])[0] == 'AAAA-1111'
+    assert records.update_record('ZZZZ-9999', {'title': 'x'}) is None
+
+def test_update_conflicts(records):
+    with pytest.raises(PermissionError):
+        records.update_record('AAAA-1111', {'title': 'Mine now'}, owner=BOB)
+    with pytest.raises(VersionConflict) as conflict:
+        records.update_record('AAAA-1111', {'title': 'Stale'}, owner=ALICE, expected_version=0)
+    assert conflict.value.version == 1
+    record = records.get_record('AAAA-1111')
+    assert (record['title'], record['version']) == ('Genomics pilot', 1)
+
+def test_save_existing_updates(records):
+    assert records.save_record('AAAA-1111', {'title': 'Renamed', 'creator_id': ALICE})
+    record = records.get_record('AAAA-1111')
+    assert (record['title'], record['version'], record['description']) == ('Renamed', 2, 'Sequencing run')
+
+def test_delete_and_stats(records):
+    stats = records.get_stats()
+    assert (stats['total'], stats['active'], stats['public']) == (4, 3, 3)
+    assert stats['by_creator'] == {ALICE: 2, BOB: 2}
+    assert records.delete_record('BBBB-3333')
+    assert not records.delete_record('BBBB-3333')
+    assert records.get_record('BBBB-3333') is None
+    stats = records.get_stats()
+    assert (stats['total'], stats['active'], stats['by_creator']) == (3, 2, {ALICE: 2, BOB: 1})
+    assert records.rebuild_stats() == 3
+    assert records.get_stats() == stats
+
+# Creation times around month, year and leap day boundaries, and before 1970
+CREATED = [951_782_399, 951_782_400, 951_868_800, 1_704_067_199, 1_704_067_200, 4_107_542_400, -1]
+
+def test_stats_counters(db, monkeypatch):
+    for i, created_at in enumerate(CREATED):
+        monkeypatch.setattr(Clock, 'ts', created_at - 60)
+        db.save_record(f'CCCC-{i:04d}', {
+            'title': 'Counted', 'creator_id': ALICE if i % 2 else BOB, 'active': i % 3 == 0,
+            'public': i != 2, 'meta': {'tags': ['x', 'x', 'y'], 'funded': True, 'year': 2024, 'note': ''}})
+    db.update_record('CCCC-0001', {'active': True, 'meta': {'tags': ['z'], 'funded': False}})
+    db.update_record('CCCC-0002', {'public': True, 'creator_id': BOB})
+    db.delete_record('CCCC-0003')
+    stats = db.get_stats()
+    assert stats['by_month'] == {'1969-12': 1, '2000-02': 2, '2000-03': 1, '2024-01': 1, '2100-03': 1}
+    assert stats['by_meta'] == {'tags': {'x': 5, 'y': 5, 'z': 1}, 'funded': {'True': 5, 'False': 1},
+                                'year': {'2024': 6}}
+    assert (stats['total'], stats['active'], stats['public']) == (6, 3, 6)
+    # The counters kept on every write equal a recount of the stored records
+    assert db.rebuild_stats() == 6
+    assert db.get_stats() == stats
+
+def test_signup_keeps_verified_identity(db):
+    db.set_identity('a@b.edu', True)
+    db.set_identity('a@b.edu', False, ttl=60)
+    assert db.get_identity('a@b.edu')['verified'] is True
+
+def test_signup_keeps_legacy_verified_identity(redis_backend):
+    # As written before verified addresses moved to the identities:verified hash
+    redis_backend.json().set('identity:a@b.edu', '$', {'email': 'a@b.edu', 'verified': True})
+    redis_backend.set_identity('a@b.edu', False, ttl=60)
+    assert redis_backend.get_identity('a@b.edu')['verified'] is True
+    assert redis_backend.client.ttl('identity:a@b.edu') == -2
@@ -0,0 +1,33 @@
+import pytest
+from redis.exceptions import ConnectionError, ResponseError
+from test4.breaker import CLOSED, OPEN, CircuitBreaker, CircuitOpenError
+
+@pytest.fixture
+def breaker(app):
+    breaker = CircuitBreaker()
+    breaker.failures = 2
+    breaker.slow_seconds = 0
+    return breaker
+
+def fail(error):
+    def fn():
+        raise error
+    return fn
+
+def test_slow_calls_open(breaker):
+    breaker.call(lambda: 1)
+    breaker.call(lambda: 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 1)
+
+def test_full_scans_only_count_outages(breaker):
+    for _ in range(3):
+        assert breaker.call(lambda: 1, full_scan=True) == 1
+        with pytest.raises(ResponseError):
+            breaker.call(fail(ResponseError('bad')), full_scan=True)
+    assert breaker.state == CLOSED
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail(ConnectionError('down')), full_scan=True)
+    assert breaker.state == OPEN
@@ -0,0 +1,28 @@
+import json
+import os
+import pytest
+from test4.publisher import CatalogPublisher
+
+def test_unsafe_ids_are_not_published(redis_backend, tmp_path):
+    for record_id in ('(AB-CD)', 'AAAA-1111', '../../outside', 'id/../../state', '(..)'):
+        redis_backend.save_record(record_id, {'title': 'Public', 'creator_id': 'a@b.edu', 'public': True})
+    publisher = CatalogPublisher(redis_backend, str(tmp_path / 'catalog'), id_pattern='(XX-XX)')
+    assert publisher.build()['records'] == 2
+    publisher.apply(['../../outside', 'AAAA-1111', '(AB-CD)'])
+    assert sorted(os.listdir(tmp_path)) == ['catalog']
+    assert json.loads((tmp_path / 'catalog' / 'ids.json').read_text()) == ['(AB-CD)', 'AAAA-1111']
+    record = json.loads((tmp_path / 'catalog' / 'id' / '(AB-CD).json').read_text())
+    assert record['id'] == '(AB-CD)'
+    with pytest.raises(ValueError):
+        publisher._write('id/../../outside.json', '{}')
+
+def test_sqlite_catalog_is_built_in_full(sqlite_backend, tmp_path):
+    sqlite_backend.save_record('(AB-CD)', {'title': 'Public', 'creator_id': 'a@b.edu', 'public': True})
+    sqlite_backend.save_record('(EF-GH)', {'title': 'Private', 'creator_id': 'a@b.edu', 'public': False})
+    publisher = CatalogPublisher(sqlite_backend, str(tmp_path), id_pattern='(XX-XX)')
+    assert publisher.build() == {'records': 1, 'shards': 1, 'removed': 0}
+    assert json.loads((tmp_path / 'id' / '(AB-CD).json').read_text()) == \
+        sqlite_backend.get_record('(AB-CD)')
+    assert not (tmp_path / 'state.json').exists()
+    with pytest.raises(RuntimeError):
+        publisher.sync()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Benchmark the share of per-request time spent on JSON serialization
+
+Simulates the test4 listing request in-process: decode every stored record
+(as the RedisJSON client does), filter and sort them, then encode the
+response body. Runs once with the stdlib fallback and once with orjson (if
+installed) and reports how much of each request went to JSON.
+
+    python tools/bench_json.py --records 2000 --requests 50
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test4 import json_codec  # noqa: E402
+
+def make_record(i: int) -> dict:
+    words = [''.join(random.choices(string.ascii_lowercase, k=7)) for _ in range(60)]
+    return {
+        'title': f'Record {i} ' + ' '.join(words[:6]),
+        'description': ' '.join(words),
+        'access_control_by': 'grp-research',
+        'creator_id': f'user{i % 25}@example.edu',
+        'created_at': 1700000000 + i,
+        'changed_at': 1700000000 + i * 2,
+        'time_start': 1700000000,
+        'time_end': 1800000000,
+        'active': i % 3 != 0,
+        'public': i % 4 != 0,
+        'meta': {'work_type': 'Grant Project', 'required_apps': ['Teams', 'HPC'],
+                 'organization': ['University 1']},
+    }
+
+def simulate(stored: list, requests: int) -> tuple:
+    """Return (total seconds, seconds spent in JSON) over all requests"""
+    total = spent = 0.0
+    for _ in range(requests):
+        start = time.perf_counter()
+        t = time.perf_counter()
+        records = [json_codec.loads(doc) for doc in stored]
+        spent += time.perf_counter() - t
+        records = [r for r in records if r['public'] or r['creator_id'] == 'user1@example.edu']
+        records.sort(key=lambda r: r['changed_at'], reverse=True)
+        t = time.perf_counter()
+        json_codec.dumps({'records': records, 'total': len(records)})
+        spent += time.perf_counter() - t
+        total += time.perf_counter() - start
+    return total, spent
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    stored = [json_codec.dumps(make_record(i)) for i in range(args.records)]
+    backends = [('stdlib', None)]
+    if json_codec.orjson is not None:
+        backends.append(('orjson', json_codec.orjson))
+
+    print(f"{args.records} records x {args.requests} requests")
+    print(f"{'backend':<8} {'ms/request':>11} {'json ms':>9} {'json share':>11}")
+    for name, module in backends:
+        json_codec.orjson = module
+        total, spent = simulate(stored, args.requests)
+        print(f"{name:<8} {total / args.requests * 1000:>11.2f} "
+              f"{spent / args.requests * 1000:>9.2f} {spent / total:>10.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
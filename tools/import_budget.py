@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Check what a worker pays at startup for its imports
+
+Imports an app's modules the way a worker does, in a fresh interpreter with
+-X importtime, and reports the import time per top-level package and the
+resident memory the imports added. Fails when the total import time or RSS
+exceeds its budget, or when a module that should only load on first use
+(the SES client, the email validator, the CAPTCHA renderer) was imported.
+
+    python tools/import_budget.py --app test4 --max-ms 800 --max-rss-mb 80
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# sys.path entry, modules a worker imports, modules that must load lazily
+APPS = {
+    'test4': (ROOT, ['test4.app', 'test4.blueprints.work_id', 'test4.blueprints.health'],
+              ['boto3', 'botocore', 'email_validator']),
+    'work-id': (os.path.join(ROOT, 'work-id'), ['app'], ['captcha', 'PIL']),
+    'template': (ROOT, ['template.app', 'template.blueprints.errors'], []),
+}
+
+CHILD = """
+import importlib, json, resource, sys, time
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+for module in {modules!r}:
+    importlib.import_module(module)
+print(json.dumps({{'ms': (time.perf_counter() - start) * 1000,
+                  'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'modules': sorted(sys.modules)}}))
+"""
+
+def run(code: str, importtime: bool = False) -> tuple:
+    """(parsed stdout, stderr) of code in a fresh interpreter"""
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    result = subprocess.run(args, capture_output=True, text=True, cwd=ROOT,
+                            env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+    if result.returncode:
+        sys.exit(f"Import failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def package_times(importtime_log: str) -> dict:
+    """Self import time in ms per top-level package from -X importtime output"""
+    totals = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0) + int(self_us) / 1000
+    return totals
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', choices=sorted(APPS), default='test4')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to take the median of')
+    parser.add_argument('--top', type=int, default=15, help='Packages to list')
+    parser.add_argument('--max-ms', type=float, help='Budget for the total import time')
+    parser.add_argument('--max-rss-mb', type=float, help='Budget for the RSS the imports add')
+    args = parser.parse_args()
+
+    path, modules, lazy = APPS[args.app]
+    baseline, _ = run(CHILD.format(path=path, modules=[]))
+    runs = [run(CHILD.format(path=path, modules=modules)) for _ in range(args.runs)]
+    result = runs[-1][0]
+    total_ms = statistics.median(data['ms'] for data, _ in runs)
+    rss_mb = (statistics.median(data['rss_kb'] for data, _ in runs) - baseline['rss_kb']) / 1024
+    # The per-package breakdown, measured separately since -X importtime adds overhead
+    _, log = run(CHILD.format(path=path, modules=modules), importtime=True)
+    packages = sorted(package_times(log).items(), key=lambda item: item[1], reverse=True)
+
+    print(f"{args.app}: {len(result['modules'])} modules, {total_ms:.0f}ms, +{rss_mb:.1f}MB RSS "
+          f"(median of {args.runs})")
+    print(f"{'package':<24} {'self ms':>9} {'share':>6}")
+    measured = sum(ms for _, ms in packages) or 1
+    for package, ms in packages[:args.top]:
+        print(f"{package:<24} {ms:>9.1f} {ms / measured:>6.0%}")
+
+    failures = []
+    if args.max_ms is not None and total_ms > args.max_ms:
+        failures.append(f"import time {total_ms:.0f}ms > {args.max_ms:g}ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f}MB > {args.max_rss_mb:g}MB")
+    loaded = sorted({name.split('.')[0] for name in result['modules']} & set(lazy))
+    if loaded:
+        failures.append(f"imported at startup instead of on first use: {', '.join(loaded)}")
+    print()
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    print('PASSED' if not failures else 'FAILED')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
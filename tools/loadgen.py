@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""Load test an app with the request mix its browser client produces
+
+Virtual users replay the flows of static/js/main.js as weighted scenarios:
+the page load with its meta-fields and new-id calls, paging, searching, and
+saving a record followed by the refresh the client does after every save
+(page 1 in test4, the search listing in work-id). Each user keeps its own
+cookies and creator ID.
+
+The search and new-id rate limits are per verified creator, otherwise per
+client address. Given the app's FLASK_SECRET_KEY with --secret-key, test4
+users carry a signed creatorToken and are limited one by one as in
+production; without it, and always for work-id (which only trusts a solved
+CAPTCHA), all users share the load generator's address, so raise
+RATE_LIMIT_SEARCH and RATE_LIMIT_NEW_ID on the target or expect 429s.
+
+Reports throughput, p50/p95/p99 latency and errors per route and, with
+--redis-url, Redis commands per request, then checks latency SLOs and the
+error rate. Exits 1 when any check fails.
+
+    python tools/loadgen.py --app test4 --url http://localhost:5000 \\
+        --users 50 --duration 60 --records 500 --redis-url redis://localhost:6379 \\
+        --slo '*:p95=300' --slo 'GET /api/search:p99=800'
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import string
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+WORDS = ('grant', 'pilot', 'genomics', 'imaging', 'cluster', 'storage', 'survey', 'climate',
+         'teaching', 'archive', 'sensor', 'model', 'cohort', 'pipeline', 'dataset', 'portal')
+
+class Stats:
+    """Latencies and failures per route, shared by all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.limited = {}
+
+    def add(self, route: str, seconds: float, status: int) -> None:
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if status == 429:
+                self.limited[route] = self.limited.get(route, 0) + 1
+            if status == 0 or status >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def random_id(pattern: str) -> str:
+    chars = string.ascii_uppercase.replace('O', '') + string.digits.replace('0', '')
+    return ''.join(random.choice(chars) if c == 'X' else c for c in pattern)
+
+def random_text(words: int) -> str:
+    return ' '.join(random.choice(WORDS) for _ in range(words))
+
+class User:
+    """One browser session: a cookie jar, a creator ID and the records it saved"""
+
+    def __init__(self, args, stats: Stats, number: int):
+        self.args = args
+        self.stats = stats
+        self.creator_id = f'loadgen-{number}@example.edu'
+        self.own = []
+        jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        # work-id takes the user from this cookie
+        self.set_cookie(jar, 'creator_id', self.creator_id)
+        if args.secret_key and args.app == 'test4':
+            # As test4's generate_creator_token, the rate limits key on it
+            from itsdangerous import URLSafeTimedSerializer
+            token = URLSafeTimedSerializer(args.secret_key).dumps(self.creator_id, salt='creator-auth')
+            self.set_cookie(jar, 'creatorToken', token)
+
+    def set_cookie(self, jar: http.cookiejar.CookieJar, name: str, value: str) -> None:
+        host = urllib.parse.urlsplit(self.args.url).hostname or 'localhost'
+        if '.' not in host:
+            host += '.local'  # How the cookie jar names single-label hosts
+        jar.set_cookie(http.cookiejar.Cookie(
+            0, name, value, None, False, host, False, False, '/', True,
+            False, None, True, None, None, {}))
+
+    def request(self, method: str, route: str, path: str, body=None, headers=None, record=True):
+        """(status, decoded JSON or None, response headers); route names the
+        endpoint in the report"""
+        data = None
+        headers = dict(headers or {})
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.args.url.rstrip('/') + path, data=data, method=method,
+                                     headers={'Accept-Encoding': 'identity', **headers})
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=self.args.timeout) as response:
+                status, raw, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, raw, response_headers = e.code, e.read(), e.headers
+        except OSError:
+            status, raw, response_headers = 0, b'', {}
+        if record:
+            self.stats.add(f'{method} {route}', time.perf_counter() - start, status)
+        try:
+            payload = json.loads(raw) if raw and raw[:1] in (b'{', b'[') else None
+        except ValueError:
+            payload = None
+        return status, payload, response_headers
+
+    def think(self) -> None:
+        low, high = self.args.think_ms
+        time.sleep(random.uniform(low, high) / 1000)
+
+class Test4User(User):
+    """test4/static/js/main.js"""
+
+    def setup(self) -> None:
+        pass
+
+    def page(self, page: int = 1, record: bool = True):
+        query = urllib.parse.urlencode({'page': page, 'show_all': 'true', 'user_id': self.creator_id})
+        return self.request('GET', '/api/records', f'/api/records?{query}', record=record)
+
+    def create(self, record: bool = True) -> None:
+        status, payload, _ = self.request('GET', '/api/new-id', '/api/new-id', record=record)
+        record_id = (payload or {}).get('id') or random_id(self.args.id_pattern)
+        status, _, _ = self.request('POST', '/api/records', '/api/records', {
+            'id': record_id, 'title': random_text(4), 'description': random_text(30),
+            'creator_id': self.creator_id, 'active': True, 'public': random.random() < 0.8,
+            'meta': {'work_type': random.choice(['Grant Project', 'Pilot'])}}, record=record)
+        if status == 200:
+            self.own.append(record_id)
+
+    def scenarios(self):
+        return {'load': (5, self.load), 'browse': (3, self.browse), 'search': (3, self.search),
+                'create': (1, self.save_new), 'edit': (1, self.edit)}
+
+    def load(self) -> None:
+        self.request('GET', '/', '/')
+        self.request('GET', '/api/meta-fields', '/api/meta-fields')
+        self.page(1)
+        self.request('GET', '/api/new-id', '/api/new-id')
+
+    def browse(self) -> None:
+        _, payload, _ = self.page(1)
+        pages = (payload or {}).get('pages') or 1
+        for page in range(2, min(pages, 4) + 1):
+            self.think()
+            self.page(page)
+
+    def search(self) -> None:
+        query = urllib.parse.urlencode({'q': random.choice(WORDS), 'show_all': 'true',
+                                        'user_id': self.creator_id})
+        self.request('GET', '/api/search', f'/api/search?{query}')
+
+    def save_new(self) -> None:
+        self.create()
+        # Without the change feed the client reloads page 1 and opens a fresh form
+        self.page(1)
+        self.request('GET', '/api/new-id', '/api/new-id')
+
+    def edit(self) -> None:
+        if not self.own:
+            return self.save_new()
+        record_id = random.choice(self.own)
+        status, record, headers = self.request('GET', '/api/records/<id>', f'/api/records/{record_id}')
+        if status != 200:
+            return
+        self.think()
+        self.request('PUT', '/api/records/<id>', f'/api/records/{record_id}',
+                     {'title': random_text(4), 'creator_id': self.creator_id},
+                     {'If-Match': headers.get('ETag') or f'"{record.get("version", 0)}"'})
+        self.page(1)
+
+class WorkIdUser(User):
+    """work-id/static/js/main.js"""
+
+    def setup(self) -> None:
+        self.request('POST', '/api/set-user-id', '/api/set-user-id', {'user_id': self.creator_id},
+                     record=False)
+
+    def listing(self, record: bool = True):
+        return self.request('GET', '/api/search', '/api/search?q=&user_only=false', record=record)
+
+    def create(self, record: bool = True) -> None:
+        start = time.strftime('%Y-%m-%d')
+        status, payload, _ = self.request('POST', '/api/records', '/api/records', {
+            'title': random_text(4), 'description': random_text(30), 'start_date': start,
+            'end_date': start, 'active': True}, record=record)
+        if status == 200 and payload:
+            self.own.append(payload['id'])
+
+    def scenarios(self):
+        return {'load': (5, self.load), 'search': (3, self.search), 'mine': (2, self.mine),
+                'create': (1, self.save_new), 'edit': (1, self.edit)}
+
+    def load(self) -> None:
+        self.request('GET', '/', '/')
+        self.listing()
+
+    def search(self) -> None:
+        query = urllib.parse.urlencode({'q': random.choice(WORDS), 'user_only': 'false'})
+        self.request('GET', '/api/search', f'/api/search?{query}')
+
+    def mine(self) -> None:
+        self.request('GET', '/api/records', '/api/records')
+
+    def save_new(self) -> None:
+        self.request('GET', '/api/new-id', '/api/new-id')
+        self.think()
+        self.create()
+        self.listing()
+        self.request('GET', '/api/new-id', '/api/new-id')
+
+    def edit(self) -> None:
+        if not self.own:
+            return self.save_new()
+        record_id = random.choice(self.own)
+        status, record, headers = self.request('GET', '/api/records/<id>', f'/api/records/{record_id}')
+        if status != 200:
+            return
+        self.think()
+        self.request('PUT', '/api/records/<id>', f'/api/records/{record_id}',
+                     {'title': random_text(4)},
+                     {'If-Match': headers.get('ETag') or f'"{record.get("version", 0)}"'})
+        self.listing()
+
+class TemplateUser(User):
+    """template/: a page without API calls"""
+
+    def setup(self) -> None:
+        pass
+
+    def create(self, record: bool = True) -> None:
+        pass
+
+    def scenarios(self):
+        return {'load': (1, self.load)}
+
+    def load(self) -> None:
+        self.request('GET', '/', '/')
+
+APPS = {'test4': Test4User, 'work-id': WorkIdUser, 'template': TemplateUser}
+
+def redis_commands(url):
+    """Commands processed so far by the Redis at url, None without one"""
+    if not url:
+        return None
+    import redis
+    return redis.Redis.from_url(url).info('stats')['total_commands_processed']
+
+def seed(args, stats: Stats) -> int:
+    """Create --records records, spread over ten seeding users"""
+    users = [APPS[args.app](args, stats, f'seed{n}') for n in range(10)]
+    for user in users:
+        user.setup()
+    for n in range(args.records):
+        users[n % len(users)].create(record=False)
+    return sum(len(user.own) for user in users)
+
+def run(args, stats: Stats) -> float:
+    """Run the virtual users for --duration seconds; returns the elapsed time"""
+    deadline = time.monotonic() + args.duration
+
+    def session(number: int) -> None:
+        user = APPS[args.app](args, stats, number)
+        user.setup()
+        scenarios = list(user.scenarios().values())
+        weights = [weight for weight, _ in scenarios]
+        # Stagger the start like users arriving one by one
+        time.sleep(random.uniform(0, args.ramp_up))
+        while time.monotonic() < deadline:
+            random.choices(scenarios, weights)[0][1]()
+            user.think()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=session, args=(n,), daemon=True) for n in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start
+
+def parse_slo(spec: str) -> tuple:
+    """'GET /api/search:p95=300' -> ('GET /api/search', 95.0, 300.0); route * means all"""
+    route, _, limit = spec.rpartition(':')
+    name, _, ms = limit.partition('=')
+    if not name.startswith('p') or not ms:
+        raise argparse.ArgumentTypeError(f"Expected ROUTE:pNN=MS, got {spec!r}")
+    return route or '*', float(name[1:]), float(ms)
+
+def report(args, stats: Stats, elapsed: float, commands) -> dict:
+    routes = {}
+    for route in sorted(stats.latencies):
+        values = sorted(stats.latencies[route])
+        routes[route] = {
+            'requests': len(values),
+            'rps': len(values) / elapsed if elapsed else 0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'errors': stats.errors.get(route, 0),
+            'rate_limited': stats.limited.get(route, 0),
+            'latencies': values,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    errors = sum(route['errors'] for route in routes.values())
+
+    checks = []
+    for route_pattern, p, limit in args.slo or [('*', 95, 500), ('*', 99, 1000)]:
+        for route, row in routes.items():
+            if route_pattern in ('*', route):
+                value = percentile(row['latencies'], p) * 1000
+                checks.append({'check': f'{route} p{p:g}', 'value': value, 'limit': limit,
+                               'passed': value <= limit})
+    error_rate = errors / total if total else 1.0
+    checks.append({'check': 'error rate', 'value': error_rate, 'limit': args.max_error_rate,
+                   'passed': error_rate <= args.max_error_rate})
+    for row in routes.values():
+        del row['latencies']
+    return {
+        'app': args.app, 'users': args.users, 'seconds': elapsed, 'requests': total,
+        'rps': total / elapsed if elapsed else 0, 'errors': errors,
+        'redis_commands_per_request': commands / total if commands is not None and total else None,
+        'routes': routes, 'checks': checks, 'passed': all(check['passed'] for check in checks),
+    }
+
+def print_report(result: dict) -> None:
+    print(f"{result['app']}: {result['users']} users, {result['requests']} requests in "
+          f"{result['seconds']:.1f}s ({result['rps']:.1f} req/s)")
+    print(f"{'route':<28} {'requests':>9} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7} {'429':>5}")
+    for route, row in result['routes'].items():
+        print(f"{route:<28} {row['requests']:>9} {row['rps']:>7.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['errors']:>7} {row['rate_limited']:>5}")
+    if result['redis_commands_per_request'] is not None:
+        print(f"Redis commands per request: {result['redis_commands_per_request']:.1f}")
+    print()
+    for check in result['checks']:
+        if check['check'] == 'error rate':
+            value, limit = f"{check['value']:.2%}", f"{check['limit']:.2%}"
+        else:
+            value, limit = f"{check['value']:.1f}ms", f"{check['limit']:g}ms"
+        print(f"{'PASS' if check['passed'] else 'FAIL'}  {check['check']:<36} {value:>10} <= {limit}")
+    print(f"\n{'PASSED' if result['passed'] else 'FAILED'}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', choices=sorted(APPS), default='test4')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which users start')
+    parser.add_argument('--records', type=int, default=0, help='Records to create before the run')
+    parser.add_argument('--think-ms', type=float, nargs=2, default=(500, 2000), metavar=('MIN', 'MAX'),
+                        help='Pause between user actions')
+    parser.add_argument('--timeout', type=float, default=10, help='Seconds before a request fails')
+    parser.add_argument('--id-pattern', default=os.getenv('WORK_ID_PATTERN', 'XXXX-XXXX'))
+    parser.add_argument('--secret-key', default=os.getenv('FLASK_SECRET_KEY'),
+                        help="The app's FLASK_SECRET_KEY, to sign creator tokens (test4)")
+    parser.add_argument('--redis-url', help='Count Redis commands per request, e.g. redis://localhost:6379')
+    parser.add_argument('--slo', type=parse_slo, action='append',
+                        help="Latency limit ROUTE:pNN=MS, repeatable (default '*:p95=500' and '*:p99=1000')")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    stats = Stats()
+    if args.records:
+        print(f"Seeded {seed(args, stats)} records")
+    before = redis_commands(args.redis_url)
+    elapsed = run(args, stats)
+    after = redis_commands(args.redis_url)
+    # Less the INFO call that took the first sample
+    commands = after - before - 1 if before is not None else None
+
+    result = report(args, stats, elapsed, commands)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0 if result['passed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
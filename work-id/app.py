@@ -1,11 +1,21 @@
 #! /usr/bin/env python3
 
 import sys, os, base64, io, random, string, json
+import click
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, make_response, session
-from captcha.image import ImageCaptcha
+from flask import Flask, render_template, request, jsonify, make_response, session, Response, stream_with_context
 from dotenv import load_dotenv
-from models import WorkRecord, redis_client
+from models import WorkRecord, VersionConflict, redis_client, router, RECORD_FIELDS
+import storage
+from assets import StaticAssets
+from compression import Compress, streamed_json_array
+from json_codec import init_json, dumps
+from changes import sse_events
+from ratelimit import limiter, by_creator, by_ip
+from replicas import init_read_routing
+from sessions import RedisSessionInterface
+from singleflight import singleflight
+from utils import local_only, parse_fields, if_match_version
 
 # Load environment variables
 load_dotenv()
@@ -13,8 +23,31 @@ load_dotenv()
 debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
 force_captcha = os.getenv('FORCE_CAPTCHA', 'False').lower() == 'true'
 app = Flask(__name__, static_url_path='/static', static_folder='static')
-app.config['SECRET_KEY'] = os.urandom(24)
+# All workers must share the key that signs session cookies
+secret_key = os.getenv('FLASK_SECRET_KEY')
+if not secret_key:
+    print(" * Warning: FLASK_SECRET_KEY not set, sessions only work with a single worker")
+app.config['SECRET_KEY'] = secret_key or os.urandom(24)
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour session
+# Session data (CAPTCHA state) lives in Redis so any worker can serve any request
+app.session_interface = RedisSessionInterface(redis_client)
+app.config['JSON_SORT_KEYS'] = False
+app.config['JSON_AS_ASCII'] = False
+init_json(app)
+app.config['STATIC_ASSETS_BUILD'] = os.getenv('STATIC_ASSETS_BUILD', 'True').lower() == 'true'
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_CPU_BUDGET_MS'] = float(os.getenv('COMPRESS_CPU_BUDGET_MS', 20))
+app.config['RATE_LIMIT_NEW_ID'] = os.getenv('RATE_LIMIT_NEW_ID', '60/60')
+app.config['RATE_LIMIT_CAPTCHA'] = os.getenv('RATE_LIMIT_CAPTCHA', '10/60')
+app.config['RATE_LIMIT_SEARCH'] = os.getenv('RATE_LIMIT_SEARCH', '30/10')
+StaticAssets(app)
+Compress(app)
+app.config['SINGLEFLIGHT'] = os.getenv('SINGLEFLIGHT', 'True').lower() == 'true'
+app.config['SINGLEFLIGHT_WAIT_MS'] = int(os.getenv('SINGLEFLIGHT_WAIT_MS', 2000))
+app.config['SINGLEFLIGHT_LOCK_MS'] = int(os.getenv('SINGLEFLIGHT_LOCK_MS', 5000))
+limiter.init_app(app, lambda: redis_client)
+singleflight.init_app(app, lambda: redis_client)
+init_read_routing(app)
 
 
 @app.route('/')
@@ -28,7 +61,10 @@ def index():
                          app_name=app_name)
 
 @app.route('/api/captcha')
+@limiter.limit('captcha', '10/60', key=by_ip)
 def get_captcha():
+    # Loaded on first use, PIL is heavy and most workers never draw a CAPTCHA
+    from captcha.image import ImageCaptcha
     image = ImageCaptcha(width=280, height=90)
     captcha_text = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     session['captcha_text'] = captcha_text
@@ -47,38 +83,37 @@ def get_captcha():
 def get_records():
     try:
         recent = request.args.get('recent', None)
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', None, type=int)
         user_id = request.cookies.get('creator_id')
-        
-        # Get all records
-        all_keys = redis_client.keys("work:*")
-        records = []
-    
-        for key in all_keys:
-            record = WorkRecord.get_by_id(key.decode().split(':')[1])
-            if record:
-                records.append(record)
-    
-        # Sort by created_at timestamp, newest first
-        records.sort(key=lambda x: x.created_at, reverse=True)
+        if offset < 0 or (limit is not None and limit < 1):
+            return jsonify({'error': 'Invalid offset or limit parameter'}), 400
+        try:
+            fields = parse_fields(request.args.get('fields'), RECORD_FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
         if recent:
             try:
                 limit = int(recent)
                 if limit < 1:
                     return jsonify({'error': 'Recent parameter must be positive'}), 400
-                # Apply limit and return just IDs
-                records = records[:limit]
-                return jsonify([record.id for record in records])
+                # Bounded range read on the recent feed, IDs only
+                return streamed_json_array(WorkRecord.recent_ids(offset, limit))
             except ValueError:
                 return jsonify({'error': 'Invalid recent parameter'}), 400
     
         # If user_id is set, return full records for that user
         if user_id:
-            user_records = [r for r in records if r.creator_id == user_id]
-            return jsonify([record.to_dict() for record in user_records])
+            if fields is not None:
+                # Only the requested fields are read from Redis
+                ids = WorkRecord.user_ids(user_id, offset, limit)
+                return streamed_json_array(WorkRecord.get_fields(ids, fields))
+            records = WorkRecord.get_by_user(user_id, offset, limit)
+            return streamed_json_array(record.to_dict() for record in records)
     
         # Default behavior - return all IDs when no email is set
-        return jsonify([record.id for record in records])
+        return streamed_json_array(WorkRecord.recent_ids(offset, limit))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -142,12 +177,17 @@ def update_record(id):
         print(f"\nDEBUG - PUT Route - Raw request data for {id}:", json.dumps(data, indent=2))
         print(f"DEBUG - PUT Route - Content-Type:", request.headers.get('Content-Type'))
         
-        record = WorkRecord.get_by_id(id)
+        # If-Match pins the version the client edited; without it, at least
+        # nothing may change between this read and the write below
+        expected_version = if_match_version()
+        record = WorkRecord.get_by_id(id, primary=True)
         if not record:
             return jsonify({'error': 'Record not found'}), 404
         
         if record.creator_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
+        if expected_version is None:
+            expected_version = record.version or 0
 
         record.title = data.get('title', record.title)
         record.description = data.get('description', record.description)
@@ -160,16 +200,24 @@ def update_record(id):
         record.active = data.get('active', record.active)
     
     
-        record.save()
-        return jsonify(record.to_dict())
+        record.save(expected_version)
+        response = jsonify(record.to_dict())
+        response.set_etag(str(record.version))
+        return response
+    except VersionConflict as e:
+        response = jsonify({'error': 'Record was changed by someone else, reload it and try again'})
+        response.set_etag(str(e.version))
+        return response, 412
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/new-id')
+@limiter.limit('new_id', '60/60', key=by_creator)
 def get_new_id():
     return jsonify({'id': WorkRecord.generate_id()})
 
 @app.route('/api/search')
+@limiter.limit('search', '30/10', key=by_creator)
 def search():
     query = request.args.get('q', '')
     user_only = request.args.get('user_only', 'false').lower() == 'true'
@@ -177,9 +225,50 @@ def search():
     
     if not user_id and user_only:
         return jsonify({'error': 'No user ID set'}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'), RECORD_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
         
-    results = WorkRecord.search(query, user_only, user_id)
-    return jsonify([record.to_dict() for record in results])
+    # Identical searches running at the same time share one scan, unless the
+    # user just wrote and must not get a scan that started before the write
+    def run_search():
+        return [record.to_dict(fields) for record in WorkRecord.search(query, user_only, user_id)]
+    if router.replicas and router.pinned():
+        results = run_search()
+    else:
+        key = dumps(['search', router.route(), query.lower(), user_id if user_only else None, fields])
+        results = singleflight.do(key, run_search)
+    return streamed_json_array(results)
+
+@app.route('/api/ids/complete')
+def complete_ids():
+    """IDs starting with ?prefix=, with or without separators"""
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit must be between 1 and 100'}), 400
+    return jsonify(WorkRecord.complete_ids(request.args.get('prefix', ''), limit))
+
+@app.route('/api/changes')
+def stream_changes():
+    """Server-Sent Events feed of record changes, resumable via Last-Event-ID"""
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    events = sse_events(redis_client, last_id,
+                        max_duration=float(os.getenv('CHANGES_MAX_DURATION', 30)))
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/stats')
+def get_stats():
+    """Record counts in total, active, per creator and per month, read from
+    counters kept up to date by every save"""
+    return jsonify(WorkRecord.get_stats())
+
+@app.route('/api/rate-limits')
+@local_only
+def get_rate_limit_rejections():
+    """Per-route counts of requests rejected by the rate limiter"""
+    return jsonify(limiter.rejections())
 
 @app.route('/api/set-user-id', methods=['POST'])
 def set_user_id():
@@ -195,6 +284,11 @@ def set_user_id():
 @app.route('/api/records/<id>/details', methods=['GET'])
 def get_record_details(id):
     """Get detailed information for a specific record by ID"""
+    try:
+        fields = parse_fields(request.args.get('fields'), RECORD_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     # Get the pattern from env
     pattern = os.getenv('WORK_ID_PATTERN', '(XX-XX)')
     
@@ -211,10 +305,51 @@ def get_record_details(id):
                 else:
                     id = id + char
     
+    if fields is not None:
+        records = WorkRecord.get_fields([id], fields)
+        if not records:
+            resolved = WorkRecord.resolve_id(id)
+            records = WorkRecord.get_fields([resolved], fields) if resolved else []
+        if not records:
+            return jsonify({'error': 'Record not found'}), 404
+        return jsonify(records[0])
+
     record = WorkRecord.get_by_id(id)
+    if not record:
+        # Fall back to the ID index, which ignores separators and case
+        resolved = WorkRecord.resolve_id(id)
+        record = WorkRecord.get_by_id(resolved) if resolved else None
     if not record:
         return jsonify({'error': 'Record not found'}), 404
-    return jsonify(record.to_dict())
+    response = jsonify(record.to_dict())
+    # Send back as If-Match to update only the version you have seen
+    response.set_etag(str(record.version or 0))
+    return response
+
+@app.cli.command('backfill-indexes')
+def backfill_indexes():
+    """Build the created_at sorted-set indexes for existing records"""
+    count = WorkRecord.backfill_indexes()
+    print(f"Indexed {count} records")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    """Recompute the /api/stats counters from all stored records"""
+    count = WorkRecord.rebuild_stats()
+    print(f"Counted {count} records")
+
+@app.cli.command('storage-report')
+@click.option('--samples', default=200, help='Number of existing records to measure')
+def storage_report(samples):
+    """Compare MEMORY USAGE per record across storage formats"""
+    records = [r.to_dict() for r in WorkRecord.get_many(WorkRecord.recent_ids(0, samples))]
+    if not records:
+        print("No records found to sample")
+        return
+    print(f"{'format':<8} {'compression':<12} {'bytes/record':>13}  encoding")
+    for row in storage.memory_report(redis_client, records):
+        print(f"{row['format']:<8} {row['compression']:<12} "
+              f"{row['bytes_per_record']:>13.1f}  {','.join(row['encodings'])}")
 
 
 if __name__ == '__main__':
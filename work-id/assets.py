@@ -0,0 +1,127 @@
+from typing import Dict, Optional
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import Flask, current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always built
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_FILE = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.html')
+# Preferred order when the client accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write a file so concurrent workers never see a partial asset"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_assets(static_folder: str) -> Dict[str, str]:
+    """Fingerprint every file under static/ into static/dist/ with gzip and brotli variants"""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder]
+        for name in files:
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(filename)
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            target = os.path.join(dist_folder, hashed)
+            manifest[filename] = hashed
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write_atomic(target, data)
+            if ext not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(data, quality=11)
+            for suffix, compressed in variants.items():
+                # Only keep variants that actually save bytes
+                if len(compressed) < len(data):
+                    _write_atomic(target + suffix, compressed)
+    os.makedirs(dist_folder, exist_ok=True)
+    _write_atomic(os.path.join(dist_folder, MANIFEST_FILE),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+def load_manifest(static_folder: str) -> Optional[Dict[str, str]]:
+    """Load a previously built manifest, if any"""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class StaticAssets:
+    """Serve fingerprinted, precompressed static files with immutable caching
+
+    url_for('static', filename='js/main.js') resolves to the hashed copy under
+    static/dist/, so templates keep referencing the original file names.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.manifest: Dict[str, str] = {}
+        self.hashed = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.config.setdefault('STATIC_ASSETS_BUILD', True)
+        if app.config['STATIC_ASSETS_BUILD']:
+            self.manifest = build_assets(app.static_folder)
+        else:
+            self.manifest = load_manifest(app.static_folder) or {}
+        self.hashed = set(self.manifest.values())
+
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions['static'] = self.send_asset
+        app.extensions['static_assets'] = self
+
+        @app.cli.command('build-assets')
+        def build_assets_command():
+            """Fingerprint and precompress the files under static/"""
+            manifest = build_assets(app.static_folder)
+            print(f"Built {len(manifest)} assets into {os.path.join(app.static_folder, DIST_DIR)}")
+
+    def fingerprint_url(self, endpoint: str, values: dict) -> None:
+        """Point url_for('static', ...) at the hashed file name"""
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = f"{DIST_DIR}/{self.manifest[values['filename']]}"
+
+    def send_asset(self, filename: str):
+        """Send a hashed asset, choosing a precompressed variant the client accepts"""
+        prefix = f'{DIST_DIR}/'
+        if not filename.startswith(prefix) or filename[len(prefix):] not in self.hashed:
+            return current_app.send_static_file(filename)
+
+        static_folder = current_app.static_folder
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and \
+                    os.path.exists(os.path.join(static_folder, filename + suffix)):
+                response = send_from_directory(static_folder, filename + suffix,
+                                               mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE,
+                                               download_name=os.path.basename(filename))
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static_folder, filename,
+                                           mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        return response
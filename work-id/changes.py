@@ -0,0 +1,86 @@
+"""Record change feed on a capped Redis Stream, served as Server-Sent Events"""
+
+from typing import Any, Dict, Iterator, Optional
+import time
+from redis.exceptions import ResponseError
+from json_codec import dumps
+
+STREAM_KEY = 'changes'
+# Fields of a record that list views and the edit form need
+FEED_FIELDS = ('title', 'description', 'start_date', 'end_date', 'active',
+               'creator_id', 'created_at', 'version')
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+def compact_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim a record down to the fields clients render"""
+    return {field: record[field] for field in FEED_FIELDS if field in record}
+
+def publish_change(client, op: str, record_id: str, record: Optional[Dict[str, Any]] = None,
+                   maxlen: int = 10000) -> None:
+    """Append an upsert/delete event to the capped change stream"""
+    fields = {'op': op, 'id': record_id}
+    if record is not None:
+        fields['creator_id'] = record.get('creator_id') or ''
+        fields['public'] = '0' if record.get('public') is False else '1'
+        fields['record'] = dumps(compact_record(record))
+    client.xadd(STREAM_KEY, fields, maxlen=maxlen, approximate=True)
+
+def _stream_id(entry_id: str) -> tuple:
+    ms, _, seq = entry_id.partition('-')
+    return int(ms), int(seq or 0)
+
+def _event(entry_id: str, fields: Dict[str, str], user_id: Optional[str]) -> str:
+    """Render one stream entry as an SSE message, hiding other users' private records"""
+    if fields['op'] != 'upsert':
+        data = dumps({'op': fields['op'], 'id': fields['id']})
+    elif fields.get('public') != '0' or (user_id and fields.get('creator_id') == user_id):
+        # The record is stored pre-serialized, splice it in as-is
+        data = '{"op":"upsert","id":%s,"record":%s}' % (dumps(fields['id']), fields['record'])
+    else:
+        # Tell clients to drop it in case it was public before
+        data = dumps({'op': 'remove', 'id': fields['id']})
+    return f"id: {entry_id}\nevent: change\ndata: {data}\n\n"
+
+def _trimmed_up_to(client) -> tuple:
+    """Newest entry ID already trimmed from the stream, (0, 0) if none"""
+    try:
+        info = client.xinfo_stream(STREAM_KEY)
+    except ResponseError:
+        return (0, 0)  # No stream yet
+    # Reported by Redis 7+ (Redis Stack); older servers never trigger a reset
+    deleted = info.get('max-deleted-entry-id')
+    return _stream_id(_text(deleted)) if deleted else (0, 0)
+
+def sse_events(client, last_id: Optional[str], user_id: Optional[str] = None,
+               block_ms: int = 1000, max_duration: float = 30) -> Iterator[str]:
+    """Yield SSE messages for stream entries after last_id
+
+    Connections end after max_duration; EventSource reconnects by itself
+    and resumes from the Last-Event-ID it sends. The generator holds its
+    worker thread until then, so serve it from threaded workers.
+    """
+    yield 'retry: 3000\n\n'
+    if last_id:
+        try:
+            if _stream_id(last_id) < _trimmed_up_to(client):
+                # The client missed trimmed events, it has to reload its view
+                yield 'event: reset\ndata: {}\n\n'
+        except ValueError:
+            last_id = None
+    if not last_id:
+        latest = client.xrevrange(STREAM_KEY, count=1)
+        last_id = _text(latest[0][0]) if latest else '0-0'
+
+    deadline = time.monotonic() + max_duration
+    while time.monotonic() < deadline:
+        entries = client.xread({STREAM_KEY: last_id}, count=100, block=block_ms)
+        if not entries:
+            # Comment line keeps proxies from timing out and detects disconnects
+            yield ': keepalive\n\n'
+            continue
+        for entry_id, fields in entries[0][1]:
+            last_id = _text(entry_id)
+            fields = {_text(k): _text(v) for k, v in fields.items()}
+            yield _event(last_id, fields, user_id)
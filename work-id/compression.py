@@ -0,0 +1,139 @@
+from typing import Iterable, Iterator, Optional
+import gzip
+import time
+import zlib
+from flask import Flask, Response, current_app, request, stream_with_context
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'text/javascript',
+    'text/css', 'text/html', 'text/plain', 'text/csv', 'image/svg+xml'
+}
+
+class _StreamCompressor:
+    """Uniform incremental interface over zlib and brotli"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+            self.compress = self._compressor.process
+            self.finish = self._compressor.finish
+        else:
+            # wbits=31 produces a gzip container
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self.finish = self._compressor.flush
+
+class Compress:
+    """gzip/brotli response compression with a size threshold and CPU budget
+
+    Buffered responses are compressed in one pass; streamed (generator)
+    responses are compressed chunk by chunk so large listings never have to
+    be held in memory twice. When the average compression time per response
+    exceeds COMPRESS_CPU_BUDGET_MS, the fastest levels are used instead.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.avg_cost_ms = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+        app.config.setdefault('COMPRESS_CPU_BUDGET_MS', 20.0)
+        app.after_request(self.after_request)
+        app.extensions['compress'] = self
+
+    def choose_encoding(self) -> Optional[str]:
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def level_for(self, encoding: str) -> int:
+        over_budget = self.avg_cost_ms > current_app.config['COMPRESS_CPU_BUDGET_MS']
+        if encoding == 'br':
+            return 0 if over_budget else current_app.config['COMPRESS_BR_QUALITY']
+        return 1 if over_budget else current_app.config['COMPRESS_GZIP_LEVEL']
+
+    def record_cost(self, seconds: float) -> None:
+        # Exponential moving average, cheap and good enough per worker
+        self.avg_cost_ms = 0.9 * self.avg_cost_ms + 0.1 * seconds * 1000
+
+    def after_request(self, response: Response) -> Response:
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, encoding,
+                                                     self.level_for(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+                return response
+            start = time.perf_counter()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=self.level_for(encoding))
+            else:
+                compressed = gzip.compress(data, compresslevel=self.level_for(encoding))
+            self.record_cost(time.perf_counter() - start)
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def compress_stream(self, chunks: Iterable, encoding: str, level: int) -> Iterator[bytes]:
+        """Compress a generator response incrementally"""
+        compressor = _StreamCompressor(encoding, level)
+        spent = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                start = time.perf_counter()
+                out = compressor.compress(chunk)
+                spent += time.perf_counter() - start
+                if out:
+                    yield out
+            yield compressor.finish()
+        finally:
+            self.record_cost(spent)
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+def streamed_json_array(items: Iterable, chunk_size: int = 100) -> Response:
+    """Stream a JSON array without building the whole body in memory"""
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield '['
+        batch = []
+        first = True
+        for item in items:
+            batch.append(dumps(item))
+            if len(batch) >= chunk_size:
+                yield ('' if first else ',') + ','.join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield ('' if first else ',') + ','.join(batch)
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
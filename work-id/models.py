@@ -1,18 +1,130 @@
-import json
 import random
 import string
 import redis
+from redis.cluster import RedisCluster
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pytz
 from typing import List, Optional
+from json_codec import dumps
+import storage
+from changes import publish_change
+from replicas import ReadRouter, parse_replicas
 
-redis_client = redis.Redis(
-    host=os.getenv('REDIS_HOST', 'localhost'),
-    port=int(os.getenv('REDIS_PORT', 6379)),
-    db=int(os.getenv('REDIS_DB', 0))
+# With REDIS_CLUSTER, REDIS_HOST/REDIS_PORT is any seed node of the cluster
+REDIS_CLUSTER = os.getenv('REDIS_CLUSTER', 'False').lower() == 'true'
+
+def _make_client():
+    host = os.getenv('REDIS_HOST', 'localhost')
+    port = int(os.getenv('REDIS_PORT', 6379))
+    if REDIS_CLUSTER:
+        return RedisCluster(host=host, port=port)
+    return redis.Redis(host=host, port=port, db=int(os.getenv('REDIS_DB', 0)))
+
+redis_client = _make_client()
+
+# Reads are spread over REDIS_REPLICAS ('host:port,...'), writes stay on the primary
+router = ReadRouter(
+    redis_client,
+    [] if REDIS_CLUSTER else [
+        redis.Redis(host=host, port=port, db=int(os.getenv('REDIS_DB', 0)))
+        for host, port in parse_replicas(os.getenv('REDIS_REPLICAS'))
+    ],
+    sticky_seconds=float(os.getenv('REDIS_STICKY_SECONDS', 5)),
+    wait_replicas=int(os.getenv('REDIS_WAIT_REPLICAS', 0)),
+    wait_timeout_ms=int(os.getenv('REDIS_WAIT_TIMEOUT_MS', 100)),
 )
 
+CHANGES_STREAM_MAXLEN = int(os.getenv('CHANGES_STREAM_MAXLEN', 10000))
+
+# Fields a fields= projection may select
+RECORD_FIELDS = tuple(storage.HASH_FIELDS)
+
+# Sorted sets scored by created_at: every record, and per creator
+RECENT_KEY = 'works_by_created'
+# Set once the sorted-set indexes were backfilled from the stored records
+INDEXES_BUILT_KEY = 'works_by_created:built'
+USER_WORKS_KEY = 'user_works_by_created:{}'
+# Plain sets of a user's IDs written by older versions, converted on first use
+LEGACY_USER_WORKS_KEY = 'user_works:{}'
+# 'NORMALIZED:ID' members with score 0, for prefix completion via ZRANGEBYLEX
+ID_INDEX_KEY = 'ids:all'
+# Hash of counters behind /api/stats, see stat_fields()
+STATS_KEY = 'stats:works'
+STATS_FIELDS = ['creator_id', 'active', 'created_at']
+
+def normalize_id(value: str) -> str:
+    """Uppercase letters and digits of an ID, so (AB-CD), ab-cd and ABCD compare equal"""
+    return ''.join(char for char in value.upper() if char.isalnum())
+
+# Whether this process has seen the indexes backfilled
+_indexes_ready = False
+
+def id_member(id: str) -> str:
+    return f"{normalize_id(id)}:{id}"
+
+def work_key(id: str) -> str:
+    """Key of a record; the ID is a hash tag in cluster mode so keys derived
+    from the same ID share a slot"""
+    return f"work:{{{id}}}" if REDIS_CLUSTER else f"work:{id}"
+
+def user_works_key(creator_id: str, template: str = USER_WORKS_KEY) -> str:
+    return template.format(f"{{{creator_id}}}" if REDIS_CLUSTER else creator_id)
+
+def id_from_key(key) -> str:
+    if isinstance(key, bytes):
+        key = key.decode()
+    return key.split(':', 1)[1].strip('{}')
+
+def scan_keys(pattern: str, client=None) -> List[bytes]:
+    """SCAN instead of KEYS; a cluster is scanned on every primary in parallel"""
+    if not REDIS_CLUSTER:
+        return list((client or redis_client).scan_iter(match=pattern, count=500))
+
+    def scan_node(node):
+        return list(redis_client.get_redis_connection(node).scan_iter(match=pattern, count=500))
+
+    nodes = redis_client.get_primaries()
+    with ThreadPoolExecutor(max_workers=max(len(nodes), 1)) as pool:
+        return [key for keys in pool.map(scan_node, nodes) for key in keys]
+
+def _as_utc(value) -> datetime:
+    """Parse an ISO-8601 string, or take a datetime, as an aware UTC datetime"""
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if not dt.tzinfo:
+        dt = pytz.UTC.localize(dt)
+    return dt.astimezone(pytz.UTC)
+
+def stat_fields(data: Optional[dict]) -> List[str]:
+    """The counters a record adds 1 to: total, active, creator:<id> and
+    month:<YYYY-MM> of creation"""
+    if not data:
+        return []
+    names = ['total']
+    if data.get('active'):
+        names.append('active')
+    if data.get('creator_id'):
+        names.append(f"creator:{data['creator_id']}")
+    if data.get('created_at'):
+        names.append(f"month:{_as_utc(data['created_at']):%Y-%m}")
+    return names
+
+def stats_delta(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Counter increments for a record going from before to after (None: absent)"""
+    delta = {}
+    for name in stat_fields(before):
+        delta[name] = delta.get(name, 0) - 1
+    for name in stat_fields(after):
+        delta[name] = delta.get(name, 0) + 1
+    return {name: value for name, value in delta.items() if value}
+
+class VersionConflict(Exception):
+    """The record changed since the version the client last read"""
+    def __init__(self, version: int):
+        super().__init__(f"Record is at version {version}")
+        self.version = version
+
 class WorkRecord:
     def __init__(self, **kwargs):
         """Initialize a work record with validation"""
@@ -23,7 +135,7 @@ class WorkRecord:
         # List of known fields and extract them
         known_fields = {
             'id', 'title', 'description', 'start_date', 'end_date',
-            'active', 'creator_id', 'created_at'
+            'active', 'creator_id', 'created_at', 'version'
         }
         
         # Extract known fields from kwargs
@@ -59,47 +171,23 @@ class WorkRecord:
                 result += char
         return result
 
-    def to_dict(self) -> dict:
-        data = self._data.copy()
-        
-        # Convert datetime objects to ISO format strings
-        if data.get('start_date'):
-            data['start_date'] = data['start_date'].isoformat()
-        if data.get('end_date'):
-            data['end_date'] = data['end_date'].isoformat()
-        if data.get('created_at'):
-            data['created_at'] = data['created_at'].isoformat()
-            
-        return {k: v for k, v in data.items() if v is not None}
+    def to_dict(self, fields: Optional[List[str]] = None) -> dict:
+        # Datetimes are kept as objects, the JSON codec emits them as ISO-8601
+        return {k: v for k, v in self._data.items()
+                if v is not None and (fields is None or k == 'id' or k in fields)}
 
     @classmethod
     def from_dict(cls, data: dict) -> 'WorkRecord':
         if not data:
             return None
             
-        # Handle created_at with default value
-        if data.get('created_at'):
-            created_at = datetime.fromisoformat(data['created_at'])
-            if not created_at.tzinfo:
-                created_at = pytz.UTC.localize(created_at)
-        else:
-            created_at = datetime.now(pytz.UTC)
-            
-        # Process dates
-        start_date = None
-        if data.get('start_date'):
-            start_date = datetime.fromisoformat(data['start_date'])
-            if not start_date.tzinfo:
-                start_date = pytz.UTC.localize(start_date)
-            start_date = start_date.astimezone(pytz.UTC)
-            
-        end_date = None
-        if data.get('end_date'):
-            end_date = datetime.fromisoformat(data['end_date'])
-            if not end_date.tzinfo:
-                end_date = pytz.UTC.localize(end_date)
-            end_date = end_date.astimezone(pytz.UTC)
-            
+ 
+        # Handle created_at with default value; dates arrive as ISO strings
+        # from the json layout and as datetimes from the hash layout
+        created_at = _as_utc(data['created_at']) if data.get('created_at') else datetime.now(pytz.UTC)
+        start_date = _as_utc(data['start_date']) if data.get('start_date') else None
+        end_date = _as_utc(data['end_date']) if data.get('end_date') else None
+
                 
         # Create record with all fields
         record = cls(
@@ -111,6 +199,7 @@ class WorkRecord:
             active=data.get('active', True),
             creator_id=data.get('creator_id'),
             created_at=created_at,
+            version=data.get('version'),
         )
         return record
 
@@ -131,28 +220,66 @@ class WorkRecord:
         if not self.creator_id:
             raise ValueError("Creator ID is required")
 
-    def save(self):
+    def save(self, expected_version: Optional[int] = None):
+        """Store the record; with expected_version only if the stored copy is
+        still at that version, raising VersionConflict otherwise"""
         try:
             print("\nDEBUG - WorkRecord save - Current _data contents:", self._data)
                     
             self.validate()
-            record_data = self.to_dict()
+            key = work_key(self.id)
             
-            print("\nDEBUG - WorkRecord save - Data being saved:")
-            print(f"Key: work:{self.id}")
-            print(f"Data: {json.dumps(record_data, indent=2)}")
-            print(f"User works key: user_works:{self.creator_id}")
-            
-            # Try to save and verify the data
-            redis_client.set(f"work:{self.id}", json.dumps(record_data))
-            redis_client.sadd(f"user_works:{self.creator_id}", self.id)
+            # Save the record together with its recent-feed and per-user index
+            # entries and the stats counters; these keys span slots in a cluster,
+            # so there it is a plain pipeline
+            # Before the first write, so the new index never lacks older records
+            self.convert_user_works(self.creator_id)
+            while True:
+                with redis_client.pipeline(transaction=not REDIS_CLUSTER) as pipe:
+                    # WATCH fails the EXEC if the record changes after it was read
+                    # for the version check and the stats delta; cluster pipelines
+                    # cannot WATCH, there both are best effort
+                    if not REDIS_CLUSTER:
+                        pipe.watch(key)
+                    before = storage.read_record(redis_client, key, STATS_FIELDS + ['version'])
+                    # Count from the stored copy read under the WATCH, not the
+                    # one this record was loaded from
+                    current_version = (before or {}).get('version') or 0
+                    if expected_version is not None and current_version != expected_version:
+                        raise VersionConflict(current_version)
+                    self.version = current_version + 1
+                    if not REDIS_CLUSTER:
+                        pipe.multi()
+                    record_data = self.to_dict()
+                    
+                    print("\nDEBUG - WorkRecord save - Data being saved:")
+                    print(f"Key: {key}")
+                    print(f"Data: {dumps(record_data, indent=True)}")
+                    print(f"User works key: {user_works_key(self.creator_id)}")
+                    
+                    score = self.created_at.timestamp()
+                    storage.write_record(pipe, key, record_data)
+                    pipe.zadd(RECENT_KEY, {self.id: score})
+                    pipe.zadd(user_works_key(self.creator_id), {self.id: score})
+                    pipe.zadd(ID_INDEX_KEY, {id_member(self.id): 0})
+                    for name, delta in stats_delta(before, record_data).items():
+                        pipe.hincrby(STATS_KEY, name, delta)
+                    publish_change(pipe, 'upsert', self.id, record_data, maxlen=CHANGES_STREAM_MAXLEN)
+                    try:
+                        pipe.execute()
+                        break
+                    except redis.WatchError:
+                        if expected_version is not None:
+                            raise VersionConflict(self._stored_version(key))
+                        # Someone else wrote the record meanwhile, count against their copy
+            router.wrote()
             
             # Verify the save
-            saved_data = redis_client.get(f"work:{self.id}")
+            saved_data = storage.read_record(redis_client, work_key(self.id))
             if saved_data:
                 if self.id == '(ML-3A)':
                     print("\nDEBUG - Verification - Data in Redis:")
-                    print(json.loads(saved_data))
+                    print(saved_data)
             else:
                 if self.id == '(ML-3A)':
                     print("\nDEBUG - ERROR: Data not found in Redis after save!")
@@ -166,22 +293,189 @@ class WorkRecord:
                 print(f"\nDEBUG - Unexpected Error: {str(e)}")
             raise
 
+    @staticmethod
+    def _stored_version(key: str) -> int:
+        """Version of the stored record on the primary, 0 for records from
+        before versioning"""
+        data = storage.read_record(redis_client, key, ['version'])
+        return (data or {}).get('version') or 0
+
     @classmethod
-    def get_by_id(cls, id: str) -> Optional['WorkRecord']:
-        data = redis_client.get(f"work:{id}")
+    def get_by_id(cls, id: str, primary: bool = False) -> Optional['WorkRecord']:
+        """Load a record; primary=True skips the replicas for read-modify-write"""
+        key = work_key(id)
+        if primary:
+            data = storage.read_record(redis_client, key)
+        else:
+            data = router.read(lambda client: storage.read_record(client, key))
         if not data:
             return None
-        return cls.from_dict(json.loads(data))
+        data['id'] = id
+        return cls.from_dict(data)
 
     @classmethod
-    def get_by_user(cls, user_id: str) -> List['WorkRecord']:
-        work_ids = redis_client.smembers(f"user_works:{user_id}")
+    def get_many(cls, ids: List[str]) -> List['WorkRecord']:
+        """Fetch several records in one round trip, keeping their order"""
+        keys = [work_key(id) for id in ids]
+        values = router.read(lambda client: storage.read_records(client, keys))
         records = []
-        for work_id in work_ids:
-            record = cls.get_by_id(work_id.decode())
-            if record:
-                records.append(record)
-        return sorted(records, key=lambda x: x.created_at, reverse=True)
+        for id, data in zip(ids, values):
+            if data:
+                data['id'] = id
+                records.append(cls.from_dict(data))
+        return records
+
+    @classmethod
+    def get_fields(cls, ids: List[str], fields: List[str]) -> List[dict]:
+        """Only the given fields of several records, as dicts in ID order"""
+        keys = [work_key(id) for id in ids]
+        values = router.read(lambda client: storage.read_records(client, keys, fields))
+        return [{'id': id, **data} for id, data in zip(ids, values) if data is not None]
+
+    @staticmethod
+    def _range(key: str, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """Newest-first slice of a created_at index"""
+        end = -1 if limit is None else offset + limit - 1
+        ids = router.read(lambda client: client.zrevrange(key, offset, end))
+        return [id.decode() for id in ids]
+
+    @classmethod
+    def recent_ids(cls, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """IDs of all records, newest first"""
+        cls.ensure_indexes()
+        return cls._range(RECENT_KEY, offset, limit)
+
+    @classmethod
+    def user_ids(cls, user_id: str, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """IDs of a user's records, newest first"""
+        cls.convert_user_works(user_id)
+        return cls._range(user_works_key(user_id), offset, limit)
+
+    @classmethod
+    def convert_user_works(cls, creator_id: str) -> int:
+        """Move a user's IDs from the plain set of older versions into the
+        sorted index; returns how many were moved. Costs one EXISTS once done"""
+        legacy = user_works_key(creator_id, LEGACY_USER_WORKS_KEY)
+        if not creator_id or not redis_client.exists(legacy):
+            return 0
+        ids = sorted(id.decode() for id in redis_client.smembers(legacy))
+        scores = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            values = storage.read_records(redis_client, [work_key(id) for id in batch], ['created_at'])
+            for id, data in zip(batch, values):
+                if data:
+                    scores[id] = cls.from_dict(data).created_at.timestamp()
+        pipe = redis_client.pipeline(transaction=not REDIS_CLUSTER)
+        if scores:
+            pipe.zadd(user_works_key(creator_id), scores)
+        pipe.delete(legacy)
+        pipe.execute()
+        return len(scores)
+
+    @classmethod
+    def get_by_user(cls, user_id: str, offset: int = 0,
+                    limit: Optional[int] = None) -> List['WorkRecord']:
+        """A user's records, newest first"""
+        return cls.get_many(cls.user_ids(user_id, offset, limit))
+
+    @classmethod
+    def ensure_indexes(cls) -> Optional[int]:
+        """Backfill the sorted-set indexes once, on the first listing after an
+        upgrade; only the worker that claims INDEXES_BUILT_KEY does it, the
+        others list what is indexed so far. Returns the records indexed, None
+        if they were already built"""
+        global _indexes_ready
+        if _indexes_ready:
+            return None
+        if not redis_client.set(INDEXES_BUILT_KEY, int(datetime.now(pytz.UTC).timestamp()), nx=True):
+            _indexes_ready = True
+            return None
+        try:
+            count = cls.backfill_indexes()
+        except Exception:
+            # Let the next listing try again
+            redis_client.delete(INDEXES_BUILT_KEY)
+            raise
+        _indexes_ready = True
+        return count
+
+    @classmethod
+    def backfill_indexes(cls) -> int:
+        """Rebuild the sorted-set indexes (including ID completion) from the stored records
+
+        The plain user_works sets written by older versions are removed once
+        the sorted indexes are complete, so listings never come up empty.
+        """
+        count = 0
+        for key in scan_keys('work:*'):
+            record = cls.get_by_id(id_from_key(key))
+            if not record:
+                continue
+            score = record.created_at.timestamp()
+            pipe = redis_client.pipeline(transaction=not REDIS_CLUSTER)
+            pipe.zadd(RECENT_KEY, {record.id: score})
+            pipe.zadd(ID_INDEX_KEY, {id_member(record.id): 0})
+            if record.creator_id:
+                pipe.zadd(user_works_key(record.creator_id), {record.id: score})
+            pipe.execute()
+            count += 1
+        for key in scan_keys(LEGACY_USER_WORKS_KEY.format('*')):
+            if redis_client.type(key) == b'set':
+                redis_client.delete(key)
+        redis_client.set(INDEXES_BUILT_KEY, int(datetime.now(pytz.UTC).timestamp()))
+        return count
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Record counts in total, active, per creator and per month of creation"""
+        counts = router.read(lambda client: client.hgetall(STATS_KEY))
+        stats = {'total': 0, 'active': 0, 'by_creator': {}, 'by_month': {}}
+        for name, count in sorted((k.decode(), int(v)) for k, v in counts.items()):
+            if count <= 0:
+                continue
+            kind, _, rest = name.partition(':')
+            if kind in ('creator', 'month'):
+                stats[f'by_{kind}'][rest] = count
+            elif kind in stats:
+                stats[kind] = count
+        return stats
+
+    @staticmethod
+    def rebuild_stats() -> int:
+        """Recompute the stats counters from a SCAN of all records"""
+        counts = {}
+        keys = scan_keys('work:*')
+        for start in range(0, len(keys), 500):
+            for data in storage.read_records(redis_client, keys[start:start + 500], STATS_FIELDS):
+                for name in stat_fields(data):
+                    counts[name] = counts.get(name, 0) + 1
+        pipe = redis_client.pipeline(transaction=not REDIS_CLUSTER)
+        pipe.delete(STATS_KEY)
+        if counts:
+            pipe.hset(STATS_KEY, mapping=counts)
+        pipe.execute()
+        return counts.get('total', 0)
+
+    @staticmethod
+    def complete_ids(prefix: str, limit: int = 10) -> List[str]:
+        """IDs starting with prefix, with or without separators, in order"""
+        prefix = normalize_id(prefix)
+        if not prefix:
+            return []
+        members = router.read(lambda client: client.zrangebylex(
+            ID_INDEX_KEY, f"[{prefix}", f"[{prefix}\xff", start=0, num=limit))
+        return [member.decode().split(':', 1)[1] for member in members]
+
+    @classmethod
+    def resolve_id(cls, value: str) -> Optional[str]:
+        """The stored ID whose normalized form equals value, if any"""
+        prefix = normalize_id(value)
+        if not prefix:
+            return None
+        members = router.read(lambda client: client.zrangebylex(
+            ID_INDEX_KEY, f"[{prefix}:", f"[{prefix}:\xff", start=0, num=1))
+        return members[0].decode().split(':', 1)[1] if members else None
 
     @classmethod
     def search(cls, query: str, user_only: bool = False, user_id: str = None) -> List['WorkRecord']:
@@ -191,13 +485,10 @@ class WorkRecord:
         # Treat asterisk as empty string
         query = '' if query == '*' else query
             
-        all_keys = redis_client.keys("work:*")
+        all_ids = [id_from_key(key) for key in router.read(lambda client: scan_keys("work:*", client))]
         results = []
         
-        for key in all_keys:
-            record = cls.get_by_id(key.decode().split(':')[1])
-            if not record:
-                continue
+        for record in cls.get_many(all_ids):
                 
             if user_only and record.creator_id != user_id:
                 continue
@@ -0,0 +1,94 @@
+"""Server-side sessions in Redis, shared by every worker and host
+
+The browser only holds a signed random session ID; the session data lives
+under session:<id> with a TTL of PERMANENT_SESSION_LIFETIME. Redis is only
+written when the session actually changed, and only read when the request
+carries a session cookie, so plain page and API requests cost at most one
+GET. While Redis is unreachable requests get an empty session instead of
+an error.
+"""
+
+from typing import Optional
+import secrets
+from flask import Flask, Request, Response
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from redis.exceptions import RedisError
+from werkzeug.datastructures import CallbackDict
+
+class RedisSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid: Optional[str] = None, new: bool = False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+class RedisSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in Redis"""
+    serializer = session_json_serializer
+
+    def __init__(self, client, prefix: str = 'session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _signer(self, app: Flask) -> Signer:
+        # A shared SECRET_KEY lets any worker verify cookies issued by another
+        return Signer(app.secret_key, salt='redis-session')
+
+    def open_session(self, app: Flask, request: Request) -> Optional[RedisSession]:
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                try:
+                    data = self.client.get(self.prefix + sid)
+                except RedisError as e:
+                    app.logger.warning(f"Could not load session, starting an empty one: {e}")
+                    data = None
+                if data is not None:
+                    return RedisSession(self.serializer.loads(data), sid=sid)
+        return RedisSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app: Flask, session: RedisSession, response: Response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        try:
+            if not session:
+                if session.modified and not session.new:
+                    self.client.delete(self.prefix + session.sid)
+                    response.delete_cookie(name, domain=domain, path=path)
+                return
+
+            ttl = app.permanent_session_lifetime
+            if session.modified:
+                self.client.set(self.prefix + session.sid, self.serializer.dumps(dict(session)), ex=ttl)
+            elif self.should_set_cookie(app, session):
+                # Sliding expiry for permanent sessions, without rewriting the data
+                self.client.expire(self.prefix + session.sid, ttl)
+            else:
+                return
+        except RedisError as e:
+            # Keep the response; the session change is lost, not the request
+            app.logger.warning(f"Could not save session: {e}")
+            return
+
+        response.vary.add('Cookie')
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
@@ -1,3 +1,9 @@
+// Records currently shown in the list, patched by the change feed
+let currentRecords = [];
+let changesSource = null;
+// Version of the record in the form, sent as If-Match when saving
+let currentVersion = null;
+
 // Function declarations first
 function setUserId() {
     const userId = document.getElementById('userIdInput').value;
@@ -42,30 +48,7 @@ function loadRecords() {
             }
             return response.json();
         })
-        .then(records => {
-            const recordsList = document.getElementById('recordsList');
-            if (!Array.isArray(records) || records.length === 0) {
-                recordsList.innerHTML = '<div class="list-group-item text-center text-muted py-4">' +
-                    '<i class="bi bi-inbox fs-2 mb-2"></i><br>' +
-                    'No records found</div>';
-                return;
-            }
-            recordsList.innerHTML = records.map(record => {
-                return `
-                    <div class="list-group-item record-item py-2" onclick="loadRecord('${record.id}')">
-                        <div class="d-flex justify-content-between align-items-center">
-                            <div class="text-truncate me-2">
-                                <strong>${record.id}</strong> - ${record.title || 'Untitled'}
-                                ${record.active ? '<span class="badge bg-success">Active</span>' : 
-                                               '<span class="badge bg-danger">Inactive</span>'}
-                            </div>
-                            <small class="text-muted">${new Date(record.created_at).toLocaleDateString()}</small>
-                        </div>
-                        <div class="small text-muted text-truncate mt-1">${record.description || 'No description'}</div>
-                    </div>
-                `;
-            }).join('');
-        })
+        .then(records => updateRecordsList(records))
         .catch(error => {
             console.error('Error loading records:', error);
             const recordsList = document.getElementById('recordsList');
@@ -104,6 +87,7 @@ function loadRecord(id) {
             if (!record) return;
             
             console.log('Loading record:', record); // Debug log
+            currentVersion = record.version ?? null;
             
             // Update form fields with strict null checks
             document.getElementById('recordId').value = record.id || '';
@@ -159,6 +143,7 @@ function loadRecord(id) {
 }
 
 function resetForm() {
+    currentVersion = null;
     fetch('/api/new-id')
         .then(response => {
             if (!response.ok) {
@@ -432,11 +417,14 @@ function submitFormData(formData) {
     console.log('URL:', url);
     console.log('All form data:', formData);
     
+    const headers = { 'Content-Type': 'application/json' };
+    if (method === 'PUT' && currentVersion !== null) {
+        headers['If-Match'] = `"${currentVersion}"`;
+    }
+
     fetch(url, {
         method: method,
-        headers: {
-            'Content-Type': 'application/json',
-        },
+        headers: headers,
         body: JSON.stringify(formData),
     })
     .then(response => {
@@ -448,8 +436,12 @@ function submitFormData(formData) {
         }
         return response.json();
     })
-    .then(() => {
-        loadRecords();
+    .then(saved => {
+        if (method === 'PUT') currentVersion = saved.version ?? null;
+        // The change feed patches the list; only refetch without it
+        if (!changesSource || changesSource.readyState !== EventSource.OPEN) {
+            loadRecords();
+        }
         if (method === 'POST') {
             resetForm();
         }
@@ -486,6 +478,7 @@ function submitFormData(formData) {
 }
 function updateRecordsList(records) {
     const recordsList = document.getElementById('recordsList');
+    currentRecords = Array.isArray(records) ? records : [];
     if (!Array.isArray(records) || records.length === 0) {
         recordsList.innerHTML = '<div class="list-group-item text-center text-muted py-4">' +
             '<i class="bi bi-inbox fs-2 mb-2"></i><br>' +
@@ -508,3 +501,36 @@ function updateRecordsList(records) {
         `;
     }).join('');
 }
+
+// Live updates: apply record changes from the server instead of re-fetching
+function applyChange(change) {
+    const index = currentRecords.findIndex(record => record.id === change.id);
+    if (change.op === 'upsert') {
+        const record = Object.assign({}, change.record, { id: change.id });
+        if (index >= 0) {
+            currentRecords[index] = record;
+        } else {
+            // New records only show up in the unfiltered listing
+            const userId = document.getElementById('userIdInput').value;
+            const userOnly = document.getElementById('userOnlyCheck').checked;
+            if (document.getElementById('searchInput').value.trim()) return;
+            if (userOnly && record.creator_id !== userId) return;
+            currentRecords.unshift(record);
+        }
+    } else if (index >= 0) {
+        currentRecords.splice(index, 1);
+    } else {
+        return;
+    }
+    updateRecordsList(currentRecords);
+}
+
+function subscribeChanges() {
+    if (!window.EventSource) return;
+    changesSource = new EventSource('/api/changes');
+    changesSource.addEventListener('change', event => applyChange(JSON.parse(event.data)));
+    // Events were trimmed from the feed before we saw them, reload instead
+    changesSource.addEventListener('reset', () => searchRecords());
+}
+
+document.addEventListener('DOMContentLoaded', subscribeChanges);
@@ -0,0 +1,204 @@
+"""Storage encodings for work records in Redis
+
+Two layouts are supported, selected with STORAGE_FORMAT:
+
+json   the original layout, one JSON string per record with ISO-8601 dates
+hash   a compact hash with one-letter field names and epoch dates, stored as
+       seconds with the microseconds after a dot when there are any.
+       Small hashes stay in Redis' listpack encoding as long as every value
+       is below hash-max-listpack-value (64 bytes by default), so raise that
+       setting if most descriptions are longer.
+
+STORAGE_COMPRESSION (none, zlib or zstd) compresses descriptions of at
+least STORAGE_COMPRESS_MIN bytes (1024 by default, as in test4) in the hash
+layout, and whole values of that size in the json layout. Reads detect the layout and compression of each key, so
+existing records stay readable after switching formats.
+"""
+
+from typing import Any, Dict, List, Optional
+import os
+import zlib
+from datetime import datetime, timedelta
+import pytz
+import redis
+from json_codec import dumps, loads
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT', 'json')
+STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'none')
+STORAGE_COMPRESS_MIN = int(os.getenv('STORAGE_COMPRESS_MIN', 1024))
+
+# Compressed values start with a NUL byte that never begins JSON or text
+ZLIB_MARKER = b'\x00z'
+ZSTD_MARKER = b'\x00s'
+
+HASH_FIELDS = {
+    'title': 't', 'description': 'd', 'start_date': 's', 'end_date': 'e',
+    'active': 'a', 'creator_id': 'c', 'created_at': 'ca', 'version': 'v'
+}
+DATE_FIELDS = ('start_date', 'end_date', 'created_at')
+FIELD_NAMES = {short: name for name, short in HASH_FIELDS.items()}
+
+def compress(data: bytes, method: str = None) -> bytes:
+    method = method or STORAGE_COMPRESSION
+    if method == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("STORAGE_COMPRESSION=zstd requires the zstandard package")
+        return ZSTD_MARKER + zstandard.ZstdCompressor(level=9).compress(data)
+    if method == 'zlib':
+        return ZLIB_MARKER + zlib.compress(data, 9)
+    return data
+
+def decompress(data: bytes) -> bytes:
+    if data.startswith(ZLIB_MARKER):
+        return zlib.decompress(data[len(ZLIB_MARKER):])
+    if data.startswith(ZSTD_MARKER):
+        return zstandard.ZstdDecompressor().decompress(data[len(ZSTD_MARKER):])
+    return data
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+def encode_date(value: datetime) -> str:
+    """Epoch seconds of value, exact to the microsecond (a float is not)"""
+    delta = value.astimezone(pytz.UTC) - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    return f'{seconds}.{delta.microseconds:06d}' if delta.microseconds else str(seconds)
+
+def decode_date(value: bytes) -> datetime:
+    """Inverse of encode_date, also reads the integer seconds written before"""
+    seconds, _, micros = value.decode().partition('.')
+    return EPOCH + timedelta(seconds=int(seconds), microseconds=int(micros.ljust(6, '0')))
+
+def encode_hash(data: Dict[str, Any], compression: str = None) -> Dict[str, Any]:
+    """Map a record dict to the compact hash layout"""
+    mapping = {}
+    for name, value in data.items():
+        if name not in HASH_FIELDS or value is None:
+            continue
+        if name in DATE_FIELDS and isinstance(value, datetime):
+            value = encode_date(value)
+        elif name == 'active':
+            value = int(bool(value))
+        elif name == 'description':
+            value = value.encode()
+            if len(value) >= STORAGE_COMPRESS_MIN:
+                value = compress(value, compression)
+        mapping[HASH_FIELDS[name]] = value
+    return mapping
+
+def decode_hash(mapping: Dict[bytes, bytes]) -> Dict[str, Any]:
+    """Turn a compact hash back into a record dict with aware datetimes"""
+    data = {}
+    for short, value in mapping.items():
+        name = FIELD_NAMES.get(short.decode())
+        if name is None:
+            continue
+        if name in DATE_FIELDS:
+            data[name] = decode_date(value)
+        elif name == 'active':
+            data[name] = value == b'1'
+        elif name == 'version':
+            data[name] = int(value)
+        else:
+            data[name] = decompress(value).decode()
+    return data
+
+def encode_json(data: Dict[str, Any], compression: str = None) -> bytes:
+    value = dumps(data).encode()
+    if len(value) >= STORAGE_COMPRESS_MIN:
+        value = compress(value, compression)
+    return value
+
+def decode_json(value: bytes) -> Dict[str, Any]:
+    return loads(decompress(value))
+
+def write_record(pipe, key: str, data: Dict[str, Any], storage_format: str = None,
+                 compression: str = None) -> None:
+    """Queue the commands that store a record in the configured layout"""
+    if (storage_format or STORAGE_FORMAT) == 'hash':
+        pipe.delete(key)
+        pipe.hset(key, mapping=encode_hash(data, compression))
+    else:
+        pipe.set(key, encode_json(data, compression))
+
+def _select(data: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Keep only the projected fields of a decoded record"""
+    return data if fields is None else {k: v for k, v in data.items() if k in fields}
+
+def read_records(client: redis.Redis, keys: List[str],
+                 fields: Optional[List[str]] = None) -> List[Optional[Dict[str, Any]]]:
+    """Fetch several records in one round trip, whatever layout each one uses
+
+    With fields, hash records are read with HMGET so only those fields are
+    transferred; JSON strings can only be read whole and are trimmed after
+    decoding.
+    """
+    if not keys:
+        return []
+    # created_at is always set, so it tells an existing record from a missing key
+    shorts = None
+    if fields is not None:
+        shorts = list(dict.fromkeys([HASH_FIELDS[field] for field in fields] + ['ca']))
+
+    def read_hash(target, key):
+        return target.hmget(key, shorts) if shorts else target.hgetall(key)
+
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        if STORAGE_FORMAT == 'hash':
+            read_hash(pipe, key)
+        else:
+            pipe.get(key)
+    results = pipe.execute(raise_on_error=False)
+
+    records = []
+    for key, value in zip(keys, results):
+        if isinstance(value, redis.ResponseError):
+            # WRONGTYPE: the key was written in the other layout
+            value = client.get(key) if STORAGE_FORMAT == 'hash' else read_hash(client, key)
+        if isinstance(value, list):
+            value = {short.encode(): v for short, v in zip(shorts, value) if v is not None}
+        if not value:
+            records.append(None)
+        elif isinstance(value, dict):
+            records.append(_select(decode_hash(value), fields))
+        else:
+            records.append(_select(decode_json(value), fields))
+    return records
+
+def read_record(client: redis.Redis, key: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    return read_records(client, [key], fields)[0]
+
+def memory_report(client: redis.Redis, samples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Measure MEMORY USAGE per record for every layout/compression combination"""
+    combinations = [('json', 'none'), ('json', 'zlib'), ('hash', 'none'), ('hash', 'zlib')]
+    if zstandard is not None:
+        combinations += [('json', 'zstd'), ('hash', 'zstd')]
+
+    report = []
+    for storage_format, compression in combinations:
+        # One hash tag per combination keeps the batch DEL in a single cluster slot
+        keys = [f'storage-report:{{{storage_format}:{compression}}}:{i}' for i in range(len(samples))]
+        pipe = client.pipeline(transaction=False)
+        for key, data in zip(keys, samples):
+            write_record(pipe, key, data, storage_format, compression)
+        pipe.execute()
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key, samples=0)
+            sizes = [size or 0 for size in pipe.execute()]
+            encodings = {client.object('encoding', key) for key in keys[:10]}
+        finally:
+            client.delete(*keys)
+        report.append({
+            'format': storage_format,
+            'compression': compression,
+            'bytes_per_record': sum(sizes) / len(sizes) if sizes else 0,
+            'encodings': sorted(e.decode() if isinstance(e, bytes) else str(e) for e in encodings)
+        })
+    return report
@@ -0,0 +1,27 @@
+import fakeredis
+import models
+from models import WorkRecord
+
+def test_save_counts_from_stored_version(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(models, 'redis_client', client)
+    monkeypatch.setattr(models.router, 'primary', client)
+    WorkRecord(id='(AB-CD)', title='first', creator_id='a@b.edu').save()
+    first = WorkRecord.get_by_id('(AB-CD)', primary=True)
+    second = WorkRecord.get_by_id('(AB-CD)', primary=True)
+    first.save()
+    # second was loaded at version 1, but the stored copy is at 2 by now
+    second.save()
+    assert WorkRecord.get_by_id('(AB-CD)', primary=True).version == 3
+
+def test_first_listing_backfills_indexes(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(models, 'redis_client', client)
+    monkeypatch.setattr(models.router, 'primary', client)
+    monkeypatch.setattr(models, '_indexes_ready', False)
+    for id in ('(AB-C1)', '(AB-C2)'):
+        WorkRecord(id=id, title='t', creator_id='a@b.edu').save()
+    # As left by a version without the sorted-set indexes
+    client.delete(models.RECENT_KEY)
+    assert WorkRecord.recent_ids() == ['(AB-C2)', '(AB-C1)']
+    assert client.exists(models.INDEXES_BUILT_KEY)
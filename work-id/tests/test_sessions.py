@@ -0,0 +1,35 @@
+import fakeredis
+from flask import Flask, session
+from sessions import RedisSessionInterface
+
+def make_app(client):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = RedisSessionInterface(client)
+
+    @app.route('/login')
+    def login():
+        session['user'] = 'a@b.edu'
+        return 'ok'
+
+    @app.route('/whoami')
+    def whoami():
+        return session.get('user', '')
+
+    return app
+
+def test_no_cookie_no_lookup():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    # Would raise on any Redis command
+    assert make_app(fakeredis.FakeRedis(server=server)).test_client().get('/whoami').text == ''
+
+def test_outage_gives_empty_session():
+    server = fakeredis.FakeServer()
+    client = make_app(fakeredis.FakeRedis(server=server)).test_client()
+    client.get('/login')
+    assert client.get('/whoami').text == 'a@b.edu'
+    server.connected = False
+    response = client.get('/whoami')
+    assert response.status_code == 200 and response.text == ''
+    assert client.get('/login').status_code == 200
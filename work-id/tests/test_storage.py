@@ -0,0 +1,25 @@
+from datetime import datetime
+import fakeredis
+import pytest
+import pytz
+import storage
+from models import WorkRecord
+
+RECORD = {
+    'title': 'Title', 'description': 'Description', 'active': True, 'creator_id': 'creator',
+    'start_date': datetime(2024, 1, 31, 23, 59, 59, 999999, tzinfo=pytz.UTC),
+    'end_date': datetime(1969, 12, 31, 23, 59, 59, 500000, tzinfo=pytz.UTC),
+    'created_at': datetime(2024, 6, 1, 12, 0, tzinfo=pytz.UTC), 'version': 3,
+}
+
+@pytest.mark.parametrize('storage_format', ['json', 'hash'])
+def test_round_trip(monkeypatch, storage_format):
+    monkeypatch.setattr(storage, 'STORAGE_FORMAT', storage_format)
+    client = fakeredis.FakeRedis()
+    storage.write_record(client, 'work:1', RECORD, storage_format)
+    # The json layout returns ISO strings, WorkRecord parses both layouts
+    record = WorkRecord.from_dict(storage.read_record(client, 'work:1'))
+    assert {name: getattr(record, name) for name in RECORD} == RECORD
+
+def test_hash_reads_integer_seconds():
+    assert storage.decode_date(b'1700000000') == datetime(2023, 11, 14, 22, 13, 20, tzinfo=pytz.UTC)
@@ -0,0 +1,32 @@
+from typing import Iterable, List, Optional
+from functools import wraps
+from flask import request, jsonify
+
+def local_only(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not request.remote_addr.startswith(('127.', '::1')):
+            return jsonify({'error': 'Access denied'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+def parse_fields(value: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Parse a comma separated fields= projection; None selects everything.
+    The record ID is always returned, so it need not be listed"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip() and field.strip() != 'id']
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+def if_match_version() -> Optional[int]:
+    """The record version a client sent in If-Match; None for a missing
+    header or If-Match: *, which accept any version"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = request.if_match.as_set()
+    if len(tags) != 1 or not next(iter(tags)).isdigit():
+        raise ValueError("If-Match must be a single record version ETag")
+    return int(next(iter(tags)))